@@ -0,0 +1,48 @@
+import logging
+from functools import lru_cache
+import arabic_reshaper
+from bidi.algorithm import get_display
+from config import ARABIC_CACHE_SIZE
+
+logger = logging.getLogger(__name__)
+
+def _shape(text):
+    """التشكيل الفعلي بدون تخزين مؤقت."""
+    # 1. تشكيل الحروف (ربطها)
+    reshaped_text = arabic_reshaper.reshape(text)
+    # 2. عكس اتجاه النص (RTL)
+    return get_display(reshaped_text)
+
+# النصوص نفسها (العناوين، رؤوس الجداول، أسماء الطلاب) تتكرر آلاف المرات لكل مادة
+_cached_shape = lru_cache(maxsize=ARABIC_CACHE_SIZE)(_shape)
+
+# دالة تصحيح النص العربي
+def fix_arabic(text):
+    """تصحح النص العربي ليعرض بشكل صحيح (تشكيل وعرض من اليمين لليسار)."""
+    if not text:
+        return ""
+    return _cached_shape(str(text))
+
+def fix_arabic_many(texts):
+    """نسخة دفعية من fix_arabic: تعيد قائمة بالنصوص المصححة بنفس الترتيب."""
+    shape = _cached_shape
+    return [shape(str(text)) if text else "" for text in texts]
+
+def cache_stats():
+    """إحصائيات ذاكرة التخزين المؤقت (الإصابات، الإخفاقات، الحجم، نسبة الإصابة)."""
+    info = _cached_shape.cache_info()
+    total = info.hits + info.misses
+    return {
+        'hits': info.hits,
+        'misses': info.misses,
+        'size': info.currsize,
+        'maxsize': info.maxsize,
+        'hit_rate': info.hits / total if total else 0.0,
+    }
+
+# --- نصوص ثابتة تُصحح مرة واحدة عند الاستيراد ---
+HIST_TITLE = fix_arabic('توزيع العلامات (مخطط الأعمدة)')
+HIST_XLABEL = fix_arabic('الدرجة')
+HIST_YLABEL = fix_arabic('عدد الطلاب')
+REPORT_TITLE = fix_arabic('تقرير إحصائيات العلامات')
+NOT_AVAILABLE = fix_arabic('غير متوفر')
@@ -0,0 +1,71 @@
+"""
+مقارنة عدد عمليات البحث في الثانية: فتح اتصال وإغلاقه في كل استدعاء (السلوك القديم)
+مقابل الاتصال الدائم مع WAL والاستعلامات المحضرة في database.py.
+
+الاستخدام:
+    python benchmarks/bench_database.py --students 5000 --lookups 20000
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database  # noqa: E402
+
+
+def legacy_get_student_info_by_user_id(db_name, user_id):
+    """نسخة من التنفيذ القديم: اتصال جديد لكل استدعاء."""
+    conn = sqlite3.connect(db_name)
+    cursor = conn.cursor()
+    cursor.execute("SELECT student_id, student_name, university, college FROM students WHERE user_id = ?", (user_id,))
+    info = cursor.fetchone()
+    conn.close()
+    return info
+
+
+def populate(count):
+    conn = database.get_connection()
+    with conn:
+        conn.executemany(
+            "INSERT INTO students (user_id, student_id, student_name, university, college) VALUES (?, ?, ?, ?, ?)",
+            [(1000000 + i, f"{10000 + i:05d}", f"طالب {i}", "جامعة حلب", "كلية الطب") for i in range(count)]
+        )
+
+
+def measure(label, lookup, user_ids):
+    start = time.perf_counter()
+    for user_id in user_ids:
+        lookup(user_id)
+    elapsed = time.perf_counter() - start
+    rate = len(user_ids) / elapsed
+    print(f"{label:<28} {rate:>12,.0f} lookups/s")
+    return rate
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--students', type=int, default=5000)
+    parser.add_argument('--lookups', type=int, default=20000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database.DB_NAME = os.path.join(tmp, 'bench.db')
+        database.init_db()
+        populate(args.students)
+
+        rng = random.Random(0)
+        user_ids = [1000000 + rng.randrange(args.students) for _ in range(args.lookups)]
+
+        legacy = measure("open/close per call:", lambda uid: legacy_get_student_info_by_user_id(database.DB_NAME, uid), user_ids)
+        pooled = measure("persistent connection:", database.get_student_info_by_user_id, user_ids)
+        print(f"speedup: {pooled / legacy:.1f}x")
+        database.close_connection()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,225 @@
+"""
+قياس المسار الكامل بدون شبكة: ملف علامات اصطناعي يُرسل إلى handle_document من المشرف،
+ثم قائمة الانتظار و run_grades_job (التحليل والحسابات في العمليات العاملة، إرسال النتائج،
+تقرير المشرف) مع بوت وهمي (fake_telegram.FakeBot) بزمن شبكة محاكى.
+
+لكل حجم (100 و 1000 و 10000 طالب افتراضياً) عملية جديدة بمجلد وقاعدة بيانات مؤقتة، ويُطبع:
+- الزمن الكلي من استلام الملف حتى إرسال تقرير المشرف، والإنتاجية (طالب/ثانية ورسالة/ثانية).
+- زمن وصول نتيجة كل طالب من لحظة استلام الملف: p50 و p90 و p99 والأقصى.
+- زمن كل مرحلة (من metrics) وأقصى ذاكرة (Peak RSS) لعملية البوت وللعمليات العاملة.
+
+حد الإرسال الافتراضي مرتفع (--rate) حتى يقيس المعالجة وليس حد تليجرام؛
+استخدم --rate 25 لمحاكاة الإرسال الفعلي.
+
+--courses N: عدة ملفات علامات (لنفس الطلاب) تصل معاً، وتُعالج كدفعة واحدة (وضع الدفعات)
+أو كل ملف وحده مع --no-batch. زمن الوصول لكل طالب حتى آخر رسالة تصله.
+
+الاستخدام:
+    python benchmarks/bench_end_to_end.py --sizes 100 1000 10000
+    python benchmarks/bench_end_to_end.py --sizes 1000 --rate 25 --latency 0.1
+    python benchmarks/bench_end_to_end.py --sizes 1000 --courses 10 [--no-batch]
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import warnings
+from functools import partial
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, ROOT)
+sys.path.insert(0, BENCH_DIR)
+
+ADMIN_ID = 999
+
+
+def peak_rss_mib(pid='self'):
+    """أقصى ذاكرة مستخدمة للعملية (VmHWM من /proc، أو getrusage لعملية البوت على الأنظمة الأخرى)."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    if pid == 'self':
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return None
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q / 100 * (len(values) - 1))))]
+
+
+async def run_size(args):
+    """عملية واحدة لحجم واحد: تعيد قاموس النتائج (يُطبع كـ JSON للعملية الأم)."""
+    import bot
+    import workers
+    from delivery import DeliveryScheduler
+    from job_queue import JobQueue
+    from metrics import recent_jobs
+    from fake_telegram import FakeBot, document_update, text_update, fake_context
+    from synthetic_pdf import synthetic_students, write_grades_pdf
+
+    students = synthetic_students(args.size, args.seed)
+    # نفس الطلاب في كل المواد بعلامات مختلفة
+    pdf_paths = [write_grades_pdf(os.path.abspath(f"course{course}.pdf"), synthetic_students(args.size, args.seed + course),
+                                  orientation='L' if args.landscape else 'P')
+                 for course in range(args.courses)]
+
+    # handle_document يقبل الملفات من STATISTICS_OUTPUT_CHANNEL_ID فقط (يُقارن كنص)
+    bot.STATISTICS_OUTPUT_CHANNEL_ID = str(ADMIN_ID)
+    bot.DeliveryScheduler = partial(DeliveryScheduler, rate=args.rate, concurrency=args.concurrency)
+    bot.init_db()
+
+    # الطلاب المسجلون يمرون بنفس معالج التسجيل
+    registered = int(args.size * args.registered)
+    replies = []
+    for i, (student_id, _, _) in enumerate(students[:registered]):
+        await bot.handle_registration(text_update(100000 + i, student_id, replies), None)
+
+    # العمليات العاملة جاهزة مسبقاً (كما بعد التحميل المسبق في post_init)
+    workers.start_workers()
+    await asyncio.gather(*(workers.run_in_pool(workers._ping) for _ in range(workers.WORKER_PROCESSES)))
+
+    fake_bot = FakeBot(latency=args.latency)
+    done = asyncio.Event()
+    finished = []
+
+    async def handler(job):
+        try:
+            await bot.run_grades_job(fake_bot, job)
+        finally:
+            finished.append(job['job_id'])
+            if len(finished) == args.courses:
+                done.set()
+
+    async def batch_handler(jobs):
+        try:
+            await bot.run_grades_batch(fake_bot, jobs)
+        finally:
+            finished.extend(job['job_id'] for job in jobs)
+            if len(finished) == args.courses:
+                done.set()
+
+    bot.grades_queue = JobQueue(handler, poll_interval=0.1, batch_handler=batch_handler,
+                                batch_window=None if args.no_batch else args.batch_window)
+    bot.grades_queue.start()
+
+    started = time.perf_counter()
+    for course, pdf_path in enumerate(pdf_paths):
+        await bot.handle_document(document_update(ADMIN_ID, pdf_path, f"course{course}.pdf", message_id=course + 1),
+                                  fake_context(fake_bot))
+    await done.wait()
+    elapsed = time.perf_counter() - started
+
+    worker_rss = [peak_rss_mib(pid) for pid in workers.get_executor()._processes]
+    await bot.grades_queue.stop()
+    workers.shutdown_workers()
+
+    # زمن وصول آخر نتيجة لكل طالب
+    last_result = {}
+    for sent_at, chat_id, kind in fake_bot.sent:
+        if kind in ('photo', 'album'):
+            last_result[chat_id] = sent_at - started
+    latencies = list(last_result.values())
+    sent = sum(1 for _, _, kind in fake_bot.sent if kind in ('photo', 'album'))
+    jobs = recent_jobs
+    stages = {}
+    for stats in jobs:
+        for name, seconds in stats.stages.items():
+            stages[name] = stages.get(name, 0.0) + seconds
+    return {
+        'size': args.size,
+        'courses': args.courses,
+        'registered': registered,
+        'state': ",".join(sorted({stats.state for stats in jobs})),
+        'sent': sent,
+        'students_served': len(last_result),
+        'elapsed': elapsed,
+        'latency': {name: percentile(latencies, q) if latencies else None
+                    for name, q in (('p50', 50), ('p90', 90), ('p99', 99), ('max', 100))},
+        'stages': stages,
+        'uploads': fake_bot.uploads,
+        'rss_bot': peak_rss_mib(),
+        'rss_workers': max((rss for rss in worker_rss if rss is not None), default=None),
+    }
+
+
+def single(args):
+    warnings.simplefilter('ignore')
+    logging.disable(logging.WARNING)
+    with tempfile.TemporaryDirectory() as tmp:
+        # مسارات الخطوط وقاعدة البيانات ومجلد قائمة الانتظار نسبية
+        os.symlink(os.path.join(ROOT, 'fonts'), os.path.join(tmp, 'fonts'))
+        os.chdir(tmp)
+        result = asyncio.run(run_size(args))
+        os.chdir(ROOT)
+    print(json.dumps(result))
+
+
+def run_child(args, size):
+    command = [sys.executable, os.path.abspath(__file__), '--single', str(size),
+               '--registered', str(args.registered), '--rate', str(args.rate),
+               '--concurrency', str(args.concurrency), '--latency', str(args.latency), '--seed', str(args.seed),
+               '--courses', str(args.courses), '--batch-window', str(args.batch_window)]
+    if args.landscape:
+        command.append('--landscape')
+    if args.no_batch:
+        command.append('--no-batch')
+    result = subprocess.run(command, capture_output=True, text=True)
+    if result.returncode != 0:
+        print(result.stderr, file=sys.stderr)
+        raise SystemExit(f"size {size} failed")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def report(result):
+    ms = {name: value * 1000 if value is not None else float('nan') for name, value in result['latency'].items()}
+    stages = " | ".join(f"{name} {seconds:.2f}" for name, seconds in result['stages'].items())
+    print(f"{result['size']:>6} students x {result['courses']} courses ({result['registered']} registered, {result['state']}): "
+          f"{result['elapsed']:7.2f} s | {result['size'] * result['courses'] / result['elapsed']:8.1f} results/s | "
+          f"{result['sent'] / result['elapsed']:6.1f} msg/s | "
+          f"{result['sent'] / max(result['students_served'], 1):4.1f} msgs/student")
+    print(f"       result latency ms: p50 {ms['p50']:8.0f} | p90 {ms['p90']:8.0f} | p99 {ms['p99']:8.0f} | max {ms['max']:8.0f}")
+    print(f"       peak RSS MiB: bot {result['rss_bot']:6.1f} | worker {result['rss_workers'] or float('nan'):6.1f} | "
+          f"uploads {result['uploads']}")
+    print(f"       stages s: {stages}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 1000, 10000])
+    parser.add_argument('--registered', type=float, default=0.8, help='نسبة الطلاب المسجلين في البوت')
+    parser.add_argument('--rate', type=float, default=1000, help='حد الإرسال (رسالة/ثانية)')
+    parser.add_argument('--concurrency', type=int, default=64)
+    parser.add_argument('--latency', type=float, default=0.05, help='زمن الشبكة المحاكى لكل رسالة (ثانية)')
+    parser.add_argument('--landscape', action='store_true', help='ملف العلامات بصفحات عرضية')
+    parser.add_argument('--courses', type=int, default=1, help='عدد ملفات العلامات التي تصل معاً')
+    parser.add_argument('--batch-window', type=float, default=2.0, help='نافذة تجميع الدفعة (ثانية)')
+    parser.add_argument('--no-batch', action='store_true', help='كل ملف وحده (بدون وضع الدفعات)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--single', type=int, default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.single is not None:
+        args.size = args.single
+        single(args)
+        return
+    print(f"rate {args.rate:g} msg/s | concurrency {args.concurrency} | latency {args.latency * 1000:.0f} ms | "
+          f"registered {args.registered:.0%} | "
+          f"{'no batch' if args.no_batch else f'batch window {args.batch_window:g} s'}")
+    for size in args.sizes:
+        report(run_child(args, size))
+
+
+if __name__ == '__main__':
+    main()
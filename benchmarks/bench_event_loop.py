@@ -0,0 +1,137 @@
+"""
+يتحقق من أن البوت يبقى قادراً على الرد على رسائل التسجيل أثناء معالجة ملف علامات كبير.
+يقيس زمن رد handle_registration على رسائل متتالية بينما تتم معالجة العلامات:
+- داخل حلقة الأحداث مباشرة (السلوك القديم).
+- في عملية عاملة عبر workers.run_in_pool.
+
+يُستخدم كاختبار: يعيد رمز خروج 1 إذا تأخر أي رد في مسار العمليات العاملة أكثر من --max-ms،
+أو إذا لم يُرد على كل رسائل التسجيل (المسار القديم يُطبع للمقارنة فقط).
+
+الاستخدام:
+    python benchmarks/bench_event_loop.py --rows 20000 --max-ms 500
+"""
+import argparse
+import asyncio
+import logging
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+import warnings
+from types import SimpleNamespace
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+class FakeMessage:
+    def __init__(self, text, sent_at, latencies):
+        self.text = text
+        self.sent_at = sent_at
+        self.latencies = latencies
+
+    async def reply_text(self, text, **kwargs):
+        self.latencies.append(time.perf_counter() - self.sent_at)
+
+
+def fake_update(user_id, text, sent_at, latencies):
+    return SimpleNamespace(
+        effective_user=SimpleNamespace(id=user_id),
+        message=FakeMessage(text, sent_at, latencies),
+    )
+
+
+def synthetic_grades(rows, seed=0):
+    rng = random.Random(seed)
+    return [{'student_id': f"{10000 + i}", 'student_name': f"طالب {i}",
+             'grade': round(rng.uniform(0, 100), 1)} for i in range(rows)]
+
+
+async def registrations(bot, latencies, state, start_user):
+    """
+    طالب جديد يرسل رقمه الجامعي كل 50 مللي ثانية حتى انتهاء المعالجة.
+    زمن الرد يُحسب من لحظة الإرسال المفترضة، فإذا كانت حلقة الأحداث متوقفة يظهر التأخير كاملاً.
+    """
+    started = time.perf_counter()
+    sent = 0
+    while True:
+        sent_at = started + sent * 0.05
+        # كل الرسائل التي "أُرسلت" قبل انتهاء المعالجة يجب أن يُرد عليها
+        if state['end'] is not None and sent_at > state['end']:
+            return
+        user_id = start_user + sent
+        state['sent'] += 1
+        await bot.handle_registration(fake_update(user_id, f"{50000 + user_id % 40000:05d}", sent_at, latencies), None)
+        sent += 1
+        await asyncio.sleep(max(0.0, started + sent * 0.05 - time.perf_counter()))
+
+
+async def scenario(label, bot, process, rows, start_user):
+    latencies = []
+    state = {'end': None, 'sent': 0}
+    task = asyncio.create_task(registrations(bot, latencies, state, start_user))
+    await asyncio.sleep(0.2)
+    started = time.perf_counter()
+    await process(rows)
+    state['end'] = time.perf_counter()
+    elapsed = state['end'] - started
+    await task
+    print(f"{label:<10} processing {elapsed:6.2f} s | replies {len(latencies):4d} | "
+          f"median {statistics.median(latencies) * 1000:8.1f} ms | max {max(latencies) * 1000:8.1f} ms")
+    return state['sent'], latencies
+
+
+async def run(args):
+    import bot
+    import workers
+    from data_processor import process_grades
+
+    bot.init_db()
+    rows = synthetic_grades(args.rows)
+
+    async def inline(rows):
+        process_grades(rows, course_name='bench')
+
+    async def pooled(rows):
+        await workers.run_in_pool(process_grades, rows, course_name='bench')
+
+    workers.start_workers()
+    await workers.run_in_pool(workers._ping)  # انتظار تشغيل العمليات العاملة
+    if not args.skip_inline:
+        await scenario("inline:", bot, inline, rows, 1)
+    sent, latencies = await scenario("pool:", bot, pooled, rows, 100000)
+    workers.shutdown_workers()
+
+    failed = False
+    if len(latencies) != sent:
+        print(f"FAILED: {sent - len(latencies)} of {sent} registrations got no reply")
+        failed = True
+    if max(latencies) * 1000 > args.max_ms:
+        print(f"FAILED: slowest reply during processing {max(latencies) * 1000:.1f} ms > {args.max_ms:.1f} ms")
+        failed = True
+    print("RESULT:", "FAILED" if failed else "OK")
+    return not failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=20000)
+    parser.add_argument('--max-ms', type=float, default=500, help='أقصى زمن مسموح لأي رد أثناء المعالجة')
+    parser.add_argument('--skip-inline', action='store_true', help='بدون المسار القديم (للتشغيل السريع)')
+    args = parser.parse_args()
+    warnings.simplefilter('ignore')
+    logging.disable(logging.INFO)
+
+    # قاعدة بيانات مؤقتة: العمليات العاملة تستخدم DB_NAME النسبي من مجلد العمل الحالي
+    with tempfile.TemporaryDirectory() as tmp:
+        os.symlink(os.path.join(ROOT, 'fonts'), os.path.join(tmp, 'fonts'))
+        os.chdir(tmp)
+        ok = asyncio.run(run(args))
+        os.chdir(ROOT)
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
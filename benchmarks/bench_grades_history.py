@@ -0,0 +1,86 @@
+"""
+قياس سجل العلامات (courses و grade_records) على أكثر من 100 ألف علامة:
+- زمن الحفظ الجماعي لكل مادة (معاملة واحدة).
+- زمن الاستعلامات: كل علامات طالب، إحصائيات مادة، علامات مادة كاملة.
+- خطة التنفيذ (EXPLAIN QUERY PLAN) للتأكد من استخدام الفهارس.
+
+الاستخدام:
+    python benchmarks/bench_grades_history.py --courses 70 --students 2000
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database  # noqa: E402
+
+
+def synthetic_course(students, rng):
+    """علامات مادة: (الرقم الجامعي، العلامة، النسبة المئوية، الترتيب) لعينة من الطلاب."""
+    ids = rng.sample(range(students), k=int(students * rng.uniform(0.7, 1.0)))
+    grades = sorted(((f"{10000 + i}", round(min(max(rng.gauss(65, 15), 0), 100), 1)) for i in ids),
+                    key=lambda item: item[1], reverse=True)
+    count = len(grades)
+    return [(student_id, grade, round((count - rank) / count * 100, 2), rank + 1)
+            for rank, (student_id, grade) in enumerate(grades)]
+
+
+def timed(func, *args, repeat=200):
+    """الوسيط (median) بالمللي ثانية."""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--courses', type=int, default=70)
+    parser.add_argument('--students', type=int, default=2000)
+    args = parser.parse_args()
+    rng = random.Random(0)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database.DB_NAME = os.path.join(tmp, 'bench.db')
+        database.init_db()
+
+        insert_times = []
+        total = 0
+        for index in range(args.courses):
+            records = synthetic_course(args.students, rng)
+            start = time.perf_counter()
+            database.save_course_grades(f"مادة {index}", records, 65.0, 15.0)
+            insert_times.append(time.perf_counter() - start)
+            total += len(records)
+
+        print(f"records:                 {total:,} in {args.courses} courses")
+        print(f"bulk insert per course:  {statistics.median(insert_times) * 1000:8.1f} ms median "
+              f"({total / sum(insert_times):,.0f} rows/s)")
+
+        student_id = f"{10000 + args.students // 2}"
+        course_name = f"مادة {args.courses // 2}"
+        print(f"grades of a student:     {timed(database.get_student_grades, student_id):8.3f} ms "
+              f"({len(database.get_student_grades(student_id))} courses)")
+        print(f"course stats:            {timed(database.get_course_stats, course_name):8.3f} ms")
+        print(f"full course grades:      {timed(database.get_course_grades, course_name, repeat=20):8.3f} ms "
+              f"({len(database.get_course_grades(course_name))} rows)")
+
+        conn = database.get_connection()
+        for label, query, params in [
+            ("student plan:", "SELECT grade FROM grade_records WHERE student_id = ?", (student_id,)),
+            ("stats plan:", "SELECT MAX(grade) FROM grade_records WHERE course_id = ?", (1,)),
+        ]:
+            plan = " / ".join(row[-1] for row in conn.execute(f"EXPLAIN QUERY PLAN {query}", params))
+            print(f"{label:<24} {plan}")
+        database.close_connection()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""
+مقارنة زمن توليد صور التوزيع: المسار القديم (رسم كامل لكل طالب)
+مقابل CourseHistogram (رسم الخلفية مرة واحدة ثم تمييز عمود الطالب).
+
+الاستخدام:
+    python benchmarks/bench_histogram.py --students 1500 --sample 20
+"""
+import argparse
+import io
+import os
+import sys
+import time
+
+import matplotlib.pyplot as plt
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from arabic_text import fix_arabic, HIST_TITLE, HIST_XLABEL, HIST_YLABEL  # noqa: E402
+from histogram_engine import CourseHistogram  # noqa: E402
+
+
+def create_grades_histogram(grades, student_grade):
+    """المسار القديم (كان في data_processor): مخطط كامل بـ pyplot لكل طالب."""
+    fig, ax = plt.subplots(figsize=(8, 5))
+    counts, bins, patches = ax.hist(grades, bins=100, range=(0, 100), edgecolor='black', alpha=0.7, color='skyblue')
+    # تلوين العمود الخاص بدرجة الطالب
+    for patch, bin_start, bin_end in zip(patches, bins[:-1], bins[1:]):
+        if bin_start <= student_grade < bin_end:
+            patch.set_facecolor('red')
+            break
+    ax.axvline(student_grade, color='red', linestyle='--', linewidth=2, label=fix_arabic(f'درجتك: {student_grade}'))
+    ax.set_title(HIST_TITLE, fontsize=14)
+    ax.set_xlabel(HIST_XLABEL, fontsize=12)
+    ax.set_ylabel(HIST_YLABEL, fontsize=12)
+    ax.legend(loc='upper left')
+    ax.grid(axis='y', alpha=0.5)
+    buf = io.BytesIO()
+    plt.savefig(buf, format='png', bbox_inches='tight')
+    plt.close(fig)
+    buf.seek(0)
+    return buf
+
+
+def synthetic_grades(count, seed=0):
+    """علامات عشوائية قريبة من توزيع حقيقي (متوسط 65، انحراف 15)."""
+    rng = np.random.default_rng(seed)
+    return np.clip(rng.normal(65, 15, count), 0, 100).round(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--students', type=int, default=1500)
+    parser.add_argument('--sample', type=int, default=20,
+                        help='عدد الطلاب الذين يُقاس عليهم المسار القديم (ثم يُقدّر الزمن الكلي)')
+    args = parser.parse_args()
+
+    grades = synthetic_grades(args.students)
+    sample = grades[:args.sample]
+
+    start = time.perf_counter()
+    for grade in sample:
+        create_grades_histogram(grades, grade)
+    legacy_per_student = (time.perf_counter() - start) / len(sample)
+
+    start = time.perf_counter()
+    histogram = CourseHistogram(grades)
+    base_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for grade in grades:
+        histogram.render(grade)
+    engine_per_student = (time.perf_counter() - start) / len(grades)
+
+    legacy_total = legacy_per_student * len(grades)
+    engine_total = base_time + engine_per_student * len(grades)
+    print(f"students:              {len(grades)}")
+    print(f"legacy per student:    {legacy_per_student * 1000:8.1f} ms")
+    print(f"engine base figure:    {base_time * 1000:8.1f} ms (once per course)")
+    print(f"engine per student:    {engine_per_student * 1000:8.1f} ms")
+    print(f"legacy total (est.):   {legacy_total:8.1f} s")
+    print(f"engine total:          {engine_total:8.1f} s")
+    print(f"speedup:               {legacy_total / engine_total:8.1f}x")
+
+
+if __name__ == '__main__':
+    main()
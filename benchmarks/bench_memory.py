@@ -0,0 +1,80 @@
+"""
+قياس ذروة الذاكرة (tracemalloc) لنتائج الطلاب في مادة واحدة:
+قبل: قاموس لكل طالب يحتوي على نسخة كاملة من علامات المادة ('all_grades').
+بعد: CourseResult مشترك (مصفوفة NumPy واحدة) و StudentResult صغير بـ __slots__.
+
+الاستخدام:
+    python benchmarks/bench_memory.py --students 3000
+"""
+import argparse
+import gc
+import os
+import random
+import sys
+import tracemalloc
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from course_results import CourseResult  # noqa: E402
+
+
+def synthetic_rows(count, seed=0):
+    rng = random.Random(seed)
+    grades = [round(min(max(rng.gauss(65, 15), 0), 100), 1) for _ in range(count)]
+    return [(1000000 + i, f"{10000 + i}", f"طالب رقم {i}", grade, 50.0, i + 1)
+            for i, grade in enumerate(grades)], np.array(grades)
+
+
+def legacy_results(rows, grades):
+    """نسخة من البنية القديمة: كل طالب يحمل df['grade'].tolist() كاملة."""
+    mean = grades.mean()
+    results = {}
+    for user_id, student_id, name, grade, percentile, rank in rows:
+        results[user_id] = {
+            'student_id': student_id,
+            'student_name': name,
+            'display_name': name,
+            'grade': grade,
+            'percentile': percentile,
+            'mean': mean,
+            'std_dev': 0.0,
+            'all_grades': grades.tolist(),
+        }
+    return results
+
+
+def shared_results(rows, grades):
+    course = CourseResult('bench', grades, grades.mean(), 0.0)
+    for user_id, student_id, name, grade, percentile, rank in rows:
+        course.add_student(user_id, student_id, name, grade, percentile, rank)
+    return course
+
+
+def peak_of(build, *args):
+    gc.collect()
+    tracemalloc.start()
+    result = build(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--students', type=int, default=3000)
+    args = parser.parse_args()
+
+    rows, grades = synthetic_rows(args.students)
+    before = peak_of(legacy_results, rows, grades)
+    after = peak_of(shared_results, rows, grades)
+    print(f"students:        {args.students}")
+    print(f"peak before:     {before / 1024 / 1024:10.2f} MiB")
+    print(f"peak after:      {after / 1024 / 1024:10.2f} MiB")
+    print(f"reduction:       {before / after:10.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""
+مقارنة تحليل ملف علامات كبير متعدد الصفحات:
+- المسار القديم: extract_tables لكل صفحة.
+- تحليل تسلسلي (workers=1) بالتخطيط المكتشف، مرة باكتشاف التخطيط ومرة من ذاكرة التخطيطات.
+- تقسيم الصفحات على عدة عمليات في parse_grades_pdf.
+- اختيار عمود العلامة عندما يحتوي الرأس عدة أعمدة علامات (العملية، النظرية، النهائية).
+
+الاستخدام:
+    python benchmarks/bench_parser.py --students 5000
+"""
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+
+import pdfplumber
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pdf_parser  # noqa: E402
+from pdf_parser import count_pages, parse_grades_pdf, plan_page_ranges  # noqa: E402
+from synthetic_pdf import COLUMNS, synthetic_students, write_grades_pdf  # noqa: E402
+
+# رؤوس بعدة أعمدة علامات: (الوصف، عناوين الأعمدة العملي والمجموع والنظري في COLUMNS)
+GRADE_HEADER_CASES = [
+    ("final after partials:", ('العلامة العملية', 'العلامة النهائية', 'العلامة النظرية')),
+    ("exact among partials:", ('العلامة العملية', 'العلامة', 'العلامة النظرية')),
+]
+
+
+def legacy_parse(pdf_path):
+    """extract_tables العامة على كل صفحة (بدون تخطيط)."""
+    rows = []
+    with pdfplumber.open(pdf_path) as pdf:
+        for page in pdf.pages:
+            for table in page.extract_tables():
+                pdf_parser._parse_table(table, rows)
+            page.close()
+    return [row._asdict() for row in rows]
+
+
+def measure_legacy(pdf_path):
+    start = time.perf_counter()
+    rows = legacy_parse(pdf_path)
+    elapsed = time.perf_counter() - start
+    print(f"{'legacy tables:':<22} {elapsed:8.2f} s  ({len(rows)} rows)")
+    return elapsed, rows
+
+
+def measure(label, pdf_path, workers):
+    start = time.perf_counter()
+    rows = parse_grades_pdf(pdf_path, workers=workers)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<22} {elapsed:8.2f} s  ({len(rows)} rows)")
+    return elapsed, rows
+
+
+def check_grade_headers(tmp, students):
+    """كل حالة في GRADE_HEADER_CASES يجب أن تعطي علامة المجموع (وليس العملي أو النظري)."""
+    expected = [(student_id, grade) for student_id, _, grade in students]
+    for label, (practical, total, theory) in GRADE_HEADER_CASES:
+        titles = [title for title, _ in COLUMNS]
+        titles[1:4] = [practical, total, theory]
+        pdf_parser._layouts.clear()
+        pdf_path = write_grades_pdf(os.path.join(tmp, 'headers.pdf'), students, titles=titles)
+        rows = parse_grades_pdf(pdf_path, workers=1)
+        ok = [(row['student_id'], row['grade']) for row in rows] == expected
+        print(f"{label:<22} {'ok' if ok else 'WRONG COLUMN'}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--students', type=int, default=5000)
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args()
+    logging.getLogger('fpdf').setLevel(logging.ERROR)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        pdf_path = write_grades_pdf(os.path.join(tmp, 'grades.pdf'), synthetic_students(args.students))
+        pages = count_pages(pdf_path)
+        ranges = plan_page_ranges(pages, args.workers)
+        print(f"pages:                 {pages}")
+        legacy, rows_legacy = measure_legacy(pdf_path)
+        pdf_parser._layouts.clear()
+        measure("sequential (detect):", pdf_path, 1)
+        sequential, rows_seq = measure("sequential (cached):", pdf_path, 1)
+        parallel, rows_par = measure(f"parallel ({len(ranges)} workers):", pdf_path, args.workers)
+        print(f"same rows as legacy:   {rows_seq == rows_legacy}")
+        print(f"same rows and order:   {rows_seq == rows_par}")
+        print(f"layout speedup:        {legacy / sequential:8.1f}x")
+        print(f"parallel speedup:      {sequential / parallel:8.1f}x")
+        check_grade_headers(tmp, synthetic_students(200))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+"""
+اختبار حمل لرسائل الطلاب بعد إعلان النتائج: دفعة من /start والأرقام الجامعية تصل معاً
+وتُعالج بالترتيب (كما في python-telegram-bot بدون concurrent_updates) عبر start و handle_registration.
+أغلب المرسلين مسجلون مسبقاً، والباقون طلاب جدد يسجلون برقمهم الجامعي.
+
+يقارن البحث عن المرسل في قاعدة البيانات (السلوك القديم) مع ذاكرة الطلاب المسجلين
+(warm_student_cache)، ويطبع: عدد الرسائل في الثانية، زمن انتظار آخر رسالة في الدفعة،
+زمن المعالج p50/p99، وعدد عمليات البحث التي قرأت من قاعدة البيانات.
+
+الاستخدام:
+    python benchmarks/bench_registration_burst.py --students 10000 --burst 20000
+"""
+import argparse
+import asyncio
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+import bot  # noqa: E402
+import database  # noqa: E402
+from fake_telegram import FakeBot, fake_context, text_update  # noqa: E402
+from metrics import metrics  # noqa: E402
+
+
+def populate(count):
+    conn = database.get_connection()
+    with conn:
+        conn.executemany(
+            "INSERT INTO students (user_id, student_id, student_name, university, college) VALUES (?, ?, ?, ?, ?)",
+            [(1000000 + i, f"{10000 + i:05d}", f"طالب {i}", bot.UNIVERSITY_NAME, bot.COLLEGE_NAME) for i in range(count)]
+        )
+
+
+def synthetic_burst(students, burst, new_ratio, seed=0):
+    """(user_id, النص): /start أو الرقم الجامعي، من طلاب مسجلين أو جدد (أرقام جامعية غير مستخدمة)."""
+    rng = random.Random(seed)
+    new_users = [2000000 + i for i in range(int(burst * new_ratio) or 1)]
+    updates = []
+    for _ in range(burst):
+        if rng.random() < new_ratio:
+            user_id = rng.choice(new_users)
+            student_id = f"{50000 + user_id % 40000:05d}"
+        else:
+            index = rng.randrange(students)
+            user_id, student_id = 1000000 + index, f"{10000 + index:05d}"
+        updates.append((user_id, '/start' if rng.random() < 0.5 else student_id))
+    return updates
+
+
+async def run_burst(label, updates):
+    context = fake_context(FakeBot(latency=0))
+    reads_before = metrics.count('cache', cache='students', result='miss')
+    durations = []
+    started = time.perf_counter()
+    for user_id, text in updates:
+        handler_started = time.perf_counter()
+        update = text_update(user_id, text)
+        if text == '/start':
+            await bot.start(update, context)
+        else:
+            await bot.handle_registration(update, context)
+        durations.append(time.perf_counter() - handler_started)
+    elapsed = time.perf_counter() - started
+    durations.sort()
+    reads = metrics.count('cache', cache='students', result='miss') - reads_before
+    print(f"{label:<18} {len(updates) / elapsed:10,.0f} msg/s | last reply after {elapsed * 1000:8.0f} ms | "
+          f"handler p50 {durations[len(durations) // 2] * 1e6:6.0f} us | "
+          f"p99 {durations[int(len(durations) * 0.99)] * 1e6:6.0f} us | db lookups {reads:g}")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--students', type=int, default=10000)
+    parser.add_argument('--burst', type=int, default=20000)
+    parser.add_argument('--new-ratio', type=float, default=0.2, help='نسبة الرسائل من طلاب غير مسجلين')
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    updates = synthetic_burst(args.students, args.burst, args.new_ratio)
+    print(f"registered {args.students} | burst {args.burst} messages ({args.new_ratio:.0%} from new students)")
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for label, warm in (("database lookups:", False), ("student cache:", True)):
+            # قاعدة بيانات جديدة لكل تشغيل: نفس الطلاب ونفس التسجيلات الجديدة
+            database.DB_NAME = os.path.join(tmp, f"{'warm' if warm else 'cold'}.db")
+            database._students = database.StudentCache()
+            database.init_db()
+            populate(args.students)
+            if warm:
+                started = time.perf_counter()
+                database.warm_student_cache()
+                print(f"{'warm cache:':<18} {(time.perf_counter() - started) * 1000:10.1f} ms for {args.students} students")
+            results[warm] = asyncio.run(run_burst(label, updates))
+        database.close_connection()
+    print(f"speedup: {results[False] / results[True]:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+"""
+قياس زمن إنشاء تقرير المشرف PDF على جدول اصطناعي (5000 طالب افتراضياً):
+المسار القديم (iterrows و fix_arabic لكل خلية) مقابل create_admin_report_pdf الحالية.
+
+الاستخدام:
+    python benchmarks/bench_report.py --rows 5000
+"""
+import argparse
+import io
+import os
+import sys
+import time
+import warnings
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # مسار الخطوط fonts/ نسبي
+
+from report_engine import PDF, create_admin_report_pdf, fix_arabic  # noqa: E402
+
+
+def synthetic_report(rows, seed=0):
+    rng = np.random.default_rng(seed)
+    grades = np.sort(rng.uniform(0, 100, rows))[::-1]
+    return pd.DataFrame({
+        'الترتيب': np.arange(1, rows + 1),
+        'الرقم الجامعي': [f"{10000 + i}" for i in range(rows)],
+        'اسم الطالب': [f"محمد أحمد العلي {i}" for i in range(rows)],
+        'الدرجة': grades,
+        'النسبة المئوية': rng.uniform(0, 100, rows).round(2),
+    })
+
+
+def legacy_create_admin_report_pdf(admin_report_df, mean_grade, std_dev, course_name):
+    """نسخة من جدول التقرير القديم: iterrows و fix_arabic و set_fill_color لكل خلية."""
+    pdf = PDF('P', 'mm', 'A4')
+    pdf.add_font('Noto', '', 'fonts/NotoSansArabic-Regular.ttf', uni=True)
+    pdf.add_font('Noto', 'B', 'fonts/NotoSansArabic-Bold.ttf', uni=True)
+    pdf.add_font('Noto', 'I', 'fonts/NotoSansArabic-Regular.ttf', uni=True)
+    pdf.set_auto_page_break(auto=True, margin=15)
+    pdf.alias_nb_pages()
+    pdf.add_page()
+    pdf.set_font('Noto', '', 12)
+    pdf.cell(0, 10, fix_arabic(f'المادة: {course_name}'), 0, 1, 'R')
+    pdf.cell(0, 10, fix_arabic(f'متوسط الدرجات: {mean_grade:.2f}'), 0, 1, 'R')
+    pdf.cell(0, 10, fix_arabic(f'الانحراف المعياري: {std_dev:.2f}'), 0, 1, 'R')
+    pdf.ln(5)
+    pdf.set_font('Noto', 'B', 10)
+    col_widths = [20, 30, 60, 20, 30]
+    headers = ['النسبة المئوية', 'الدرجة', 'اسم الطالب', 'الرقم الجامعي', 'الترتيب']
+    pdf.set_fill_color(200, 220, 255)
+    for i, header in enumerate(reversed(headers)):
+        pdf.cell(col_widths[i], 7, fix_arabic(header), 1, 0, 'C', 1)
+    pdf.ln()
+    pdf.set_font('Noto', '', 10)
+    for index, row in admin_report_df.iterrows():
+        data = [
+            f'{row["النسبة المئوية"]:.2f}%',
+            f'{row["الدرجة"]:.2f}',
+            fix_arabic(row["اسم الطالب"])[::-1] if row["اسم الطالب"] else fix_arabic('غير متوفر'),
+            row["الرقم الجامعي"],
+            str(row["الترتيب"])
+        ]
+        for i, item in enumerate(reversed(data)):
+            pdf.set_fill_color(*((255, 200, 200) if i == 3 else (255, 255, 255)))
+            pdf.cell(col_widths[i], 6, fix_arabic(str(item)), 1, 0, 'C', 1)
+        pdf.ln()
+    return io.BytesIO(bytes(pdf.output()))
+
+
+def measure(label, build, df):
+    start = time.perf_counter()
+    build(df, 61.5, 14.2, 'مادة تجريبية')
+    elapsed = time.perf_counter() - start
+    print(f"{label:<12} {elapsed:8.2f} s")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=5000)
+    args = parser.parse_args()
+
+    warnings.simplefilter('ignore')
+    df = synthetic_report(args.rows)
+    print(f"rows:        {args.rows}")
+    legacy = measure("legacy:", legacy_create_admin_report_pdf, df)
+    current = measure("current:", create_admin_report_pdf, df)
+    print(f"speedup:     {legacy / current:8.1f}x")
+
+
+if __name__ == '__main__':
+    main()
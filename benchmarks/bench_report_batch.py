@@ -0,0 +1,87 @@
+"""
+قياس تقارير المشرف ليوم فيه عدة مواد (30 مادة × 300 طالب افتراضياً):
+- السلوك القديم: ثلاثة خطوط لكل تقرير (النمط المائل نسخة ثانية من الخط العادي).
+- ReportEngine.render: خطان لكل تقرير.
+- دفعة واحدة: ملف لكل مادة، أو ملف واحد لكل المواد تُضاف خطوطه مرة واحدة (render_many(combined=True)).
+مع زمن كل مرحلة (fonts، page، columns، rows، output).
+
+الاستخدام:
+    python benchmarks/bench_report_batch.py --courses 30 --rows 300
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+import warnings
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # مسار الخطوط fonts/ نسبي
+
+from report_engine import ReportEngine, REPORT_FONTS  # noqa: E402
+
+# خطوط التقرير قبل إزالة النمط المائل المكرر
+LEGACY_FONTS = REPORT_FONTS + (('I', 'fonts/NotoSansArabic-Regular.ttf'),)
+
+
+def synthetic_report(rows, seed):
+    rng = np.random.default_rng(seed)
+    return {
+        'الترتيب': np.arange(1, rows + 1),
+        'الرقم الجامعي': [f"{10000 + i}" for i in range(rows)],
+        'اسم الطالب': [f"محمد أحمد العلي {i}" for i in range(rows)],
+        'الدرجة': np.sort(rng.uniform(0, 100, rows))[::-1],
+        'النسبة المئوية': rng.uniform(0, 100, rows).round(2),
+    }
+
+
+def run(label, build, reports):
+    start = time.perf_counter()
+    timings, sizes = build(reports)
+    elapsed = time.perf_counter() - start
+    phases = " | ".join(f"{phase} {ms:7.0f}" for phase, ms in timings.items())
+    print(f"{label:<24} {elapsed:7.2f} s  {sum(sizes) / 1024:8.0f} KiB  (ms: {phases})")
+    return elapsed
+
+
+def accumulate(total, timings):
+    for phase, ms in timings.items():
+        total[phase] = total.get(phase, 0.0) + ms
+
+
+def per_report(reports, fonts=REPORT_FONTS):
+    engine = ReportEngine(fonts=fonts)
+    timings, sizes = {}, []
+    for report in reports:
+        sizes.append(len(engine.render(*report).getvalue()))
+        accumulate(timings, engine.timings)
+    return timings, sizes
+
+
+def batch(reports, combined):
+    engine = ReportEngine()
+    buffers = engine.render_many(reports, combined=combined)
+    return engine.timings, [len(buffer.getvalue()) for buffer in buffers]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--courses', type=int, default=30)
+    parser.add_argument('--rows', type=int, default=300)
+    args = parser.parse_args()
+
+    warnings.simplefilter('ignore')
+    logging.disable(logging.WARNING)
+    reports = [(synthetic_report(args.rows, i), 61.5, 14.2, f"مادة {i}") for i in range(args.courses)]
+    print(f"courses: {args.courses} x {args.rows} rows")
+    legacy = run("three fonts per report:", lambda r: per_report(r, LEGACY_FONTS), reports)
+    two_fonts = run("two fonts per report:", per_report, reports)
+    run("batch, file per course:", lambda r: batch(r, combined=False), reports)
+    combined = run("batch, one file:", lambda r: batch(r, combined=True), reports)
+    print(f"speedup two fonts: {legacy / two_fonts:5.2f}x | one file: {legacy / combined:5.2f}x")
+
+
+if __name__ == '__main__':
+    main()
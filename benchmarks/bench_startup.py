@@ -0,0 +1,108 @@
+"""
+قياس زمن بدء التشغيل (يُعاد بعد كل توقف في حلقة إعادة التشغيل في start.sh):
+- زمن الاستيراد لـ bot.py و channel_monitor.py من python -X importtime، وأثقل الحزم المستوردة.
+- الزمن حتى الرد على أول رسالة (/start) من لحظة تشغيل مفسر Python (بدون الشبكة).
+- المكتبات الثقيلة التي حُملت في عملية البوت قبل الرد (يجب ألا يوجد أي منها).
+
+يُستخدم كاختبار تراجع (Regression): يعيد رمز خروج 1 إذا تجاوز الوسيط --max-ms
+أو إذا حُملت مكتبة ثقيلة قبل أول رد.
+
+الاستخدام:
+    python benchmarks/bench_startup.py --runs 5 --max-ms 1500
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# المكتبات التي يجب ألا تُحمّل في عملية البوت قبل أول ملف علامات
+HEAVY_MODULES = ('pandas', 'scipy', 'matplotlib', 'fpdf', 'pdfplumber', 'arabic_reshaper', 'bidi',
+                 'numpy', 'data_processor', 'histogram_engine')
+
+# يُنفذ في عملية جديدة: استيراد bot ثم تمرير /start من مستخدم جديد إلى المعالج مباشرة
+FIRST_UPDATE = """
+import asyncio, json, os, sys, time
+from types import SimpleNamespace
+started = float(os.environ['BENCH_STARTED'])
+sys.path.insert(0, os.environ['BENCH_ROOT'])
+import bot
+imported = time.time()
+bot.init_db()
+replies = []
+
+class Message:
+    text = '/start'
+    async def reply_text(self, text, **kwargs):
+        replies.append(time.time())
+
+update = SimpleNamespace(effective_user=SimpleNamespace(id=1), message=Message())
+asyncio.run(bot.start(update, None))
+print(json.dumps({
+    'import_ms': (imported - started) * 1000,
+    'first_update_ms': (replies[0] - started) * 1000,
+    'heavy': sorted(name for name in json.loads(os.environ['BENCH_HEAVY']) if name in sys.modules),
+}))
+"""
+
+
+def import_times(module):
+    """(الزمن الكلي بالمللي ثانية، [(الزمن، الحزمة)] لأثقل الحزم في المستوى الأول) من -X importtime."""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                            cwd=ROOT, capture_output=True, text=True, check=True)
+    total, packages = 0.0, []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line.split('|')
+        depth = (len(name) - len(name.lstrip())) // 2
+        if depth == 0 and name.strip() == module:
+            total = int(cumulative) / 1000
+        elif depth == 1:
+            packages.append((int(cumulative) / 1000, name.strip()))
+    return total, sorted(packages, reverse=True)
+
+
+def first_update():
+    """زمن أول رد في عملية جديدة (قاعدة بيانات مؤقتة)."""
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, BENCH_ROOT=ROOT, BENCH_HEAVY=json.dumps(HEAVY_MODULES), BENCH_STARTED=repr(time.time()))
+        result = subprocess.run([sys.executable, '-c', FIRST_UPDATE], cwd=tmp, env=env,
+                                capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=6)
+    parser.add_argument('--max-ms', type=float, default=None, help='أقصى وسيط مسموح للزمن حتى أول رد')
+    args = parser.parse_args()
+
+    for module in ('bot', 'channel_monitor'):
+        total, packages = import_times(module)
+        heaviest = ", ".join(f"{name} {ms:.0f}" for ms, name in packages[:args.top])
+        print(f"import {module:<16} {total:7.1f} ms  ({heaviest})")
+
+    runs = [first_update() for _ in range(args.runs)]
+    import_ms = statistics.median(run['import_ms'] for run in runs)
+    first_ms = statistics.median(run['first_update_ms'] for run in runs)
+    heavy = sorted({name for run in runs for name in run['heavy']})
+    print(f"process start -> import bot:   {import_ms:7.1f} ms median of {args.runs}")
+    print(f"process start -> first reply:  {first_ms:7.1f} ms median of {args.runs}")
+    print(f"heavy modules before reply:    {', '.join(heavy) if heavy else 'none'}")
+
+    failed = bool(heavy)
+    if args.max_ms is not None and first_ms > args.max_ms:
+        print(f"REGRESSION: first reply {first_ms:.1f} ms > {args.max_ms:.1f} ms")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
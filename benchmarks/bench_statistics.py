@@ -0,0 +1,122 @@
+"""
+قياس حساب إحصائيات المادة في process_grades من 100 إلى 100 ألف صف:
+المسار القديم (DataFrame و rank و merge و sort_values و iterrows) مقابل grade_statistics
+و join_registered (NumPy وقاموس). يتحقق أيضاً من تطابق النتائج تماماً:
+المتوسط والانحراف المعياري والنسب المئوية والترتيب والأسماء وصفوف التقرير.
+المسار القديم يحتاج pandas (غير مطلوبة لتشغيل البوت).
+
+الاستخدام:
+    python benchmarks/bench_statistics.py --sizes 100 1000 10000 100000
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from data_processor import grade_statistics, join_registered  # noqa: E402
+
+
+def synthetic_course(rows, seed=0):
+    """
+    صفوف ملف علامات (علامات بخانة عشرية واحدة، أي علامات متساوية كثيرة)،
+    وطلاب مسجلون لنحو نصف الصفوف، وبعض الأسماء ناقصة في الملف.
+    """
+    rng = np.random.default_rng(seed)
+    student_ids = [f"{10000 + i}" for i in range(rows)]
+    student_names = [None if i % 7 == 0 else f"طالب {i}" for i in range(rows)]
+    grades = np.clip(rng.normal(65, 15, rows), 0, 100).round(1).tolist()
+    registered = [(500000 + i, f"{10000 + i}", f"مسجل {i}", None, None)
+                  for i in rng.choice(rows * 2, size=rows, replace=False) if i % 3]
+    return student_ids, student_names, grades, registered
+
+
+def legacy(student_ids, student_names, grades, registered_students):
+    """نسخة من الخطوات 3-7 القديمة في process_grades (بدون قاعدة البيانات وتقرير PDF)."""
+    df = pd.DataFrame({'student_id': student_ids, 'student_name': student_names, 'grade': grades})
+    mean_grade = df['grade'].mean()
+    std_dev = df['grade'].std()
+    df['percentile'] = df['grade'].rank(pct=True) * 100
+    df['percentile'] = df['percentile'].round(2)
+
+    registered_df = pd.DataFrame(registered_students, columns=['user_id', 'student_id', 'student_name_db', 'university', 'college'])
+    registered_df['student_id'] = registered_df['student_id'].astype(str)
+    merged_df = pd.merge(df, registered_df, on='student_id', how='left')
+    merged_df['final_name'] = merged_df['student_name'].combine_first(merged_df['student_name_db'])
+
+    order = merged_df.sort_values(by='grade', ascending=False).index
+    merged_df.loc[order, 'rank'] = np.arange(1, len(order) + 1)
+    admin_report_df = merged_df.loc[order].reset_index(drop=True)
+
+    students = []
+    for _, row in merged_df.iterrows():
+        user_id = row['user_id']
+        if pd.notna(user_id):
+            final_name = row['final_name'] if pd.notna(row['final_name']) else None
+            students.append((int(user_id), row['student_id'], final_name,
+                             row['grade'], row['percentile'], int(row['rank'])))
+    report = list(zip(admin_report_df['student_id'], admin_report_df['grade'], admin_report_df['percentile']))
+    return mean_grade, std_dev, merged_df['percentile'].to_numpy(), merged_df['rank'].to_numpy(), students, report
+
+
+def kernel(student_ids, student_names, grades, registered_students):
+    """نفس الخطوات في process_grades الحالية."""
+    grade_array = np.asarray(grades, dtype=np.float64)
+    mean_grade, std_dev, percentiles, order, _ = grade_statistics(grade_array)
+    ranks = np.empty(len(grade_array), dtype=np.int64)
+    ranks[order] = np.arange(1, len(order) + 1)
+    user_ids, final_names = join_registered(student_ids, student_names, registered_students)
+
+    students = [(int(user_id), student_ids[i], final_names[i], grade_array[i], percentiles[i], int(ranks[i]))
+                for i, user_id in enumerate(user_ids) if user_id is not None]
+    report = [(student_ids[i], grade_array[i], percentiles[i]) for i in order]
+    return mean_grade, std_dev, percentiles, ranks, students, report
+
+
+def timed(func, args, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args)
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples), result
+
+
+def compare(old, new):
+    """يجب أن تتطابق كل القيم تماماً (بما فيها ترتيب الطلاب متساويي العلامة)."""
+    mean_old, std_old, pct_old, rank_old, students_old, report_old = old
+    mean_new, std_new, pct_new, rank_new, students_new, report_new = new
+    return {
+        'mean': mean_old == mean_new,
+        'std': std_old == std_new,
+        'percentiles': np.array_equal(pct_old, pct_new),
+        'ranks': np.array_equal(rank_old.astype(np.int64), rank_new),
+        'students': students_old == students_new,
+        'report': report_old == report_new,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 1000, 10000, 100000])
+    args = parser.parse_args()
+
+    print(f"{'rows':>8} {'pandas ms':>10} {'numpy ms':>10} {'speedup':>8}  checks")
+    for rows in args.sizes:
+        data = synthetic_course(rows)
+        repeat = max(3, min(50, 200000 // rows))
+        old_ms, old = timed(legacy, data, repeat)
+        new_ms, new = timed(kernel, data, repeat)
+        checks = compare(old, new)
+        failed = [name for name, ok in checks.items() if not ok]
+        print(f"{rows:>8} {old_ms:>10.2f} {new_ms:>10.2f} {old_ms / new_ms:>7.1f}x  "
+              f"{'all equal' if not failed else 'differ: ' + ', '.join(failed)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+"""
+بوت تليجرام وهمي داخل العملية (بدون شبكة) لتشغيل معالجات bot.py في المقاييس:
+- FakeBot يسجل كل send_photo و send_media_group و send_document و send_message مع زمن شبكة محاكى.
+- document_update يبني Update لرسالة ملف PDF من المشرف (تنزيل الملف = نسخه من القرص)،
+  و text_update لرسالة نصية (التسجيل).
+"""
+import asyncio
+import shutil
+import time
+from types import SimpleNamespace
+
+
+class FakeMessage:
+    """رسالة مرسلة أو مستلمة: reply_text و edit_text تُسجل النص فقط."""
+
+    def __init__(self, log, document=None, message_id=1, text=None):
+        self.log = log
+        self.document = document
+        self.message_id = message_id
+        self.text = text
+
+    async def reply_text(self, text, **kwargs):
+        self.log.append(text)
+        return FakeMessage(self.log)
+
+    async def edit_text(self, text, **kwargs):
+        self.log.append(text)
+
+
+class FakeDocument:
+    """ملف PDF مرفق: get_file().download_to_drive ينسخ الملف المحلي."""
+
+    def __init__(self, source_path, file_name, file_unique_id='bench'):
+        self.source_path = source_path
+        self.file_name = file_name
+        self.file_unique_id = file_unique_id
+        self.mime_type = 'application/pdf'
+
+    async def get_file(self):
+        source_path = self.source_path
+
+        class File:
+            async def download_to_drive(self, path):
+                await asyncio.to_thread(shutil.copyfile, source_path, path)
+        return File()
+
+
+class FakeBot:
+    """
+    يسجل كل رسالة مرسلة (الزمن، المحادثة، النوع) وينتظر latency ثانية قبل الرد.
+    الصور المرفوعة تأخذ file_id جديداً، والمرسلة بـ file_id تُعاد كما هي (مثل تليجرام).
+    """
+
+    def __init__(self, latency=0.05):
+        self.latency = latency
+        self.sent = []  # (time.perf_counter، chat_id، النوع)
+        self.messages = []
+        self.uploads = 0
+
+    def _record(self, chat_id, kind):
+        self.sent.append((time.perf_counter(), chat_id, kind))
+
+    async def send_photo(self, chat_id, photo, caption=None, **kwargs):
+        await asyncio.sleep(self.latency)
+        if isinstance(photo, str):
+            file_id = photo
+        else:
+            self.uploads += 1
+            file_id = f"photo-{self.uploads}"
+        self._record(chat_id, 'photo')
+        return SimpleNamespace(photo=[SimpleNamespace(file_id=file_id)])
+
+    async def send_media_group(self, chat_id, media, **kwargs):
+        """ألبوم: رسالة لكل صورة (مثل تليجرام)، ويُسجل كإرسال واحد من نوع album."""
+        await asyncio.sleep(self.latency)
+        messages = []
+        for item in media:
+            if isinstance(item.media, str):
+                file_id = item.media
+            else:
+                self.uploads += 1
+                file_id = f"photo-{self.uploads}"
+            messages.append(SimpleNamespace(photo=[SimpleNamespace(file_id=file_id)]))
+        self._record(chat_id, 'album')
+        return messages
+
+    async def send_document(self, chat_id, document, **kwargs):
+        await asyncio.sleep(self.latency)
+        self._record(chat_id, 'document')
+        return FakeMessage(self.messages)
+
+    async def send_message(self, chat_id, text, **kwargs):
+        await asyncio.sleep(self.latency)
+        self._record(chat_id, 'message')
+        self.messages.append(text)
+        return FakeMessage(self.messages)
+
+    def times(self, kind):
+        return [sent_at for sent_at, _, sent_kind in self.sent if sent_kind == kind]
+
+
+def document_update(user_id, pdf_path, file_name, message_id=1, replies=None):
+    """Update لرسالة خاصة من user_id فيها ملف pdf_path باسم file_name."""
+    document = FakeDocument(pdf_path, file_name, file_unique_id=f"bench{message_id}")
+    return SimpleNamespace(
+        effective_user=SimpleNamespace(id=user_id),
+        effective_chat=SimpleNamespace(id=user_id),
+        message=FakeMessage(replies if replies is not None else [], document, message_id),
+    )
+
+
+def text_update(user_id, text, replies=None):
+    """Update لرسالة نصية خاصة من user_id (مثل إرسال الرقم الجامعي للتسجيل)."""
+    return SimpleNamespace(
+        effective_user=SimpleNamespace(id=user_id),
+        effective_chat=SimpleNamespace(id=user_id),
+        message=FakeMessage(replies if replies is not None else [], text=text),
+    )
+
+
+def fake_context(bot, args=None):
+    """context للمعالجات: المهام في الخلفية (application.create_task) تعمل في حلقة الأحداث الحالية."""
+    return SimpleNamespace(bot=bot, args=args or [], application=SimpleNamespace(create_task=asyncio.create_task))
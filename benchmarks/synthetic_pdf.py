@@ -0,0 +1,89 @@
+"""
+مولد ملفات PDF اصطناعية للعلامات بنفس تخطيط ملفات الكلية:
+جدول بحدود من اليسار لليمين: الحالة، العملي، المجموع، النظري، الاسم، الرقم الجامعي، التسلسل.
+(العلامة في العمود الثالث من اليسار والاسم في الثالث من اليمين كما يفترض pdf_parser.)
+التخطيط قابل للتعديل: اتجاه الصفحة، ارتفاع الصف (عدد الصفوف في الصفحة)، وتكرار رأس الجدول.
+
+الاستخدام:
+    python benchmarks/synthetic_pdf.py out.pdf --students 3000
+    python benchmarks/synthetic_pdf.py out.pdf --students 3000 --landscape --row-height 5 --header-once
+"""
+import argparse
+import os
+import random
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from fpdf import FPDF  # noqa: E402
+from arabic_text import fix_arabic  # noqa: E402
+
+COLUMNS = [('الحالة', 20), ('العملي', 18), ('المجموع', 18), ('النظري', 18), ('الاسم', 60), ('الرقم', 22), ('م', 12)]
+FIRST_NAMES = ['محمد', 'أحمد', 'علي', 'عمر', 'خالد', 'سارة', 'فاطمة', 'مريم', 'ليلى', 'يوسف', 'حسن', 'نور']
+LAST_NAMES = ['الحلبي', 'العلي', 'الأحمد', 'الخطيب', 'الشامي', 'النجار', 'السيد', 'الحسن', 'الزعبي', 'المصري']
+
+
+def synthetic_students(count, seed=0):
+    """يعيد قائمة (الرقم الجامعي، الاسم، العلامة) لعدد من الطلاب."""
+    rng = random.Random(seed)
+    students = []
+    for i in range(count):
+        name = f"{rng.choice(FIRST_NAMES)} {rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+        grade = round(min(max(rng.gauss(65, 15), 0), 100), 1)
+        students.append((f"{10000 + i}", name, grade))
+    return students
+
+
+def write_grades_pdf(path, students, header_on_every_page=True, orientation='P', row_height=6, titles=None):
+    """
+    يكتب ملف PDF بجدول العلامات (رأس الجدول يتكرر في كل صفحة افتراضياً).
+    orientation: 'P' (طولي) أو 'L' (عرضي)، row_height: ارتفاع الصف بالمللي متر.
+    titles: عناوين الأعمدة بدلاً من عناوين COLUMNS (نفس الترتيب والمحتوى).
+    """
+    pdf = FPDF(orientation, 'mm', 'A4')
+    pdf.add_font('Noto', '', os.path.join(ROOT, 'fonts', 'NotoSansArabic-Regular.ttf'))
+    pdf.set_auto_page_break(False)
+    pdf.set_font('Noto', '', 9)
+    headers = [fix_arabic(title) for title in (titles or [title for title, _ in COLUMNS])]
+    bottom = pdf.h - 15
+
+    def header():
+        for (_, width), title in zip(COLUMNS, headers):
+            pdf.cell(width, 7, title, border=1, align='C')
+        pdf.ln()
+
+    pdf.add_page()
+    header()
+    for serial, (student_id, name, grade) in enumerate(students, start=1):
+        if pdf.get_y() + row_height > bottom:
+            pdf.add_page()
+            if header_on_every_page:
+                header()
+        status = fix_arabic('ناجح' if grade >= 60 else 'راسب')
+        cells = [status, f"{grade * 0.3:.1f}", f"{grade}", f"{grade * 0.7:.1f}",
+                 fix_arabic(name), student_id, str(serial)]
+        for (_, width), text in zip(COLUMNS, cells):
+            pdf.cell(width, row_height, text, border=1, align='C')
+        pdf.ln()
+    pdf.output(path)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('output')
+    parser.add_argument('--students', type=int, default=3000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--landscape', action='store_true')
+    parser.add_argument('--row-height', type=float, default=6)
+    parser.add_argument('--header-once', action='store_true', help='رأس الجدول في الصفحة الأولى فقط')
+    args = parser.parse_args()
+    write_grades_pdf(args.output, synthetic_students(args.students, args.seed),
+                     header_on_every_page=not args.header_once,
+                     orientation='L' if args.landscape else 'P', row_height=args.row_height)
+    print(f"wrote {args.output} ({args.students} students)")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,14 +1,19 @@
+import asyncio
 import logging
 import os
 import io
+from functools import partial
 from telegram import Update, Bot
 from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes
 
 # استيراد الدوال من الملفات الأخرى
-from config import TELEGRAM_BOT_TOKEN, STATISTICS_OUTPUT_CHANNEL_ID, UNIVERSITIES
-from database import init_db, register_student, get_student_info_by_user_id, get_student_info_by_id, get_all_students, update_student_name
-from pdf_parser import parse_grades_pdf # تم تصحيح اسم الدالة
-from data_processor import process_grades, create_grades_histogram, create_admin_report_pdf, fix_arabic
+from config import TELEGRAM_BOT_TOKEN, STATISTICS_OUTPUT_CHANNEL_ID, ADMIN_IDS, UNIVERSITIES, PHOTO_CACHE_SIZE, PREWARM_DELAY
+from database import init_db, warm_student_cache, refresh_student_names, close_connection, register_student, get_student_info_by_user_id, get_student_info_by_id, get_all_students, update_student_name, get_previous_grades, save_processed_file, get_student_grades, add_deliveries, update_student_names_bulk, set_job_stage, finish_job, mark_uncertain_deliveries, get_delivery_states
+from delivery import DeliveryScheduler, DeliveryJob, AlbumPhoto, PhotoCache
+from workers import run_in_pool, render_histogram, process_grades_file, render_admin_reports, prewarm, shutdown_workers
+from job_queue import JobQueue, DeliveryCheckpoint, job_pdf_path, submit_file
+from results_index import results_index
+from metrics import metrics, start_job_stats, finish_job_stats, write_metrics_file, summary as metrics_summary
 
 # إعداد التسجيل (Logging)
 logging.basicConfig(
@@ -20,6 +25,76 @@ logger = logging.getLogger(__name__)
 UNIVERSITY_NAME = "جامعة حلب"
 COLLEGE_NAME = "كلية الطب"
 
+# معرفات صور المخططات المرفوعة مشتركة بين كل ملفات العلامات وأمر /mygrades
+photo_cache = PhotoCache(maxsize=PHOTO_CACHE_SIZE)
+
+# قائمة انتظار ملفات العلامات (تبدأ في post_init)
+grades_queue = None
+
+# التحميل المسبق في الخلفية (يبدأ في post_init)
+prewarm_task = None
+
+# مراحل معالجة ملف العلامات بالترتيب
+JOB_STAGES = ('parse', 'deliver', 'report')
+
+def result_message(student_id, display_name, grade, percentile):
+    """نص رسالة نتيجة الطالب في مادة."""
+    return (
+        f"نتيجتك في المادة:\n"
+        f"الرقم الجامعي: {student_id}\n"
+        f"الاسم: {display_name}\n"
+        f"الدرجة: {grade:.2f}\n"
+        f"النسبة المئوية (Percentile): {percentile:.2f}%\n"
+        f"هذا يعني أنك أفضل من {percentile:.2f}% من زملائك."
+    )
+
+def histogram_photo_key(histogram_key, bin_edges, grade):
+    """الطلاب بنفس المخطط ونفس الدرجة يستلمون نفس الصورة: تُرفع مرة واحدة ثم يُعاد استخدام file_id."""
+    from grade_history import grade_bin
+    return (histogram_key, grade_bin(grade, bin_edges), grade)
+
+async def send_result_photo(bot, chat_id, caption, course_name, aggregates, grade):
+    """
+    يرسل نتيجة مادة محفوظة مع المخطط: من ذاكرة الصور إن كان قد أُرسل سابقاً،
+    وإلا يُولد في عملية عاملة ويُرفع مرة واحدة.
+    """
+    histogram_key = (course_name, aggregates.bin_counts.tobytes())
+
+    async def send(photo):
+        return await bot.send_photo(chat_id=chat_id, photo=photo, caption=caption)
+
+    return await photo_cache.send(
+        histogram_photo_key(histogram_key, aggregates.bin_edges, grade), send,
+        partial(render_histogram, histogram_key, aggregates.bin_counts, grade)
+    )
+
+async def send_late_results(bot, user_id, student_id, results):
+    """
+    طالب سجل بعد معالجة ملفات مواده: نتيجته في كل مادة من فهرس النتائج
+    (results: اسم المادة -> (العلامة، النسبة المئوية، الترتيب، الاسم))، بدون إعادة تحليل أي ملف.
+    """
+    from grade_history import load_course_aggregates
+    from arabic_text import fix_arabic
+    # الاسم من ملف العلامات (كما يُحدّث لباقي الطلاب في process_grades)
+    student_name = next((name for _, _, _, name in results.values() if name), None)
+    if student_name:
+        update_student_name(student_id, student_name)
+    display_name = fix_arabic(student_name)[::-1] if student_name else 'غير متوفر'
+    for course_name, (grade, percentile, rank, _) in results.items():
+        try:
+            aggregates = load_course_aggregates(course_name)
+            if aggregates is None:
+                continue
+            caption = (
+                result_message(student_id, display_name, grade, percentile)
+                + f"\nالمادة: {course_name} | الترتيب: {rank} من {aggregates.student_count}"
+            )
+            await send_result_photo(bot, user_id, caption, course_name, aggregates, grade)
+            metrics.inc('late_deliveries', result='sent')
+        except Exception as e:
+            logger.error(f"خطأ أثناء إرسال نتيجة المادة {course_name} للطالب {student_id} بعد تسجيله: {e}")
+            metrics.inc('late_deliveries', result='failed')
+
 # --- الأوامر ---
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -60,19 +135,93 @@ async def handle_registration(update: Update, context: ContextTypes.DEFAULT_TYPE
         student_id = text
         
         # التسجيل في قاعدة البيانات (الاسم سيكون فارغاً مبدئياً)
-        register_student(user_id, student_id, UNIVERSITY_NAME, COLLEGE_NAME)
-        
+        registered = register_student(user_id, student_id, UNIVERSITY_NAME, COLLEGE_NAME)
+        # مواد عولجت ملفاتها قبل التسجيل: البحث مباشرة بعد التسجيل وبدون await بينهما.
+        # المواد التي يُحدّث فهرسها بعد هذا السطر تضيف الطالب في add_late_registrants،
+        # فكل نتيجة تصل مرة واحدة (من هنا أو من ملف المادة)
+        results = dict(results_index.lookup(student_id)) if registered else None
+
         await update.message.reply_text(
             f'تم تسجيل رقمك الجامعي ({student_id}) بنجاح.\n'
             'سيتم استخراج اسمك تلقائياً من ملف العلامات عند نشره.\n'
             'ستصلك نتيجتك الفردية تلقائياً بعد معالجة الملف.'
         )
+
+        # النتائج ترسل في مهمة منفصلة حتى لا ينتظر معالج التسجيل رسم المخطط
+        if results:
+            context.application.create_task(send_late_results(context.bot, user_id, student_id, results))
     else:
         await update.message.reply_text('الرجاء إدخال رقم جامعي صحيح مكون من 5 أرقام فقط.')
 
+async def my_grades(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    /mygrades: علامات الطالب المحفوظة في كل المواد.
+    /mygrades اسم_المادة: نتيجة مادة واحدة مع المخطط.
+    القائمة من grade_records مباشرة؛ نتيجة المادة تأخذ النسبة المئوية من ملخص المادة المحسوب عند
+    المعالجة (بحث ثنائي بدون إعادة حساب). الترتيب هو المحفوظ عند المعالجة (نفس تقرير المشرف).
+    """
+    user_id = update.effective_user.id
+    student_info = get_student_info_by_user_id(user_id)
+    if not student_info:
+        await update.message.reply_text('لم تقم بالتسجيل بعد. استخدم /start للتسجيل برقمك الجامعي.')
+        return
+    student_id, student_name, _, _ = student_info
+    # NumPy ومكتبات النصوص العربية تُحمّل عند أول استخدام (أو في التحميل المسبق بعد بدء البوت)
+    from grade_history import load_course_aggregates
+    from arabic_text import fix_arabic
+
+    records = get_student_grades(student_id)
+    if not records:
+        await update.message.reply_text('لا توجد علامات محفوظة لك بعد. ستصلك نتيجتك تلقائياً عند نشر ملف العلامات.')
+        return
+
+    course_name = " ".join(context.args or []).strip()
+    if not course_name:
+        lines = ['علاماتك المحفوظة:']
+        for name, grade, percentile, rank, student_count in records:
+            lines.append(f"• {name}: {grade:.2f} | النسبة المئوية {percentile:.2f}% | الترتيب {rank} من {student_count}")
+        lines.append('\nلعرض تفاصيل مادة مع المخطط: /mygrades اسم_المادة')
+        await update.message.reply_text("\n".join(lines))
+        return
+
+    record = next((record for record in records if record[0] == course_name), None)
+    aggregates = load_course_aggregates(course_name) if record else None
+    if aggregates is None:
+        await update.message.reply_text(
+            f'لا توجد نتيجة محفوظة لك في المادة "{course_name}".\n'
+            'المواد المتوفرة: ' + '، '.join(record[0] for record in records)
+        )
+        return
+
+    _, grade, _, rank, _ = record
+    percentile = aggregates.percentile(grade)
+    display_name = fix_arabic(student_name)[::-1] if student_name else 'غير متوفر'
+    caption = (
+        result_message(student_id, display_name, grade, percentile)
+        + f"\nالترتيب: {rank} من {aggregates.student_count}"
+        + f"\nمتوسط المادة: {aggregates.mean:.2f} | الانحراف المعياري: {aggregates.std_dev:.2f}"
+    )
+    await send_result_photo(context.bot, user_id, caption, course_name, aggregates, grade)
+
+async def stats(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """/stats [عدد]: ملخص آخر ملفات العلامات (أزمنة المراحل والإرسال وذاكرات التخزين المؤقت). للمشرف فقط."""
+    if update.effective_user.id not in ADMIN_IDS:
+        await update.message.reply_text("عذراً، هذا الأمر للمشرف فقط.")
+        return
+    try:
+        job_count = int(context.args[0]) if context.args else 5
+    except ValueError:
+        job_count = 5
+    text = metrics_summary(max(1, min(job_count, 10)))
+    # نفس الأرقام بصيغة Prometheus في METRICS_FILE
+    write_metrics_file()
+    # حد طول رسالة تليجرام
+    await update.message.reply_text(text[:4000])
+
 async def handle_document(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """
-    يعالج المستندات المرسلة (ملفات PDF) لتحليل العلامات وإرسال النتائج.
+    يستقبل ملفات PDF من المشرف ويضيفها إلى قائمة الانتظار.
+    المعالجة والإرسال تتم في run_grades_job (قائمة انتظار دائمة في قاعدة البيانات).
     """
     user_id = update.effective_user.id
     
@@ -86,109 +235,441 @@ async def handle_document(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
 
         pdf_path = None
         try:
-            # 2. تنزيل الملف
-            file = await update.message.document.get_file()
-            pdf_path = os.path.join("/tmp", update.message.document.file_name)
-            await file.download_to_drive(pdf_path)
-            
-            await update.message.reply_text("تم استلام الملف. يرجى الانتظار، تتم معالجة العلامات...")
-
-            # 3. تحليل ملف PDF
-            grades_data = parse_grades_pdf(pdf_path)
-            if not grades_data:
-                await update.message.reply_text("فشل تحليل ملف PDF. قد يكون التنسيق غير مدعوم أو لا يحتوي على بيانات علامات.")
+            # 2. تنزيل الملف إلى مجلد قائمة الانتظار (يبقى حتى انتهاء المعالجة)
+            document = update.message.document
+            pdf_path = job_pdf_path(f"{document.file_unique_id}_{update.message.message_id}", document.file_name)
+            with metrics.timer('stage', stage='download'):
+                file = await document.get_file()
+                await file.download_to_drive(pdf_path)
+            course_name = document.file_name.replace(".pdf", "")
+
+            # 3. إضافة الملف إلى قائمة الانتظار (الملف المكرر لا يُعالج مرة أخرى)
+            status, info = submit_file(pdf_path, course_name, update.effective_chat.id)
+            if status == 'processed':
+                processed_course, _, _, student_count, processed_at = info
+                await update.message.reply_text(
+                    f"تمت معالجة هذا الملف سابقاً ({processed_course}، {student_count} طالب، {processed_at}).\n"
+                    "لن يتم إرسال النتائج مرة أخرى."
+                )
+            elif status == 'pending':
+                await update.message.reply_text(f"هذا الملف موجود بالفعل في قائمة المعالجة (رقم {info}).")
+            elif status == 'queued':
+                grades_queue.notify()
+                await update.message.reply_text(f"تم استلام الملف وإضافته إلى قائمة المعالجة (رقم {info}).")
+            else:
+                await update.message.reply_text("❌ تعذر إضافة الملف إلى قائمة المعالجة.")
+
+        except Exception as e:
+            logger.error(f"خطأ أثناء استلام الملف: {e}")
+            await update.message.reply_text(f"❌ حدث خطأ غير متوقع أثناء استلام الملف: {e}")
+            if pdf_path and os.path.exists(pdf_path):
                 os.remove(pdf_path)
-                return
-
-            # 4. معالجة البيانات
-            course_name = update.message.document.file_name.replace(".pdf", "")
-            student_results, admin_pdf_buffer = process_grades(grades_data, course_name=course_name)
-            
-            # 5. إرسال النتائج الفردية
-            if student_results:
-                for user_id, result in student_results.items():
-                    # التحقق من معلومات الطالب
-                    student_info = get_student_info_by_user_id(user_id)
-                    if not student_info:
-                        logger.warning(f"الطالب {user_id} مسجل ولكن لا توجد معلومات في قاعدة البيانات.")
-                        continue
-                    
-                    student_id, student_name, _, _ = student_info
-                    
-                    # إنشاء مخطط الأعمدة (Histogram)
-                    plot_buffer = create_grades_histogram(
-                        result['all_grades'], 
-                        result['grade']
-                    )
-                    
-                    # تصحيح الاسم في الرسالة النصية (الحل النهائي)
-                    fixed_name = fix_arabic(student_name)[::-1] if student_name else 'غير متوفر'
-                    
-                    # إرسال الرسالة
-                    message_text = (
-                        f"نتيجتك في المادة:\n"
-                        f"الرقم الجامعي: {student_id}\n"
-                        f"الاسم: {fixed_name}\n"
-                        f"الدرجة: {result['grade']:.2f}\n"
-                        f"النسبة المئوية (Percentile): {result['percentile']:.2f}%\n"
-                        f"هذا يعني أنك أفضل من {result['percentile']:.2f}% من زملائك."
-                    )
-                    
-                    # إرسال الصورة والرسالة
-                    await context.bot.send_photo(
-                        chat_id=user_id,
-                        photo=plot_buffer,
-                        caption=message_text
-                    )
-                    
-                    logger.info(f"تم إرسال النتيجة للطالب {student_id} ({user_id}).")
-            
-            # 6. إرسال تقرير المشرف (بعد إرسال النتائج الفردية)
-            if admin_pdf_buffer:
-                await context.bot.send_document(
+    else:
+        await update.message.reply_text("الرجاء إرسال ملف علامات بصيغة PDF.")
+
+
+def add_late_registrants(course_result):
+    """
+    يضيف إلى نتائج المادة الطلاب المسجلين في ملف العلامات الذين لم تجدهم العملية العاملة
+    (سجلوا أثناء المعالجة، قبل تحديث فهرس النتائج). يُستدعى مباشرة بعد update_course
+    بدون await بينهما، فكل طالب تصله النتيجة مرة واحدة: من هنا أو من handle_registration.
+    """
+    grades = {student_id: (name, grade) for student_id, name, grade in course_result.rows}
+    registered_ids = {result.student_id for result in course_result.students.values()}
+    late = []
+    for user_id, student_id, _, _, _ in get_all_students():
+        if student_id in registered_ids or student_id not in grades:
+            continue
+        courses = results_index.lookup(student_id)
+        if course_result.course_name not in courses:
+            continue
+        _, percentile, rank, _ = courses[course_result.course_name]
+        student_name, grade = grades[student_id]
+        course_result.add_student(user_id, student_id, student_name, grade, percentile, rank)
+        late.append((student_id, student_name))
+    if late:
+        # أسماء المسجلين أثناء المعالجة لم تُحدّث في process_grades
+        update_student_names_bulk([(student_id, name) for student_id, name in late if name])
+        logger.info(f"المادة {course_result.course_name}: {len(late)} طالب سجلوا أثناء المعالجة.")
+
+def apply_course_result(course_result):
+    """
+    تحديثات عملية البوت بعد حفظ مادة في العملية العاملة: ملخص المادة لأمر /mygrades،
+    الأسماء في ذاكرة الطلاب، وفهرس النتائج للطلاب الذين يسجلون من الآن.
+    """
+    from grade_history import invalidate_course
+    invalidate_course(course_result.course_name)
+    # الأسماء التي حدثتها العملية العاملة في قاعدة البيانات
+    refresh_student_names((result.student_id, result.student_name) for result in course_result.students.values())
+    # الطلاب الذين يسجلون من الآن تصلهم النتيجة من فهرس النتائج عند التسجيل
+    results_index.update_course(course_result.course_name)
+
+def course_recipients(course_result, previous_grades):
+    """الطلاب الذين تصلهم نتيجة المادة: كل المسجلين، أو من تغيرت علامتهم فقط في نسخة مصححة من مادة سابقة."""
+    return [user_id for user_id, result in course_result.students.items()
+            if previous_grades is None or previous_grades.get(result.student_id) != result.grade]
+
+def result_photo(course_result, result):
+    """(دالة توليد المخطط، مفتاح ذاكرة الصور) لنتيجة طالب في مادة."""
+    # المخطط الأساسي يُرسم مرة واحدة للمادة في كل عملية عاملة، ثم تُميز درجة كل طالب فوقه
+    histogram_key = course_result.histogram_key
+    return (
+        # مخطط الأعمدة (Histogram) يُولد عند الإرسال فقط، في عملية عاملة
+        partial(render_histogram, histogram_key, course_result.bin_counts, result.grade),
+        histogram_photo_key(histogram_key, course_result.bin_edges, result.grade),
+    )
+
+async def deliver_results(bot, delivery_jobs, delivery_id, stats, notify):
+    """
+    يرسل النتائج بشكل متزامن مع احترام حدود تليجرام، مع رسالة تقدم للمشرف وحفظ حالة كل طالب
+    في deliveries برقم delivery_id (رقم الملف أو الدفعة)، ويحدث المقاييس.
+    """
+    status_message = await notify(f"جاري إرسال النتائج إلى {len(delivery_jobs)} طالب...")
+
+    async def report_progress(report):
+        if status_message is not None:
+            await status_message.edit_text(f"⏳ {report.summary()}")
+
+    scheduler = DeliveryScheduler(bot, photo_cache=photo_cache, checkpoint=DeliveryCheckpoint(delivery_id))
+    photo_hits = photo_cache.hits
+    histogram_seconds = metrics.total('stage', stage='histogram')
+    with stats.stage('deliver'):
+        report = await scheduler.deliver(delivery_jobs, progress=report_progress)
+    stats.stages['histogram'] += metrics.total('stage', stage='histogram') - histogram_seconds
+    stats.counts['photo_hits'] += photo_cache.hits - photo_hits
+    stats.counts['sent'] += report.sent
+    stats.counts['failed'] += report.failed
+    stats.counts['retries'] += report.retries
+    metrics.inc('deliveries', report.sent, result='sent')
+    metrics.inc('deliveries', report.failed, result='failed')
+    metrics.inc('delivery_retries', report.retries)
+    logger.info(f"{stats.course_name}: {photo_cache.summary()}")
+    if status_message is not None:
+        await status_message.edit_text(f"✅ {report.summary()}")
+
+async def run_grades_job(bot: Bot, job: dict) -> None:
+    """
+    يعالج ملف علامات واحد من قائمة الانتظار على مراحل محفوظة في قاعدة البيانات:
+    parse (تحليل وحساب) -> deliver (إرسال النتائج الفردية) -> report (تقرير المشرف).
+    عند الاستئناف بعد إعادة التشغيل يُعاد تحليل الملف لبناء النتائج، لكن قائمة الطلاب
+    وحالة الإرسال لكل طالب تؤخذ من جدول deliveries فلا تتكرر أي رسالة.
+    """
+    job_id, course_name, pdf_path, stage = job['job_id'], job['course_name'], job['pdf_path'], job['stage']
+    chat_id = job['chat_id'] or STATISTICS_OUTPUT_CHANNEL_ID
+    stats = start_job_stats(job_id, course_name)
+
+    async def notify(text):
+        try:
+            return await bot.send_message(chat_id=chat_id, text=text)
+        except Exception as e:
+            logger.warning(f"تعذر إرسال رسالة المتابعة للمشرف: {e}")
+
+    try:
+        if stage == 'parse':
+            await notify(f"يرجى الانتظار، تتم معالجة العلامات ({course_name})...")
+        else:
+            await notify(f"استئناف معالجة ملف العلامات {course_name} من مرحلة {stage} بعد إعادة التشغيل...")
+
+        # نسخة مصححة من مادة سابقة: نرسل فقط للطلاب الذين تغيرت علامتهم
+        previous_grades = get_previous_grades(course_name)
+
+        # فهرس النتائج يُحمّل قبل أن تحفظ العملية العاملة علامات المادة: التسجيل أثناء المعالجة
+        # لا يرى المادة قبل update_course (انظر add_late_registrants)
+        await asyncio.to_thread(results_index.load)
+
+        # 1. تحليل ملف PDF ومعالجة البيانات في خطوة متدفقة واحدة
+        # (في عملية عاملة حتى لا تتوقف حلقة الأحداث)
+        with stats.stage('worker'):
+            course_result, admin_pdf_buffer, worker_metrics = await run_in_pool(process_grades_file, pdf_path, course_name)
+        # أزمنة التحليل والحسابات والتقرير سُجلت في العملية العاملة
+        metrics.merge(worker_metrics)
+        stats.add_worker_stages(worker_metrics)
+        if course_result is None:
+            await notify("فشل تحليل ملف PDF. قد يكون التنسيق غير مدعوم أو لا يحتوي على بيانات علامات.")
+            finish_job(job_id, 'failed', 'parse')
+            finish_job_stats(stats, 'failed')
+            if os.path.exists(pdf_path):
+                os.remove(pdf_path)
+            return
+        apply_course_result(course_result)
+        stats.counts['rows'] = len(course_result.rows)
+        stats.counts['students'] = len(course_result.students)
+
+        if stage == 'parse':
+            # الطلاب الذين سجلوا أثناء المعالجة (بعد قراءة العملية العاملة لقائمة المسجلين)
+            add_late_registrants(course_result)
+            # قائمة الطلاب الذين ستصلهم النتيجة تُحفظ مرة واحدة
+            recipients = course_recipients(course_result, previous_grades)
+            unchanged = len(course_result.students) - len(recipients)
+            if unchanged:
+                await notify(f"نسخة معدلة من المادة: {unchanged} طالب لم تتغير علامتهم ولن تُرسل لهم النتيجة مجدداً.")
+            add_deliveries(job_id, recipients)
+            stage = 'deliver'
+            set_job_stage(job_id, stage)
+
+        # 2. إرسال النتائج الفردية (الطلاب الذين لم تصلهم النتيجة بعد فقط)
+        if stage == 'deliver':
+            uncertain = mark_uncertain_deliveries(job_id)
+            if uncertain:
+                await notify(
+                    f"⚠️ {uncertain} طالب بدأ إرسال نتيجتهم قبل توقف البوت ولا يمكن التأكد من وصولها.\n"
+                    "لن تُعاد لهم النتيجة تجنباً للتكرار (يمكنهم استخدام /mygrades)."
+                )
+            pending = [user_id for user_id, state in get_delivery_states(job_id).items() if state == 'pending']
+
+            jobs = []
+            for user_id in pending:
+                result = course_result.students.get(user_id)
+                if result is None:
+                    continue
+                # كل بيانات الطالب (الرقم الجامعي والاسم المصحح) جاهزة من process_grades
+                render_photo, photo_key = result_photo(course_result, result)
+                jobs.append(DeliveryJob(
+                    chat_id=user_id,
+                    caption=result_message(result.student_id, result.display_name, result.grade, result.percentile),
+                    render_photo=render_photo,
+                    label=result.student_id,
+                    photo_key=photo_key
+                ))
+
+            if jobs:
+                await deliver_results(bot, jobs, job_id, stats, notify)
+            stage = 'report'
+            set_job_stage(job_id, stage)
+
+        # 3. حفظ الملف بعد الإرسال: إعادة نشره لاحقاً لن تعيد المعالجة
+        save_processed_file(job['file_hash'], course_name, course_result.rows, course_result.mean, course_result.std_dev)
+
+        # 4. إرسال تقرير المشرف (بعد إرسال النتائج الفردية)
+        if admin_pdf_buffer:
+            with stats.stage('admin_report'):
+                await bot.send_document(
                     chat_id=STATISTICS_OUTPUT_CHANNEL_ID,
                     document=admin_pdf_buffer,
                     filename=f"تقرير_علامات_{course_name}.pdf",
                     caption=f"✅ تم الانتهاء من معالجة ملف العلامات {course_name}.pdf.\n\nالتقرير الإحصائي الشامل مرفق."
                 )
-                await update.message.reply_text("✅ تم الانتهاء من معالجة الملف وإرسال التقرير الإحصائي إلى قناة المشرف.")
+            await notify("✅ تم الانتهاء من معالجة الملف وإرسال التقرير الإحصائي إلى قناة المشرف.")
+        finish_job(job_id, 'done')
+        finish_job_stats(stats, 'done')
+
+        # 5. تنظيف الملف المحفوظ
+        if os.path.exists(pdf_path):
+            os.remove(pdf_path)
 
+    except Exception as e:
+        logger.error(f"خطأ أثناء معالجة الملف: {e}")
+        finish_job(job_id, 'failed', str(e))
+        finish_job_stats(stats, 'failed')
+        # إرسال رسالة خطأ للمشرف
+        await notify(f"❌ خطأ فادح أثناء معالجة ملف العلامات {course_name}:\n{e}")
+        if os.path.exists(pdf_path):
+            os.remove(pdf_path)
+
+
+async def run_grades_batch(bot: Bot, jobs: list) -> None:
+    """
+    يعالج عدة ملفات علامات وصلت معاً (وضع الدفعات، انظر JobQueue) بنفس مراحل run_grades_job:
+    - التحليل والحسابات لكل الملفات على التوازي في العمليات العاملة، بقائمة مسجلين واحدة.
+    - رسالة واحدة لكل طالب: ألبوم بمخطط ونتيجة كل مادة من مواد الدفعة.
+    - تقرير مشرف واحد لكل المواد (ملف PDF واحد).
+    المرحلة محفوظة لكل ملفات الدفعة، وحالة الإرسال في deliveries برقم الدفعة، فتُستأنف بدون تكرار.
+    """
+    batch_id = jobs[0]['batch_id']
+    # المرحلة تُحفظ لكل ملف على حدة: إذا توقف البوت بين تحديثين نستأنف من المرحلة الأسبق
+    stage = min((job['stage'] for job in jobs), key=JOB_STAGES.index)
+    chat_id = jobs[0]['chat_id'] or STATISTICS_OUTPUT_CHANNEL_ID
+    course_names = "، ".join(job['course_name'] for job in jobs)
+    stats = start_job_stats(batch_id, f"دفعة {len(jobs)} مواد")
+
+    async def notify(text):
+        try:
+            return await bot.send_message(chat_id=chat_id, text=text)
         except Exception as e:
-            logger.error(f"خطأ أثناء معالجة الملف: {e}")
-            await update.message.reply_text(f"❌ حدث خطأ غير متوقع أثناء معالجة الملف: {e}")
-            # إرسال رسالة خطأ للمشرف
-            await context.bot.send_message(
-                chat_id=STATISTICS_OUTPUT_CHANNEL_ID,
-                text=f"❌ خطأ فادح أثناء معالجة ملف العلامات:\n{e}"
+            logger.warning(f"تعذر إرسال رسالة المتابعة للمشرف: {e}")
+
+    def remove_pdf(job):
+        if os.path.exists(job['pdf_path']):
+            os.remove(job['pdf_path'])
+
+    try:
+        if stage == 'parse':
+            await notify(f"يرجى الانتظار، تتم معالجة {len(jobs)} ملفات علامات معاً ({course_names})...")
+        else:
+            await notify(f"استئناف معالجة دفعة ملفات العلامات ({course_names}) من مرحلة {stage} بعد إعادة التشغيل...")
+
+        previous_grades = {job['job_id']: get_previous_grades(job['course_name']) for job in jobs}
+
+        # 1. تحليل كل الملفات على التوازي؛ قائمة المسجلين تُقرأ مرة واحدة (من ذاكرة الطلاب) لكل الدفعة
+        registered_students = get_all_students()
+        # كما في run_grades_job: الفهرس محمّل قبل حفظ علامات مواد الدفعة
+        await asyncio.to_thread(results_index.load)
+        with stats.stage('worker'):
+            outputs = await asyncio.gather(*(
+                run_in_pool(process_grades_file, job['pdf_path'], job['course_name'], registered_students, False)
+                for job in jobs
+            ))
+
+        courses = [] # (الملف، نتائج المادة، بيانات تقرير المشرف)
+        for job, (course_result, admin_report, worker_metrics) in zip(jobs, outputs):
+            metrics.merge(worker_metrics)
+            stats.add_worker_stages(worker_metrics)
+            if course_result is None:
+                await notify(f"فشل تحليل ملف {job['course_name']}.pdf. قد يكون التنسيق غير مدعوم أو لا يحتوي على بيانات علامات.")
+                finish_job(job['job_id'], 'failed', 'parse')
+                remove_pdf(job)
+                continue
+            courses.append((job, course_result, admin_report))
+        if not courses:
+            finish_job_stats(stats, 'failed')
+            return
+
+        # بدون await بين تحديث فهرس النتائج وإضافة من سجلوا أثناء المعالجة (انظر add_late_registrants)
+        for job, course_result, _ in courses:
+            apply_course_result(course_result)
+            if stage == 'parse':
+                add_late_registrants(course_result)
+            stats.counts['rows'] += len(course_result.rows)
+            stats.counts['students'] += len(course_result.students)
+
+        # نتائج كل طالب في مواد الدفعة (بترتيب وصول الملفات)
+        student_courses = {}
+        for job, course_result, _ in courses:
+            for user_id in course_recipients(course_result, previous_grades[job['job_id']]):
+                student_courses.setdefault(user_id, []).append((course_result, course_result.students[user_id]))
+
+        if stage == 'parse':
+            add_deliveries(batch_id, list(student_courses))
+            stage = 'deliver'
+            for job, _, _ in courses:
+                set_job_stage(job['job_id'], stage)
+
+        # 2. رسالة واحدة لكل طالب بكل مواده
+        if stage == 'deliver':
+            uncertain = mark_uncertain_deliveries(batch_id)
+            if uncertain:
+                await notify(
+                    f"⚠️ {uncertain} طالب بدأ إرسال نتيجتهم قبل توقف البوت ولا يمكن التأكد من وصولها.\n"
+                    "لن تُعاد لهم النتيجة تجنباً للتكرار (يمكنهم استخدام /mygrades)."
+                )
+            pending = [user_id for user_id, state in get_delivery_states(batch_id).items() if state == 'pending']
+
+            delivery_jobs = []
+            for user_id in pending:
+                results = student_courses.get(user_id)
+                if not results:
+                    continue
+                album = []
+                for course_result, result in results:
+                    render_photo, photo_key = result_photo(course_result, result)
+                    caption = (
+                        result_message(result.student_id, result.display_name, result.grade, result.percentile)
+                        + f"\nالمادة: {course_result.course_name}"
+                    )
+                    album.append(AlbumPhoto(caption, render_photo, photo_key))
+                delivery_jobs.append(DeliveryJob(
+                    chat_id=user_id,
+                    caption=album[0].caption,
+                    render_photo=album[0].render_photo,
+                    label=results[0][1].student_id,
+                    photo_key=album[0].photo_key,
+                    album=album if len(album) > 1 else None
+                ))
+
+            if delivery_jobs:
+                await deliver_results(bot, delivery_jobs, batch_id, stats, notify)
+            stage = 'report'
+            for job, _, _ in courses:
+                set_job_stage(job['job_id'], stage)
+
+        # 3. حفظ الملفات بعد الإرسال: إعادة نشرها لاحقاً لن تعيد المعالجة
+        for job, course_result, _ in courses:
+            save_processed_file(job['file_hash'], course_result.course_name, course_result.rows,
+                                course_result.mean, course_result.std_dev)
+
+        # 4. تقرير مشرف واحد لكل مواد الدفعة (الخطوط تُضمن مرة واحدة)
+        with stats.stage('admin_report'):
+            admin_pdf_buffer, worker_metrics = await run_in_pool(
+                render_admin_reports, [admin_report for _, _, admin_report in courses]
             )
-        finally:
-            # 7. تنظيف الملف المؤقت
-            if pdf_path and os.path.exists(pdf_path):
-                os.remove(pdf_path)
-    else:
-        await update.message.reply_text("الرجاء إرسال ملف علامات بصيغة PDF.")
+            metrics.merge(worker_metrics)
+            stats.add_worker_stages(worker_metrics)
+            if admin_pdf_buffer:
+                await bot.send_document(
+                    chat_id=STATISTICS_OUTPUT_CHANNEL_ID,
+                    document=admin_pdf_buffer,
+                    filename=f"تقرير_علامات_دفعة_{batch_id}.pdf",
+                    caption=f"✅ تم الانتهاء من معالجة {len(courses)} ملفات علامات ({course_names}).\n\n"
+                            "التقرير الإحصائي الشامل لكل المواد مرفق."
+                )
+        await notify("✅ تم الانتهاء من معالجة الدفعة وإرسال التقرير الإحصائي إلى قناة المشرف.")
+        for job, _, _ in courses:
+            finish_job(job['job_id'], 'done')
+            remove_pdf(job)
+        finish_job_stats(stats, 'done')
+
+    except Exception as e:
+        logger.error(f"خطأ أثناء معالجة دفعة ملفات العلامات: {e}")
+        for job in jobs:
+            finish_job(job['job_id'], 'failed', str(e))
+            remove_pdf(job)
+        finish_job_stats(stats, 'failed')
+        await notify(f"❌ خطأ فادح أثناء معالجة دفعة ملفات العلامات ({course_names}):\n{e}")
+
+
+async def post_init(application: Application) -> None:
+    """
+    بدء قائمة انتظار الملفات (مع استئناف الملفات التي توقفت قبل إعادة التشغيل).
+    العمليات العاملة (matplotlib والخطوط) تبدأ عند أول ملف، أو في الخلفية بعد PREWARM_DELAY
+    ثانية حتى لا تنافس الرد على أول الرسائل بعد إعادة التشغيل.
+    """
+    global grades_queue, prewarm_task
+    grades_queue = JobQueue(partial(run_grades_job, application.bot),
+                            batch_handler=partial(run_grades_batch, application.bot))
+    grades_queue.start()
+    if PREWARM_DELAY is not None:
+        prewarm_task = asyncio.create_task(prewarm(PREWARM_DELAY))
+
+async def post_shutdown(application: Application) -> None:
+    if prewarm_task is not None:
+        prewarm_task.cancel()
+    if grades_queue is not None:
+        await grades_queue.stop()
+    shutdown_workers()
 
 
 def main() -> None:
     """تبدأ تشغيل البوت."""
-    # تهيئة قاعدة البيانات
+    # تهيئة قاعدة البيانات وتحميل الطلاب المسجلين في الذاكرة
     init_db()
+    warm_student_cache()
     
     # إنشاء التطبيق
-    application = Application.builder().token(TELEGRAM_BOT_TOKEN).build()
+    application = (
+        Application.builder()
+        .token(TELEGRAM_BOT_TOKEN)
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+        .build()
+    )
 
     # إضافة معالجات الأوامر
     application.add_handler(CommandHandler("start", start))
+    # block=False: توليد المخطط قد ينتظر عملية عاملة مشغولة بمعالجة ملف
+    application.add_handler(CommandHandler("mygrades", my_grades, block=False))
+    application.add_handler(CommandHandler("stats", stats))
     
     # معالج الرسائل النصية (للتسجيل)
     application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_registration))
     
     # معالج المستندات (لتحليل ملفات PDF)
-    application.add_handler(MessageHandler(filters.Document.ALL, handle_document))
+    # block=False: معالجة الملف لا تمنع البوت من الرد على الرسائل الأخرى في نفس الوقت
+    application.add_handler(MessageHandler(filters.Document.ALL, handle_document, block=False))
 
     # بدء تشغيل البوت
     logger.info("بدء تشغيل البوت...")
     application.run_polling(allowed_updates=Update.ALL_TYPES)
+    close_connection()
 
 if __name__ == '__main__':
     main()
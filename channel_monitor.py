@@ -1,10 +1,13 @@
 # channel_monitor.py
 import logging
 import os
+from collections import OrderedDict
 from pyrogram import Client, filters
 from pyrogram.handlers import MessageHandler
 from pyrogram.errors import SessionPasswordNeeded, PhoneCodeInvalid, FloodWait
-from config import TELEGRAM_BOT_TOKEN # نحتاج فقط للتوكن للحصول على اسم البوت
+from config import TELEGRAM_BOT_TOKEN, STATISTICS_OUTPUT_CHANNEL_ID # نحتاج للتوكن للحصول على اسم البوت
+from database import init_db
+from job_queue import job_pdf_path, submit_file
 
 # إعداد التسجيل (Logging)
 logging.basicConfig(
@@ -19,10 +22,16 @@ API_HASH = "19095cb702477bb170752463a3cd46a0" # استبدل بـ API Hash ال
 BOT_USERNAME = "My_gradesbot" # اسم المستخدم للبوت الرسمي (بدون @)
 TARGET_CHANNEL_USERNAME = "jjgradebot" # اسم مستخدم القناة التي سيتم مراقبتها (بدون @)
 
+# الملفات التي تمت إعادة توجيهها مؤخراً (file_unique_id ثابت لنفس محتوى الملف في تليجرام)
+FORWARDED_FILES_MEMORY = 256
+_forwarded_files = OrderedDict()
+
 # --- دالة معالجة رسائل القناة ---
 async def handle_channel_post(client, message):
     """
-    تستمع لرسائل القناة، وإذا كان الملف المرفق هو PDF ومن القناة المستهدفة، تعيد توجيهه إلى البوت الرسمي.
+    تستمع لرسائل القناة، وإذا كان الملف المرفق هو PDF ومن القناة المستهدفة، تضيفه مباشرة
+    إلى قائمة انتظار البوت (جدول jobs في قاعدة البيانات المشتركة).
+    إذا تعذر ذلك، تعيد توجيهه إلى البوت الرسمي كما في السابق.
     """
     
     # 1. التحقق من القناة المستهدفة
@@ -33,11 +42,36 @@ async def handle_channel_post(client, message):
     # 2. التحقق من نوع الملف
     if message.document and message.document.mime_type == "application/pdf":
         logger.info(f"تم العثور على ملف PDF جديد في القناة المستهدفة: @{TARGET_CHANNEL_USERNAME}")
+
+        # إعادة نشر نفس الملف: لا داعي لإعادة توجيهه (البوت يتجاهل المكرر أيضاً حسب بصمة المحتوى)
+        file_unique_id = message.document.file_unique_id
+        if file_unique_id in _forwarded_files:
+            logger.info(f"تجاهل ملف PDF مكرر تمت إعادة توجيهه سابقاً: {message.document.file_name}")
+            return
         
+        try:
+            # تنزيل الملف وإضافته إلى قائمة الانتظار (البوت يلتقطه عند الفحص الدوري)
+            pdf_path = job_pdf_path(f"{file_unique_id}_{message.id}", message.document.file_name)
+            await message.download(file_name=pdf_path)
+            course_name = message.document.file_name.replace(".pdf", "")
+            status, info = submit_file(pdf_path, course_name, STATISTICS_OUTPUT_CHANNEL_ID)
+            if status == 'error':
+                raise RuntimeError("تعذر إضافة الملف إلى قائمة الانتظار")
+            logger.info(f"ملف {message.document.file_name}: {status} ({info})")
+            _forwarded_files[file_unique_id] = True
+            while len(_forwarded_files) > FORWARDED_FILES_MEMORY:
+                _forwarded_files.popitem(last=False)
+            return
+        except Exception as e:
+            logger.error(f"فشل إضافة الملف إلى قائمة الانتظار، سيتم إعادة توجيهه بدلاً من ذلك: {e}")
+
         try:
             # إعادة توجيه الرسالة إلى البوت الرسمي
             await message.forward(BOT_USERNAME)
             logger.info(f"تم إعادة توجيه ملف PDF بنجاح إلى البوت: @{BOT_USERNAME}")
+            _forwarded_files[file_unique_id] = True
+            while len(_forwarded_files) > FORWARDED_FILES_MEMORY:
+                _forwarded_files.popitem(last=False)
             
         except FloodWait as e:
             logger.error(f"FloodWait: يجب الانتظار {e.value} ثوانٍ قبل إرسال المزيد.")
@@ -55,6 +89,9 @@ def main():
         logger.error("يرجى تعديل ملف channel_monitor.py وإضافة API_ID و API_HASH الخاصين بك.")
         return
         
+    # جداول قائمة الانتظار في قاعدة البيانات المشتركة مع البوت
+    init_db()
+
     # إنشاء العميل (Client)
     app = Client("my_account", api_id=API_ID, api_hash=API_HASH)
     
@@ -7,6 +7,10 @@ TELEGRAM_CHANNEL_USERNAME = "jjgradebot" # مثال: @Aleppo_Med_Marks
 
 # إعدادات قاعدة البيانات
 DB_NAME = "students_marks.db"
+DB_CACHE_SIZE_KB = 16384 # ذاكرة صفحات SQLite لكل اتصال (16 ميغابايت)
+DB_MMAP_SIZE = 268435456 # حجم mmap (256 ميغابايت)
+DB_STATEMENT_CACHE = 256 # عدد الاستعلامات المحضرة (Prepared statements) المحفوظة لكل اتصال
+DB_BUSY_TIMEOUT = 30 # ثوانٍ انتظار القفل عند الكتابة المتزامنة
 
 # إعدادات الجامعة والكلية
 # يمكن توسيع هذه القائمة لاحقاً
@@ -19,6 +23,16 @@ UNIVERSITIES = {
 # إعدادات ملف العلامات
 MARKS_PDF_PATH = "marks.pdf" # المسار الذي سيتم حفظ ملف العلامات فيه مؤقتاً
 
+# قائمة انتظار ملفات العلامات (محفوظة في قاعدة البيانات لاستئناف المعالجة بعد إعادة التشغيل)
+JOBS_DIR = "jobs" # مجلد ملفات PDF المنتظرة (تُحذف بعد انتهاء المعالجة)
+JOB_WORKERS = 1 # عدد الملفات التي تُعالج في نفس الوقت (كل ملف يستهلك حد الإرسال كاملاً)
+JOB_POLL_INTERVAL = 5 # ثوانٍ بين كل فحص لقائمة الانتظار (للملفات المضافة من channel_monitor)
+# وضع الدفعات: الملفات التي تصل بفاصل أقل من BATCH_IDLE_GAP ثانية تُعالج معاً (تحليل على التوازي،
+# قائمة المسجلين مرة واحدة، رسالة واحدة لكل طالب بكل مواده، وتقرير مشرف واحد). None: كل ملف وحده
+BATCH_WINDOW = 15 # أقصى مدة لتجميع الدفعة من وصول أول ملف (ثوانٍ)
+BATCH_IDLE_GAP = 2 # تُغلق الدفعة إذا لم يصل ملف جديد خلال هذه المدة (ملف وحيد ينتظر هذه المدة فقط)
+BATCH_MAX_FILES = 20 # أقصى عدد ملفات في الدفعة الواحدة
+
 # إعدادات التحليل الإحصائي
 # يجب استبداله بمعرف القناة (Channel ID) التي سيرسل إليها البوت النتائج الإحصائية
 # يجب أن يكون المعرف على شكل -100xxxxxxxxxx
@@ -28,3 +42,46 @@ NORMAL_DISTRIBUTION_IMAGE = "Normal_Distribution.png"
 
 # قائمة بمعرفات المستخدمين (Telegram IDs) المسموح لهم بإرسال ملفات العلامات
 ADMIN_IDS = [1406058239] # استبدل بمعرف التليجرام الخاص بك
+
+# إعدادات إرسال النتائج للطلاب
+# حد تليجرام العام حوالي 30 رسالة/ثانية، نترك هامشاً للأمان
+DELIVERY_RATE_PER_SECOND = 25
+DELIVERY_BURST = 1 # عدد الرسائل المسموح إرسالها دفعة واحدة
+DELIVERY_CONCURRENCY = 16 # عدد عمليات الإرسال المتزامنة
+DELIVERY_PER_CHAT_INTERVAL = 1.0 # أقل فاصل (بالثواني) بين رسالتين لنفس المحادثة
+DELIVERY_MAX_RETRIES = 5
+DELIVERY_PROGRESS_INTERVAL = 5 # كل كم ثانية يتم تحديث رسالة التقدم للمشرف
+PHOTO_CACHE_SIZE = 20000 # عدد معرفات الصور (file_id) المحفوظة لإعادة إرسال المخططات بدون رفع
+
+# حجم ذاكرة التخزين المؤقت لتصحيح النصوص العربية (fix_arabic)
+ARABIC_CACHE_SIZE = 8192
+
+# عدد العمليات العاملة (Processes) لتحليل ملفات PDF والحسابات ورسم المخططات
+WORKER_PROCESSES = 2
+
+# تشغيل العمليات العاملة وتحميل مكتبات النصوص العربية في الخلفية بعد بدء البوت بعدد من الثواني
+# (None: لا تحميل مسبق، تُحمّل عند أول ملف علامات)
+PREWARM_DELAY = 5
+
+# إعدادات تحليل ملفات PDF على التوازي
+PDF_PAGES_PER_WORKER = 10 # أقل عدد صفحات يستحق عملية مستقلة
+PDF_PARSE_MAX_WORKERS = 4
+
+# تعلم تخطيط جدول العلامات (أماكن الأعمدة) من الصفحات الأولى ثم استخدام مسار استخراج أسرع
+PDF_LAYOUT_PROBE_PAGES = 3 # أقصى عدد صفحات تُفحص لاكتشاف التخطيط
+PDF_LAYOUT_CACHE_SIZE = 32 # عدد التخطيطات المحفوظة (لكل شكل ملف مختلف)
+
+# عدد الأسماء التي تُحدث في قاعدة البيانات في كل دفعة أثناء قراءة ملف العلامات
+NAME_UPDATE_CHUNK = 500
+
+# عدد ملخصات المواد المحفوظة في الذاكرة لأمر /mygrades
+COURSE_AGGREGATES_CACHE_SIZE = 64
+
+# إعدادات أعمدة مخطط التوزيع (مشتركة بين المعالجة والرسم وأمر /mygrades)
+HIST_BINS = 100
+HIST_RANGE = (0, 100)
+
+# مقاييس الأداء: ملف نصي بصيغة Prometheus يُحدث بعد كل ملف علامات (None: بدون ملف)
+METRICS_FILE = "metrics.prom"
+METRICS_PREFIX = "marks_bot"
+METRICS_JOB_HISTORY = 20 # عدد الملفات الأخيرة في أمر /stats
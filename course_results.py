@@ -0,0 +1,50 @@
+import numpy as np
+from config import HIST_BINS, HIST_RANGE
+from arabic_text import fix_arabic
+
+# نتائج مادة بعد معالجة ملف العلامات. تُنشأ في العملية العاملة وتُرسل إلى البوت:
+# هذا الملف لا يستورد pandas أو matplotlib أو fpdf حتى لا تُحمّل في عملية البوت.
+
+
+class StudentResult:
+    """نتيجة طالب واحد في مادة: درجته ونسبته المئوية وترتيبه فقط (بدون نسخة من علامات المادة)."""
+    __slots__ = ('user_id', 'student_id', 'student_name', 'display_name', 'grade', 'percentile', 'rank')
+
+    def __init__(self, user_id, student_id, student_name, display_name, grade, percentile, rank):
+        self.user_id = user_id
+        self.student_id = student_id
+        self.student_name = student_name
+        self.display_name = display_name
+        self.grade = grade
+        self.percentile = percentile
+        self.rank = rank
+
+class CourseResult:
+    """
+    نتائج مادة واحدة مشتركة بين كل الطلاب: مصفوفة NumPy واحدة للعلامات،
+    المتوسط والانحراف المعياري وعدد الطلاب في كل عمود من أعمدة المخطط.
+    """
+
+    def __init__(self, course_name, grades, mean, std_dev, bin_counts=None):
+        self.course_name = course_name
+        self.grades = np.asarray(grades, dtype=np.float64)
+        self.mean = float(mean)
+        self.std_dev = float(std_dev)
+        self.bin_edges = np.linspace(HIST_RANGE[0], HIST_RANGE[1], HIST_BINS + 1)
+        if bin_counts is None:
+            bin_counts, _ = np.histogram(self.grades, bins=self.bin_edges)
+        self.bin_counts = np.asarray(bin_counts)
+        # مفتاح المخطط الأساسي للمادة (ذاكرة المخططات في العمليات العاملة وذاكرة الصور)
+        self.histogram_key = (course_name, self.bin_counts.tobytes())
+        # الطلاب المسجلون فقط: user_id -> StudentResult
+        self.students = {}
+        # كل الصفوف المستخرجة من الملف (الرقم الجامعي، الاسم، العلامة) لحفظها في processed_files
+        self.rows = []
+
+    def add_student(self, user_id, student_id, student_name, grade, percentile, rank):
+        """يضيف نتيجة طالب مسجل (مع الاسم المصحح للعرض في رسالة تليجرام)."""
+        display_name = fix_arabic(student_name)[::-1] if student_name else 'غير متوفر'
+        self.students[user_id] = StudentResult(
+            user_id, student_id, student_name, display_name,
+            float(grade), float(percentile), rank
+        )
@@ -1,240 +1,192 @@
-import pandas as pd
 import numpy as np
-from scipy.stats import norm
-import matplotlib.pyplot as plt
-from fpdf import FPDF
 import logging
-import io
-import arabic_reshaper
-from bidi.algorithm import get_display
-from database import get_all_students, get_student_info_by_id, update_student_name
+from config import NAME_UPDATE_CHUNK, HIST_BINS, HIST_RANGE
+from metrics import metrics
+from database import get_all_students, update_student_names_bulk, save_course_grades
+from pdf_parser import iter_grade_rows
+from course_results import CourseResult
+from report_engine import create_admin_report_pdf, has_name
+from arabic_text import cache_stats as arabic_cache_stats
 
 logger = logging.getLogger(__name__)
 
-# دالة تصحيح النص العربي
-def fix_arabic(text):
-    """تصحح النص العربي ليعرض بشكل صحيح (تشكيل وعرض من اليمين لليسار)."""
-    if not text:
-        return ""
-    # 1. تشكيل الحروف (ربطها)
-    reshaped_text = arabic_reshaper.reshape(str(text))
-    # 2. عكس اتجاه النص (RTL)
-    bidi_text = get_display(reshaped_text)
-    return bidi_text
-
-# إعداد الخط العربي لـ Matplotlib (نحتفظ بـ DejaVu هنا لأنه يعمل بشكل جيد مع Matplotlib)
-plt.rcParams['font.family'] = 'DejaVu Sans'
-plt.rcParams['font.sans-serif'] = ['DejaVu Sans']
-plt.rcParams['axes.unicode_minus'] = False # لدعم إشارة السالب
-
-# ... (في data_processor.py)
-
-def create_grades_histogram(grades, student_grade):
+def _is_null(value):
+    """None أو NaN (القيم التي كان combine_first يعتبرها فارغة)."""
+    return value is None or (isinstance(value, float) and np.isnan(value))
+
+def grade_statistics(grades):
     """
-    ينشئ مخطط أعمدة (Histogram) لتوزيع العلامات ويضع علامة على درجة الطالب.
+    نواة الإحصائيات (NumPy فقط، بدون DataFrame):
+    - المتوسط والانحراف المعياري للعينة (ddof=1) بنفس خطوات pandas.
+    - النسبة المئوية بمتوسط ترتيب العلامات المتساوية (مثل rank(pct=True)) مقربة لخانتين.
+    - ترتيب الصفوف تنازلياً حسب العلامة (نفس ترتيب sort_values للعلامات المتساوية).
+    يعيد (mean, std_dev, percentiles, order, sorted_grades) حيث order فهارس الصفوف من الأعلى علامة
+    و sorted_grades العلامات مرتبة تصاعدياً.
     """
-    fig, ax = plt.subplots(figsize=(8, 5))
-    
-    # رسم مخطط الأعمدة
-    # نستخدم weights لتلوين العمود الخاص بدرجة الطالب
-    
-    # 1. إنشاء بيانات الأعمدة
-    counts, bins, patches = ax.hist(grades, bins=100, range=(0, 100), edgecolor='black', alpha=0.7, color='skyblue')
-    
-    # 2. تلوين العمود الخاص بدرجة الطالب
-    for patch, bin_start, bin_end in zip(patches, bins[:-1], bins[1:]):
-        if bin_start <= student_grade < bin_end:
-            patch.set_facecolor('red')
-            break
-    
-    # وضع علامة على درجة الطالب
-    ax.axvline(student_grade, color='red', linestyle='--', linewidth=2, label=fix_arabic(f'درجتك: {student_grade}'))
-
-    # إعداد المحاور والعناوين
-    ax.set_title(fix_arabic('توزيع العلامات (مخطط الأعمدة)'), fontsize=14)
-    ax.set_xlabel(fix_arabic('الدرجة'), fontsize=12)
-    ax.set_ylabel(fix_arabic('عدد الطلاب'), fontsize=12)
-    
-    # تطبيق fix_arabic على مفتاح الرسم
-    ax.legend(loc='upper left')
-    ax.grid(axis='y', alpha=0.5)
-    
-    # حفظ المخطط في مخزن مؤقت
-    buf = io.BytesIO()
-    plt.savefig(buf, format='png', bbox_inches='tight')
-    plt.close(fig)
-    buf.seek(0)
-    return buf
-
-class PDF(FPDF):
-    """فئة مخصصة لإنشاء تقارير PDF تدعم اللغة العربية."""
-    def header(self):
-        # تم تطبيق fix_arabic
-        self.set_font('Noto', 'B', 15)
-        self.cell(0, 10, fix_arabic('تقرير إحصائيات العلامات'), 0, 1, 'C')
-
-    def footer(self):
-        self.set_y(-15)
-        # تم تطبيق fix_arabic
-        self.set_font('Noto', 'I', 8)
-        self.cell(0, 10, fix_arabic(f'صفحة {self.page_no()}/{{nb}}'), 0, 0, 'C')
-
-# ... (باقي الدوال)
-
-def create_admin_report_pdf(admin_report_df, mean_grade, std_dev, course_name):
+    grades = np.asarray(grades, dtype=np.float64)
+    count = len(grades)
+    mean = grades.sum() / count
+    std_dev = np.sqrt(((grades - mean) ** 2).sum() / (count - 1)) if count > 1 else np.nan
+
+    # ترتيب تنازلي بنفس خطوات sort_values(ascending=False) في pandas:
+    # فرز تصاعدي للمصفوفة معكوسة ثم عكس النتيجة، فيبقى ترتيب العلامات المتساوية كما كان
+    reversed_order = np.argsort(grades[::-1], kind='quicksort')
+    sorted_grades = grades[::-1][reversed_order]
+    order = (count - 1 - reversed_order)[::-1]
+
+    # العلامات المتساوية تأخذ متوسط ترتيبها: (أول ترتيب + آخر ترتيب) / 2
+    below = np.searchsorted(sorted_grades, grades, side='left')
+    up_to = np.searchsorted(sorted_grades, grades, side='right')
+    percentiles = np.round((below + 1 + up_to) / 2 / count * 100, 2)
+    return mean, std_dev, percentiles, order, sorted_grades
+
+def join_registered(student_ids, student_names, registered_students):
     """
-    ينشئ تقرير PDF شامل للمشرف يحتوي على الإحصائيات وجدول الترتيب.
+    يربط صفوف الملف بالطلاب المسجلين عبر قاموس (الرقم الجامعي -> user_id والاسم المحفوظ).
+    يعيد (user_ids, final_names): user_id أو None لكل صف، والاسم من الملف إن وجد وإلا من قاعدة البيانات.
     """
-    pdf = PDF('P', 'mm', 'A4')
-    
-    # إضافة خطوط Noto Sans (المسار المحلي)
-    pdf.add_font('Noto', '', 'fonts/NotoSansArabic-Regular.ttf', uni=True)
-    pdf.add_font('Noto', 'B', 'fonts/NotoSansArabic-Bold.ttf', uni=True)
-    pdf.add_font('Noto', 'I', 'fonts/NotoSansArabic-Regular.ttf', uni=True) # إضافة خط مائل (نستخدم العادي)
-    
-    pdf.set_auto_page_break(auto=True, margin=15)
-    pdf.alias_nb_pages()
-    pdf.add_page()
-    
-    # استخدام خط Noto
-    pdf.set_font('Noto', '', 12)
-
-    # الإحصائيات العامة
-    # تم تطبيق fix_arabic
-    pdf.cell(0, 10, fix_arabic(f'المادة: {course_name}'), 0, 1, 'R')
-    pdf.cell(0, 10, fix_arabic(f'متوسط الدرجات: {mean_grade:.2f}'), 0, 1, 'R')
-    pdf.cell(0, 10, fix_arabic(f'الانحراف المعياري: {std_dev:.2f}'), 0, 1, 'R')
-    pdf.ln(5)
-
-    # جدول الترتيب
-    pdf.set_font('Noto', 'B', 10) # استخدام خط Noto
-    col_widths = [20, 30, 60, 20, 30] # عرض الأعمدة
-    
-    # رؤوس الجدول (بالعربية، تحتاج إلى ترتيب عكسي)
-    headers = ['النسبة المئوية', 'الدرجة', 'اسم الطالب', 'الرقم الجامعي', 'الترتيب']
-    
-    # رسم رؤوس الجدول
-    pdf.set_fill_color(200, 220, 255)
-    for i, header in enumerate(reversed(headers)):
-        # تم تطبيق fix_arabic
-        pdf.cell(col_widths[i], 7, fix_arabic(header), 1, 0, 'C', 1)
-    pdf.ln()
-
-    # محتوى الجدول
-    pdf.set_font('Noto', '', 10) # استخدام خط Noto
-    
-    # تعريف ألوان التلوين
-    RED_FILL = (255, 200, 200) # لون أحمر فاتح للخلفية
-    NO_FILL = (255, 255, 255) # لون أبيض للخلفية
-
-    for index, row in admin_report_df.iterrows():
-        # البيانات بترتيب عكسي لتناسب العرض من اليمين لليسار
-        data = [
-            f'{row["النسبة المئوية"]:.2f}%',
-            f'{row["الدرجة"]:.2f}',
-                        # تصحيح الاسم: نستخدم fix_arabic ثم نعكسه مرة أخرى لتعويض انعكاس fpdf2
-            fix_arabic(row["اسم الطالب"])[::-1] if row["اسم الطالب"] else fix_arabic('غير متوفر'),
-
-            row["الرقم الجامعي"],
-            str(row["الترتيب"])
-        ]
-        
-        # تحديد ترتيب الأعمدة لتلوين عمود العلامة (العمود الثاني من اليسار، الثالث من اليمين)
-        # الترتيب العكسي: [الترتيب, الرقم الجامعي, الاسم, الدرجة, النسبة المئوية]
-        # الدرجة هي العنصر الرابع في القائمة العكسية (i=3)
-        
-        for i, item in enumerate(reversed(data)):
-            # تحديد لون الخلفية: أحمر للدرجة، أبيض للباقي
-            fill_color = RED_FILL if i == 3 else NO_FILL
-            pdf.set_fill_color(*fill_color)
-            
-            # تطبيق fix_arabic على النص الذي قد يكون عربياً
-            pdf.cell(col_widths[i], 6, fix_arabic(str(item)), 1, 0, 'C', 1) # 1 لتفعيل التلوين
-        pdf.ln()
-
-    # إعادة تعيين لون الخلفية
-    pdf.set_fill_color(*NO_FILL)
-    
-    # حفظ التقرير في مخزن مؤقت (تم تصحيح مشكلة bytearray)
-    pdf_output = pdf.output(dest='S')
-    if isinstance(pdf_output, str):
-        pdf_buffer = io.BytesIO(pdf_output.encode('latin1'))
-    else:
-        pdf_buffer = io.BytesIO(pdf_output)
-        
-    pdf_buffer.seek(0)
-    return pdf_buffer
-
-def process_grades(grades_data, course_name="المادة"):
+    registered = {str(student_id): (user_id, name) for user_id, student_id, name, _, _ in registered_students}
+    user_ids, final_names = [], []
+    for student_id, student_name in zip(student_ids, student_names):
+        user_id, db_name = registered.get(student_id, (None, None))
+        user_ids.append(user_id)
+        final_names.append(db_name if _is_null(student_name) else student_name)
+    return user_ids, final_names
+
+def _unpack_row(row):
+    """يقبل صف العلامات كقاموس (الواجهة القديمة) أو GradeRow."""
+    if isinstance(row, dict):
+        return row['student_id'], row.get('student_name'), row['grade']
+    return row
+
+def process_grades(grades_data, course_name="المادة", registered_students=None, render_report=True):
     """
     يعالج بيانات العلامات، ويحدث أسماء الطلاب في قاعدة البيانات،
     ويجهز البيانات لإرسالها للطلاب ولتقرير المشرف.
+    grades_data: قائمة أو مولد (Generator) صفوف؛ يتم استهلاكه تدريجياً:
+    الأسماء تُحدث على دفعات ومخطط التوزيع يُحسب أثناء القراءة.
+    registered_students: صفوف get_all_students محملة مسبقاً (مشتركة بين ملفات الدفعة)، أو None للقراءة من قاعدة البيانات.
+    render_report=False: يعيد بيانات تقرير المشرف (admin_report_data, mean, std_dev, course_name)
+    بدلاً من ملف PDF، لتجميع تقارير عدة مواد في ملف واحد.
     """
-    if not grades_data:
+    # 1. قراءة الصفوف تدريجياً
+    student_ids, student_names, grades = [], [], []
+    bin_edges = np.linspace(HIST_RANGE[0], HIST_RANGE[1], HIST_BINS + 1)
+    bin_counts = np.zeros(HIST_BINS, dtype=np.int64)
+    pending_names = []
+    name_counts = {'updated': 0, 'skipped': 0}
+    counted = 0
+    arabic_before = arabic_cache_stats()
+
+    def flush():
+        # 2. تحديث أسماء الطلاب في قاعدة البيانات (معاملة واحدة لكل دفعة) وتحديث المخطط
+        nonlocal counted
+        with metrics.timer('stage', stage='names'):
+            result = update_student_names_bulk(pending_names)
+            name_counts['updated'] += result['updated']
+            name_counts['skipped'] += result['skipped']
+            pending_names.clear()
+            bin_counts[:] += np.histogram(grades[counted:], bins=bin_edges)[0]
+            counted = len(grades)
+
+    for row in grades_data:
+        student_id, student_name, grade = _unpack_row(row)
+        try:
+            grade = float(grade)
+        except (TypeError, ValueError):
+            continue
+        if np.isnan(grade):
+            continue
+        student_id = str(student_id)
+        student_ids.append(student_id)
+        student_names.append(student_name)
+        grades.append(grade)
+        if has_name(student_name):
+            pending_names.append((student_id, student_name))
+            if len(pending_names) >= NAME_UPDATE_CHUNK:
+                flush()
+    flush()
+
+    if not grades:
         logger.warning("لا توجد بيانات علامات للمعالجة.")
         return None, None
-
-    # 1. إنشاء DataFrame
-    df = pd.DataFrame(grades_data)
-    df['student_id'] = df['student_id'].astype(str)
-    df['grade'] = pd.to_numeric(df['grade'], errors='coerce')
-    df.dropna(subset=['grade'], inplace=True)
-
-    # 2. تحديث أسماء الطلاب في قاعدة البيانات
-    for index, row in df.iterrows():
-        student_id = row['student_id']
-        student_name = row['student_name']
-        
-        if student_name and pd.notna(student_name):
-            # تحديث الاسم في قاعدة البيانات
-            update_student_name(student_id, student_name)
-
-    # 3. حساب الإحصائيات
-    mean_grade = df['grade'].mean()
-    std_dev = df['grade'].std()
-    
-    # 4. حساب النسبة المئوية (Percentile)
-    df['percentile'] = df['grade'].rank(pct=True) * 100
-    df['percentile'] = df['percentile'].round(2)
-
-    # 5. دمج بيانات الطلاب المسجلين
-    registered_students = get_all_students()
-    registered_df = pd.DataFrame(registered_students, columns=['user_id', 'student_id', 'student_name_db', 'university', 'college'])
-    registered_df['student_id'] = registered_df['student_id'].astype(str)
-
-    # دمج البيانات: نستخدم الاسم المستخرج من PDF إذا كان موجوداً، وإلا نستخدم الاسم من قاعدة البيانات
-    merged_df = pd.merge(df, registered_df, on='student_id', how='left')
-    
-    # استخدام الاسم المستخرج من PDF إذا كان موجوداً، وإلا الاسم من قاعدة البيانات
-    merged_df['final_name'] = merged_df['student_name'].combine_first(merged_df['student_name_db'])
-    
-    # 6. تجهيز بيانات تقرير المشرف (مع الترتيب والاسم)
-    admin_report_df = merged_df.sort_values(by='grade', ascending=False).reset_index(drop=True)
-    admin_report_df['Rank'] = admin_report_df.index + 1
-    
-    # اختيار الأعمدة للتقرير
-    admin_report_data = admin_report_df[['Rank', 'student_id', 'final_name', 'grade', 'percentile']].rename(columns={
-        'Rank': 'الترتيب',
-        'student_id': 'الرقم الجامعي',
-        'final_name': 'اسم الطالب',
-        'grade': 'الدرجة',
-        'percentile': 'النسبة المئوية'
-    })
-
-    # 7. تجهيز بيانات الطلاب الفردية
-    student_results = {}
-    for index, row in merged_df.iterrows():
-        user_id = row['user_id']
-        if pd.notna(user_id):
-            student_results[int(user_id)] = {
-                'grade': row['grade'],
-                'percentile': row['percentile'],
-                'mean': mean_grade,
-                'std_dev': std_dev,
-                'all_grades': df['grade'].tolist()
-            }
+    logger.info(f"أسماء الطلاب: {name_counts['updated']} محدث، {name_counts['skipped']} بدون تغيير أو غير مسجل.")
+
+    metrics.inc('rows', len(grades))
+    metrics.inc('names', name_counts['updated'], result='updated')
+    metrics.inc('names', name_counts['skipped'], result='skipped')
+
+    with metrics.timer('stage', stage='statistics'):
+        grade_array = np.asarray(grades, dtype=np.float64)
+
+        # 3-4. حساب الإحصائيات والنسبة المئوية (Percentile) والترتيب
+        mean_grade, std_dev, percentiles, order, sorted_grades = grade_statistics(grade_array)
+        ranks = np.empty(len(grade_array), dtype=np.int64)
+        ranks[order] = np.arange(1, len(order) + 1)
+
+        # 5. دمج بيانات الطلاب المسجلين
+        # نستخدم الاسم المستخرج من PDF إذا كان موجوداً، وإلا الاسم من قاعدة البيانات
+        if registered_students is None:
+            registered_students = get_all_students()
+        user_ids, final_names = join_registered(student_ids, student_names, registered_students)
+
+        # 6. تجهيز بيانات تقرير المشرف (مع الترتيب والاسم)
+        admin_report_data = {
+            'الترتيب': np.arange(1, len(order) + 1),
+            'الرقم الجامعي': [student_ids[i] for i in order],
+            'اسم الطالب': [final_names[i] for i in order],
+            'الدرجة': grade_array[order],
+            'النسبة المئوية': percentiles[order],
+        }
+
+        # 7. تجهيز بيانات الطلاب الفردية (مصفوفة العلامات مشتركة في CourseResult وليست نسخة لكل طالب)
+        course_result = CourseResult(course_name, grade_array, mean_grade, std_dev, bin_counts=bin_counts)
+        course_result.rows = list(zip(student_ids, student_names, grades))
+        for index, user_id in enumerate(user_ids):
+            if user_id is not None:
+                course_result.add_student(
+                    int(user_id), student_ids[index], final_names[index],
+                    grade_array[index], percentiles[index], int(ranks[index])
+                )
+
+    # حفظ علامات المادة كاملة في سجل العلامات (معاملة واحدة)
+    with metrics.timer('stage', stage='save_grades'):
+        save_course_grades(
+            course_name,
+            zip(student_ids, grade_array, percentiles, ranks),
+            mean_grade, std_dev,
+            # ملخص المادة لاستعلامات /mygrades (بحث ثنائي بدلاً من إعادة الحساب)
+            bin_counts=bin_counts.astype(np.int64).tobytes(),
+            sorted_grades=sorted_grades.tobytes(),
+            # الأسماء لنتائج الطلاب الذين يسجلون لاحقاً (فهرس النتائج)
+            student_names={student_id: name for student_id, name in zip(student_ids, student_names) if has_name(name)}
+        )
 
     # 8. إنشاء تقرير المشرف PDF
-    admin_pdf_buffer = create_admin_report_pdf(admin_report_data, mean_grade, std_dev, course_name)
+    if render_report:
+        with metrics.timer('stage', stage='report'):
+            admin_report = create_admin_report_pdf(admin_report_data, mean_grade, std_dev, course_name)
+    else:
+        admin_report = (admin_report_data, mean_grade, std_dev, course_name)
 
-    return student_results, admin_pdf_buffer
+    stats = arabic_cache_stats()
+    metrics.inc('cache', stats['hits'] - arabic_before['hits'], cache='arabic', result='hit')
+    metrics.inc('cache', stats['misses'] - arabic_before['misses'], cache='arabic', result='miss')
+    logger.info(f"ذاكرة تصحيح النصوص العربية: {stats['size']} نص، نسبة الإصابة {stats['hit_rate']:.0%}.")
+
+    return course_result, admin_report
+
+def process_grades_pdf(pdf_path, course_name="المادة", registered_students=None, render_report=True):
+    """
+    يحلل ملف العلامات ويعالجه في خطوة واحدة متدفقة (Streaming):
+    تحديث الأسماء يبدأ قبل انتهاء قراءة آخر صفحة. يعيد (None, None) عند فشل التحليل.
+    registered_students و render_report كما في process_grades.
+    """
+    try:
+        # زمن التحليل: الوقت المستغرق داخل iter_grade_rows فقط (المعالجة تتم أثناء القراءة)
+        rows = metrics.timed_iter(iter_grade_rows(pdf_path), 'stage', stage='parse')
+        return process_grades(rows, course_name=course_name, registered_students=registered_students,
+                              render_report=render_report)
+    except Exception as e:
+        logger.error(f"خطأ في تحليل ملف PDF: {e}")
+        return None, None
@@ -1,85 +1,623 @@
+import os
+import json
 import sqlite3
 import logging
-from config import DB_NAME
+import threading
+from config import DB_NAME, DB_CACHE_SIZE_KB, DB_MMAP_SIZE, DB_STATEMENT_CACHE, DB_BUSY_TIMEOUT
+from metrics import metrics
 
 logger = logging.getLogger(__name__)
 
+# --- إدارة الاتصال ---
+# اتصال واحد طويل العمر لكل خيط (Thread) ولكل عملية (Process)،
+# بدلاً من فتح اتصال جديد وإغلاقه في كل استدعاء.
+_local = threading.local()
+
+# أقصى عدد من المتغيرات في استعلام IN واحد (حد SQLite القديم 999)
+_IN_CHUNK_SIZE = 900
+
+# --- ذاكرة الطلاب المسجلين ---
+# بعد إعلان النتائج يرسل آلاف الطلاب /start ورقمهم الجامعي خلال دقائق: كل رسالة تبحث عن المرسل.
+# في عملية البوت تُحمّل كل الطلاب المسجلين في الذاكرة عند بدء التشغيل (warm_student_cache)
+# وتُحدّث مع كل كتابة (register_student وتحديث الأسماء)، فلا يقرأ البحث من القرص أبداً:
+# المستخدم غير الموجود في الذاكرة غير مسجل. العمليات العاملة لا تحمّلها وتقرأ من قاعدة البيانات.
+
+
+class StudentCache:
+    """user_id -> (student_id, student_name, university, college)، مع فهرس الرقم الجامعي -> user_id."""
+
+    def __init__(self):
+        self.loaded = False
+        self._by_user = {}
+        self._by_student = {}
+
+    def load(self, rows):
+        """rows: صفوف (user_id, student_id, student_name, university, college) كما في get_all_students."""
+        self._by_user = {user_id: (student_id, student_name, university, college)
+                         for user_id, student_id, student_name, university, college in rows}
+        self._by_student = {info[0]: user_id for user_id, info in self._by_user.items()}
+        self.loaded = True
+
+    def get(self, user_id):
+        return self._by_user.get(user_id)
+
+    def add(self, user_id, student_id, university, college):
+        self._by_user[user_id] = (student_id, None, university, college)
+        self._by_student[student_id] = user_id
+
+    def set_name(self, student_id, student_name):
+        user_id = self._by_student.get(student_id)
+        if user_id is not None:
+            self._by_user[user_id] = (student_id, student_name) + self._by_user[user_id][2:]
+
+    def rows(self):
+        return [(user_id, *info) for user_id, info in self._by_user.items()]
+
+    def __len__(self):
+        return len(self._by_user)
+
+
+_students = StudentCache()
+
+def _open_connection(db_name):
+    """يفتح اتصالاً جديداً ويضبط إعدادات الأداء (WAL وغيرها)."""
+    conn = sqlite3.connect(db_name, timeout=DB_BUSY_TIMEOUT, cached_statements=DB_STATEMENT_CACHE)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA cache_size=-{DB_CACHE_SIZE_KB}")
+    conn.execute(f"PRAGMA mmap_size={DB_MMAP_SIZE}")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    return conn
+
+def get_connection():
+    """
+    يعيد الاتصال الخاص بالخيط الحالي (ويفتحه عند أول استخدام).
+    يُعاد فتح الاتصال تلقائياً بعد fork (عملية جديدة) أو عند تغيير DB_NAME.
+    """
+    conn = getattr(_local, 'conn', None)
+    if conn is None or _local.pid != os.getpid() or _local.db_name != DB_NAME:
+        conn = _open_connection(DB_NAME)
+        _local.conn = conn
+        _local.pid = os.getpid()
+        _local.db_name = DB_NAME
+    return conn
+
+def close_connection():
+    """يغلق اتصال الخيط الحالي (مثلاً عند إيقاف البوت)."""
+    conn = getattr(_local, 'conn', None)
+    if conn is not None and _local.pid == os.getpid():
+        conn.close()
+    _local.conn = None
+
 def init_db():
     """تهيئة قاعدة البيانات وإنشاء الجداول."""
     try:
-        conn = sqlite3.connect(DB_NAME)
-        cursor = conn.cursor()
-        # جدول الطلاب: user_id هو مفتاح أساسي، student_id فريد
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS students (
-                user_id INTEGER PRIMARY KEY,
-                student_id TEXT NOT NULL UNIQUE,
-                student_name TEXT,
-                university TEXT,
-                college TEXT
-            )
-        """)
-        conn.commit()
-        conn.close()
+        conn = get_connection()
+        with conn:
+            # جدول الطلاب: user_id هو مفتاح أساسي، student_id فريد
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS students (
+                    user_id INTEGER PRIMARY KEY,
+                    student_id TEXT NOT NULL UNIQUE,
+                    student_name TEXT,
+                    university TEXT,
+                    college TEXT
+                )
+            """)
+            # الملفات المعالجة سابقاً: البصمة (SHA-256) -> الصفوف المستخرجة وإحصائيات المادة
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS processed_files (
+                    file_hash TEXT PRIMARY KEY,
+                    course_name TEXT NOT NULL,
+                    mean REAL,
+                    std_dev REAL,
+                    student_count INTEGER,
+                    rows_json TEXT NOT NULL,
+                    processed_at TEXT DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_processed_files_course ON processed_files (course_name)")
+            # سجل العلامات: مادة واحدة لكل ملف، وعلامة كل طالب فيها
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS courses (
+                    course_id INTEGER PRIMARY KEY,
+                    course_name TEXT NOT NULL UNIQUE,
+                    student_count INTEGER NOT NULL DEFAULT 0,
+                    mean REAL,
+                    std_dev REAL,
+                    updated_at TEXT DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS grade_records (
+                    course_id INTEGER NOT NULL REFERENCES courses (course_id),
+                    student_id TEXT NOT NULL,
+                    grade REAL NOT NULL,
+                    percentile REAL,
+                    rank INTEGER,
+                    student_name TEXT,
+                    PRIMARY KEY (course_id, student_id)
+                ) WITHOUT ROWID
+            """)
+            # اسم الطالب كما في ملف العلامات (لنتائج الطلاب الذين يسجلون بعد معالجة الملف)
+            grade_columns = {row[1] for row in conn.execute("PRAGMA table_info(grade_records)")}
+            if 'student_name' not in grade_columns:
+                conn.execute("ALTER TABLE grade_records ADD COLUMN student_name TEXT")
+            # ملخص كل مادة محسوب مرة واحدة عند الحفظ: أعداد أعمدة المخطط والعلامات مرتبة (مصفوفات NumPy كـ BLOB)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS course_aggregates (
+                    course_id INTEGER PRIMARY KEY REFERENCES courses (course_id),
+                    bin_counts BLOB NOT NULL,
+                    sorted_grades BLOB NOT NULL
+                )
+            """)
+            # قائمة انتظار ملفات العلامات: المرحلة الحالية (parse, deliver, report) وحالة التنفيذ
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    job_id INTEGER PRIMARY KEY,
+                    file_hash TEXT NOT NULL,
+                    course_name TEXT NOT NULL,
+                    pdf_path TEXT NOT NULL,
+                    chat_id INTEGER,
+                    stage TEXT NOT NULL DEFAULT 'parse',
+                    state TEXT NOT NULL DEFAULT 'queued',
+                    error TEXT,
+                    created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+                    updated_at TEXT DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+            # رقم الدفعة (أصغر job_id فيها) للملفات التي تُعالج معاً في وضع الدفعات
+            job_columns = {row[1] for row in conn.execute("PRAGMA table_info(jobs)")}
+            if 'batch_id' not in job_columns:
+                conn.execute("ALTER TABLE jobs ADD COLUMN batch_id INTEGER")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_state ON jobs (state, job_id)")
+            # حالة إرسال النتيجة لكل طالب في كل ملف (pending, inflight, sent, failed, uncertain)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS deliveries (
+                    job_id INTEGER NOT NULL REFERENCES jobs (job_id),
+                    user_id INTEGER NOT NULL,
+                    state TEXT NOT NULL DEFAULT 'pending',
+                    PRIMARY KEY (job_id, user_id)
+                ) WITHOUT ROWID
+            """)
+            # علامات طالب في كل المواد، وترتيب/أعلى وأدنى علامة في مادة
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_grade_records_student ON grade_records (student_id)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_grade_records_course_grade ON grade_records (course_id, grade)")
         logger.info("تم تهيئة قاعدة البيانات بنجاح.")
     except Exception as e:
         logger.error(f"خطأ في تهيئة قاعدة البيانات: {e}")
 
+@metrics.timed('db')
 def register_student(user_id, student_id, university, college):
-    """تسجيل طالب جديد (الرقم الجامعي فقط). الاسم سيتم إضافته لاحقاً."""
+    """
+    تسجيل طالب جديد (الرقم الجامعي فقط). الاسم سيتم إضافته لاحقاً.
+    يعيد True إذا أُضيف الطالب، و False إذا كان الرقم الجامعي مسجلاً لمستخدم آخر أو عند الفشل.
+    """
     try:
-        conn = sqlite3.connect(DB_NAME)
-        cursor = conn.cursor()
-        
+        conn = get_connection()
         # استخدام INSERT OR IGNORE لتسجيل الطالب لأول مرة
-        cursor.execute(
-            "INSERT OR IGNORE INTO students (user_id, student_id, university, college) VALUES (?, ?, ?, ?)",
-            (user_id, student_id, university, college)
-        )
-        conn.commit()
-        conn.close()
+        with conn:
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO students (user_id, student_id, university, college) VALUES (?, ?, ?, ?)",
+                (user_id, student_id, university, college)
+            )
+        if cursor.rowcount != 1:
+            return False
+        if _students.loaded:
+            _students.add(user_id, student_id, university, college)
         logger.info(f"تم تسجيل الطالب {student_id} بنجاح (بدون اسم مبدئياً).")
+        return True
     except Exception as e:
         logger.error(f"خطأ في تسجيل الطالب: {e}")
+        return False
 
+@metrics.timed('db')
 def update_student_name(student_id, student_name):
     """تحديث اسم الطالب بعد استخراجه من ملف العلامات."""
     try:
-        conn = sqlite3.connect(DB_NAME)
-        cursor = conn.cursor()
-        cursor.execute(
-            "UPDATE students SET student_name = ? WHERE student_id = ?",
-            (student_name, student_id)
-        )
-        conn.commit()
-        conn.close()
+        conn = get_connection()
+        with conn:
+            conn.execute(
+                "UPDATE students SET student_name = ? WHERE student_id = ?",
+                (student_name, student_id)
+            )
+        _students.set_name(student_id, student_name)
         logger.info(f"تم تحديث اسم الطالب {student_id} إلى {student_name} بنجاح.")
     except Exception as e:
         logger.error(f"خطأ في تحديث اسم الطالب: {e}")
 
+@metrics.timed('db')
+def update_student_names_bulk(pairs):
+    """
+    تحديث أسماء عدة طلاب دفعة واحدة (معاملة واحدة و executemany).
+    pairs: أزواج (الرقم الجامعي، الاسم). يتم تخطي الطلاب الذين لم يتغير اسمهم أو غير المسجلين.
+    يعيد قاموساً بعدد الأسماء المحدثة والمتخطاة.
+    """
+    params = [(student_name, student_id, student_name) for student_id, student_name in pairs]
+    if not params:
+        return {'total': 0, 'updated': 0, 'skipped': 0}
+    try:
+        conn = get_connection()
+        changes_before = conn.total_changes
+        with conn:
+            conn.executemany(
+                "UPDATE students SET student_name = ? WHERE student_id = ? AND student_name IS NOT ?",
+                params
+            )
+        updated = conn.total_changes - changes_before
+        refresh_student_names((student_id, student_name) for student_name, student_id, _ in params)
+        logger.info(f"تم تحديث أسماء {updated} طالب من أصل {len(params)} دفعة واحدة.")
+        return {'total': len(params), 'updated': updated, 'skipped': len(params) - updated}
+    except Exception as e:
+        logger.error(f"خطأ في تحديث أسماء الطلاب دفعة واحدة: {e}")
+        return {'total': len(params), 'updated': 0, 'skipped': len(params)}
+
 def get_student_info_by_id(student_id):
     """الحصول على معلومات طالب معين باستخدام رقمه الجامعي."""
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    cursor.execute("SELECT user_id, student_name, university, college FROM students WHERE student_id = ?", (student_id,))
-    info = cursor.fetchone()
-    conn.close()
-    return info
+    cursor = get_connection().execute(
+        "SELECT user_id, student_name, university, college FROM students WHERE student_id = ?", (student_id,)
+    )
+    return cursor.fetchone()
 
 def get_student_info_by_user_id(user_id):
-    """الحصول على معلومات طالب معين باستخدام Telegram user ID."""
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    cursor.execute("SELECT student_id, student_name, university, college FROM students WHERE user_id = ?", (user_id,))
-    info = cursor.fetchone()
-    conn.close()
-    return info
+    """
+    الحصول على معلومات طالب معين باستخدام Telegram user ID:
+    (student_id, student_name, university, college) أو None إذا لم يكن مسجلاً.
+    من ذاكرة الطلاب إن كانت محملة (بدون قراءة القرص)، وإلا من قاعدة البيانات.
+    """
+    if _students.loaded:
+        metrics.inc('cache', cache='students', result='hit')
+        return _students.get(user_id)
+    metrics.inc('cache', cache='students', result='miss')
+    return _select_student_by_user_id(user_id)
 
-def get_all_students():
-    """الحصول على قائمة بجميع الطلاب المسجلين."""
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    cursor.execute("SELECT user_id, student_id, student_name, university, college FROM students")
-    students = cursor.fetchall()
-    conn.close()
+@metrics.timed('db')
+def _select_student_by_user_id(user_id):
+    cursor = get_connection().execute(
+        "SELECT student_id, student_name, university, college FROM students WHERE user_id = ?", (user_id,)
+    )
+    return cursor.fetchone()
+
+def get_students_by_user_ids(user_ids):
+    """
+    الحصول على معلومات عدة طلاب باستعلام واحد لكل دفعة بدلاً من استعلام لكل طالب.
+    يعيد قاموساً: user_id -> (student_id, student_name, university, college).
+    """
+    user_ids = list(dict.fromkeys(user_ids))
+    students = {}
+    conn = get_connection()
+    # نقسم المعرفات على دفعات حتى لا نتجاوز حد المتغيرات في SQLite
+    for start in range(0, len(user_ids), _IN_CHUNK_SIZE):
+        chunk = user_ids[start:start + _IN_CHUNK_SIZE]
+        placeholders = ",".join("?" * len(chunk))
+        cursor = conn.execute(
+            f"SELECT user_id, student_id, student_name, university, college FROM students WHERE user_id IN ({placeholders})",
+            chunk
+        )
+        for user_id, *info in cursor:
+            students[user_id] = tuple(info)
     return students
+
+def get_all_students():
+    """
+    الحصول على قائمة بجميع الطلاب المسجلين: صفوف (user_id, student_id, student_name, university, college).
+    من ذاكرة الطلاب إن كانت محملة (عملية البوت)، وإلا من قاعدة البيانات.
+    """
+    if _students.loaded:
+        return _students.rows()
+    return _select_all_students()
+
+@metrics.timed('db')
+def _select_all_students():
+    cursor = get_connection().execute("SELECT user_id, student_id, student_name, university, college FROM students")
+    return cursor.fetchall()
+
+def warm_student_cache():
+    """يحمّل كل الطلاب المسجلين في ذاكرة الطلاب (في عملية البوت عند بدء التشغيل). يعيد عددهم."""
+    try:
+        _students.load(_select_all_students())
+        logger.info(f"تم تحميل {len(_students)} طالب مسجل في الذاكرة.")
+    except Exception as e:
+        logger.error(f"خطأ في تحميل الطلاب المسجلين في الذاكرة: {e}")
+    return len(_students)
+
+def refresh_student_names(pairs):
+    """
+    يحدّث الأسماء في ذاكرة الطلاب بعد تحديثها في قاعدة البيانات، بما فيها الأسماء المحدثة
+    في عملية عاملة (process_grades). pairs: أزواج (الرقم الجامعي، الاسم).
+    """
+    if _students.loaded:
+        for student_id, student_name in pairs:
+            _students.set_name(student_id, student_name)
+
+@metrics.timed('db')
+def save_processed_file(file_hash, course_name, rows, mean, std_dev):
+    """
+    يحفظ ملف علامات بعد معالجته: الصفوف المستخرجة (الرقم الجامعي، الاسم، العلامة) والإحصائيات.
+    يُستخدم لتجاهل الملفات المكررة ولمقارنة النسخ المصححة من نفس المادة.
+    """
+    try:
+        conn = get_connection()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO processed_files (file_hash, course_name, mean, std_dev, student_count, rows_json) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (file_hash, course_name, mean, std_dev, len(rows), json.dumps([list(row) for row in rows], ensure_ascii=False))
+            )
+        logger.info(f"تم حفظ ملف العلامات للمادة {course_name} ({len(rows)} صف).")
+    except Exception as e:
+        logger.error(f"خطأ في حفظ ملف العلامات المعالج: {e}")
+
+def get_processed_file(file_hash):
+    """يعيد (course_name, mean, std_dev, student_count, processed_at) لملف تمت معالجته سابقاً، أو None."""
+    cursor = get_connection().execute(
+        "SELECT course_name, mean, std_dev, student_count, processed_at FROM processed_files WHERE file_hash = ?",
+        (file_hash,)
+    )
+    return cursor.fetchone()
+
+@metrics.timed('db')
+def get_previous_grades(course_name):
+    """
+    علامات آخر ملف معالج لنفس المادة: قاموس الرقم الجامعي -> العلامة.
+    يعيد None إذا لم تتم معالجة المادة من قبل.
+    """
+    row = get_connection().execute(
+        "SELECT rows_json FROM processed_files WHERE course_name = ? ORDER BY rowid DESC LIMIT 1",
+        (course_name,)
+    ).fetchone()
+    if row is None:
+        return None
+    return {student_id: grade for student_id, _, grade in json.loads(row[0])}
+
+@metrics.timed('db')
+def save_course_grades(course_name, records, mean, std_dev, bin_counts=None, sorted_grades=None, student_names=None):
+    """
+    يحفظ علامات مادة كاملة في معاملة واحدة (executemany).
+    records: صفوف (الرقم الجامعي، العلامة، النسبة المئوية، الترتيب).
+    student_names: قاموس الرقم الجامعي -> الاسم كما في ملف العلامات (اختياري).
+    bin_counts و sorted_grades: ملخص المادة كبايتات (ndarray.tobytes) يُحفظ في course_aggregates.
+    إعادة حفظ نفس المادة (نسخة مصححة) تستبدل علاماتها السابقة. يعيد course_id أو None عند الفشل.
+    """
+    student_names = student_names or {}
+    records = [(student_id, float(grade), float(percentile), int(rank), student_names.get(student_id))
+               for student_id, grade, percentile, rank in records]
+    try:
+        conn = get_connection()
+        with conn:
+            conn.execute(
+                "INSERT INTO courses (course_name, student_count, mean, std_dev) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (course_name) DO UPDATE SET student_count = excluded.student_count, "
+                "mean = excluded.mean, std_dev = excluded.std_dev, updated_at = CURRENT_TIMESTAMP",
+                (course_name, len(records), mean, std_dev)
+            )
+            course_id = conn.execute(
+                "SELECT course_id FROM courses WHERE course_name = ?", (course_name,)
+            ).fetchone()[0]
+            conn.execute("DELETE FROM grade_records WHERE course_id = ?", (course_id,))
+            conn.executemany(
+                "INSERT OR REPLACE INTO grade_records (course_id, student_id, grade, percentile, rank, student_name) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [(course_id, *record) for record in records]
+            )
+            if bin_counts is not None and sorted_grades is not None:
+                conn.execute(
+                    "INSERT OR REPLACE INTO course_aggregates (course_id, bin_counts, sorted_grades) VALUES (?, ?, ?)",
+                    (course_id, bin_counts, sorted_grades)
+                )
+        logger.info(f"تم حفظ {len(records)} علامة للمادة {course_name}.")
+        return course_id
+    except Exception as e:
+        logger.error(f"خطأ في حفظ علامات المادة {course_name}: {e}")
+        return None
+
+@metrics.timed('db')
+def get_student_grades(student_id):
+    """كل علامات طالب: قائمة (اسم المادة، العلامة، النسبة المئوية، الترتيب، عدد الطلاب) حسب آخر تحديث."""
+    cursor = get_connection().execute(
+        "SELECT c.course_name, g.grade, g.percentile, g.rank, c.student_count "
+        "FROM grade_records g JOIN courses c ON c.course_id = g.course_id "
+        "WHERE g.student_id = ? ORDER BY c.updated_at DESC, c.course_id DESC",
+        (student_id,)
+    )
+    return cursor.fetchall()
+
+def get_course_stats(course_name):
+    """
+    إحصائيات مادة: قاموس (عدد الطلاب، المتوسط، الانحراف المعياري، أعلى وأدنى علامة، وقت التحديث)،
+    أو None إذا لم تُحفظ المادة. أعلى وأدنى علامة تُقرأ من الفهرس (course_id, grade) مباشرة.
+    """
+    conn = get_connection()
+    course = conn.execute(
+        "SELECT course_id, student_count, mean, std_dev, updated_at FROM courses WHERE course_name = ?",
+        (course_name,)
+    ).fetchone()
+    if course is None:
+        return None
+    course_id, student_count, mean, std_dev, updated_at = course
+    min_grade = conn.execute("SELECT MIN(grade) FROM grade_records WHERE course_id = ?", (course_id,)).fetchone()[0]
+    max_grade = conn.execute("SELECT MAX(grade) FROM grade_records WHERE course_id = ?", (course_id,)).fetchone()[0]
+    return {
+        'course_name': course_name,
+        'student_count': student_count,
+        'mean': mean,
+        'std_dev': std_dev,
+        'min': min_grade,
+        'max': max_grade,
+        'updated_at': updated_at,
+    }
+
+def get_course_grades(course_name):
+    """علامات مادة مرتبة حسب الترتيب: قائمة (الرقم الجامعي، العلامة، النسبة المئوية، الترتيب، الاسم)."""
+    cursor = get_connection().execute(
+        "SELECT g.student_id, g.grade, g.percentile, g.rank, g.student_name "
+        "FROM grade_records g JOIN courses c ON c.course_id = g.course_id "
+        "WHERE c.course_name = ? ORDER BY g.rank",
+        (course_name,)
+    )
+    return cursor.fetchall()
+
+def get_all_grade_records():
+    """كل العلامات المحفوظة: قائمة (اسم المادة، الرقم الجامعي، العلامة، النسبة المئوية، الترتيب، الاسم)."""
+    cursor = get_connection().execute(
+        "SELECT c.course_name, g.student_id, g.grade, g.percentile, g.rank, g.student_name "
+        "FROM grade_records g JOIN courses c ON c.course_id = g.course_id"
+    )
+    return cursor.fetchall()
+
+def get_course_aggregates(course_name):
+    """
+    ملخص مادة محفوظ: (عدد الطلاب، المتوسط، الانحراف المعياري، وقت التحديث، bin_counts، sorted_grades)،
+    أو None إذا لم يُحفظ ملخص للمادة.
+    """
+    cursor = get_connection().execute(
+        "SELECT c.student_count, c.mean, c.std_dev, c.updated_at, a.bin_counts, a.sorted_grades "
+        "FROM courses c JOIN course_aggregates a ON a.course_id = c.course_id WHERE c.course_name = ?",
+        (course_name,)
+    )
+    return cursor.fetchone()
+
+# --- قائمة انتظار ملفات العلامات ---
+
+def enqueue_job(file_hash, course_name, pdf_path, chat_id):
+    """يضيف ملف علامات إلى قائمة الانتظار ويعيد رقمه (job_id)، أو None عند الفشل."""
+    try:
+        conn = get_connection()
+        with conn:
+            cursor = conn.execute(
+                "INSERT INTO jobs (file_hash, course_name, pdf_path, chat_id) VALUES (?, ?, ?, ?)",
+                (file_hash, course_name, pdf_path, chat_id)
+            )
+        logger.info(f"تمت إضافة ملف المادة {course_name} إلى قائمة الانتظار (رقم {cursor.lastrowid}).")
+        return cursor.lastrowid
+    except Exception as e:
+        logger.error(f"خطأ في إضافة الملف إلى قائمة الانتظار: {e}")
+        return None
+
+def get_active_job(file_hash):
+    """يعيد رقم ملف بنفس البصمة ما زال في قائمة الانتظار أو قيد المعالجة، أو None."""
+    row = get_connection().execute(
+        "SELECT job_id FROM jobs WHERE file_hash = ? AND state IN ('queued', 'running') LIMIT 1",
+        (file_hash,)
+    ).fetchone()
+    return row[0] if row else None
+
+_JOB_COLUMNS = ('job_id', 'file_hash', 'course_name', 'pdf_path', 'chat_id', 'stage', 'batch_id')
+
+# ملف لم تبدأ معالجته: ليس من دفعة، في مرحلة التحليل، ولم يُسجل له أي إرسال
+_FRESH_JOB = (
+    "batch_id IS NULL AND stage = 'parse' "
+    "AND NOT EXISTS (SELECT 1 FROM deliveries WHERE deliveries.job_id = jobs.job_id)"
+)
+
+def claim_next_job(fresh=False):
+    """
+    يأخذ أقدم ملف في قائمة الانتظار ويجعله قيد المعالجة (running) في خطوة واحدة.
+    fresh=True: الملفات التي لم تبدأ معالجتها فقط (تصلح للإضافة إلى دفعة جديدة).
+    يعيد قاموساً ببيانات الملف أو None إذا كانت القائمة فارغة.
+    """
+    condition = f"state = 'queued' AND {_FRESH_JOB}" if fresh else "state = 'queued'"
+    conn = get_connection()
+    with conn:
+        row = conn.execute(
+            "UPDATE jobs SET state = 'running', updated_at = CURRENT_TIMESTAMP "
+            f"WHERE job_id = (SELECT job_id FROM jobs WHERE {condition} ORDER BY job_id LIMIT 1) "
+            f"RETURNING {', '.join(_JOB_COLUMNS)}"
+        ).fetchone()
+    if row is None:
+        return None
+    return dict(zip(_JOB_COLUMNS, row))
+
+def claim_batch_jobs(batch_id):
+    """يأخذ باقي ملفات الدفعة الموجودة في قائمة الانتظار (بعد إعادة التشغيل). يعيد قائمة قواميس."""
+    conn = get_connection()
+    with conn:
+        rows = conn.execute(
+            "UPDATE jobs SET state = 'running', updated_at = CURRENT_TIMESTAMP "
+            f"WHERE batch_id = ? AND state = 'queued' RETURNING {', '.join(_JOB_COLUMNS)}",
+            (batch_id,)
+        ).fetchall()
+    return sorted((dict(zip(_JOB_COLUMNS, row)) for row in rows), key=lambda job: job['job_id'])
+
+def is_fresh_job(job_id):
+    """هل الملف لم تبدأ معالجته (انظر claim_next_job)؟ ملف مستأنف لا يُضاف إلى دفعة جديدة."""
+    conn = get_connection()
+    return conn.execute(f"SELECT 1 FROM jobs WHERE job_id = ? AND {_FRESH_JOB}", (job_id,)).fetchone() is not None
+
+def set_job_batch(job_ids):
+    """يجمع ملفات في دفعة واحدة: رقم الدفعة هو أصغر job_id. يعيد رقم الدفعة."""
+    batch_id = min(job_ids)
+    conn = get_connection()
+    with conn:
+        conn.executemany(
+            "UPDATE jobs SET batch_id = ?, updated_at = CURRENT_TIMESTAMP WHERE job_id = ?",
+            [(batch_id, job_id) for job_id in job_ids]
+        )
+    return batch_id
+
+def set_job_stage(job_id, stage):
+    """ينقل الملف إلى المرحلة التالية (parse -> deliver -> report)."""
+    conn = get_connection()
+    with conn:
+        conn.execute(
+            "UPDATE jobs SET stage = ?, updated_at = CURRENT_TIMESTAMP WHERE job_id = ?", (stage, job_id)
+        )
+
+def finish_job(job_id, state, error=None):
+    """ينهي الملف بحالة done أو failed."""
+    conn = get_connection()
+    with conn:
+        conn.execute(
+            "UPDATE jobs SET state = ?, error = ?, updated_at = CURRENT_TIMESTAMP WHERE job_id = ?",
+            (state, error, job_id)
+        )
+
+def requeue_running_jobs():
+    """
+    بعد إعادة التشغيل: الملفات التي كانت قيد المعالجة تعود إلى قائمة الانتظار
+    لتُستأنف من مرحلتها المحفوظة. يعيد عددها.
+    """
+    conn = get_connection()
+    with conn:
+        cursor = conn.execute(
+            "UPDATE jobs SET state = 'queued', updated_at = CURRENT_TIMESTAMP WHERE state = 'running'"
+        )
+    return cursor.rowcount
+
+@metrics.timed('db')
+def add_deliveries(job_id, user_ids):
+    """يسجل الطلاب الذين يجب أن تصلهم نتيجة هذا الملف (معاملة واحدة)."""
+    conn = get_connection()
+    with conn:
+        conn.executemany(
+            "INSERT OR IGNORE INTO deliveries (job_id, user_id) VALUES (?, ?)",
+            [(job_id, user_id) for user_id in user_ids]
+        )
+
+@metrics.timed('db')
+def set_delivery_state(job_id, user_id, state):
+    """يحفظ حالة إرسال نتيجة طالب واحد فوراً (نقطة استئناف)."""
+    conn = get_connection()
+    with conn:
+        conn.execute(
+            "UPDATE deliveries SET state = ? WHERE job_id = ? AND user_id = ?", (state, job_id, user_id)
+        )
+
+def mark_uncertain_deliveries(job_id):
+    """
+    الرسائل التي بدأ إرسالها قبل توقف البوت (inflight) قد تكون وصلت أو لا:
+    تُعلَّم uncertain ولا يُعاد إرسالها حتى لا تتكرر. يعيد عددها.
+    """
+    conn = get_connection()
+    with conn:
+        cursor = conn.execute(
+            "UPDATE deliveries SET state = 'uncertain' WHERE job_id = ? AND state = 'inflight'", (job_id,)
+        )
+    return cursor.rowcount
+
+def get_delivery_states(job_id):
+    """حالة الإرسال لكل طالب في الملف: قاموس user_id -> state."""
+    cursor = get_connection().execute(
+        "SELECT user_id, state FROM deliveries WHERE job_id = ?", (job_id,)
+    )
+    return dict(cursor.fetchall())
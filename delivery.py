@@ -0,0 +1,431 @@
+import asyncio
+import inspect
+import logging
+import random
+import time
+from collections import OrderedDict
+from contextlib import AsyncExitStack
+from dataclasses import dataclass, field
+from typing import Callable, Optional
+from telegram import InputMediaPhoto
+from telegram.error import RetryAfter, TimedOut, NetworkError, Forbidden, BadRequest
+from metrics import metrics
+from config import (
+    DELIVERY_RATE_PER_SECOND, DELIVERY_BURST, DELIVERY_CONCURRENCY,
+    DELIVERY_PER_CHAT_INTERVAL, DELIVERY_MAX_RETRIES, DELIVERY_PROGRESS_INTERVAL,
+)
+
+logger = logging.getLogger(__name__)
+
+# أقصى عدد صور في ألبوم تليجرام (media group) واحد
+ALBUM_MAX_PHOTOS = 10
+
+# أخطاء BadRequest التي تعني أن file_id المخزن لم يعد صالحاً (غيرها مثل "Chat not found" خطأ في المحادثة نفسها)
+STALE_FILE_ID_ERRORS = ("file identifier", "file reference", "file_id")
+
+
+def _is_stale_file_id(error):
+    """هل خطأ BadRequest بسبب file_id غير صالح (وليس بسبب المحادثة)؟"""
+    message = str(error).lower()
+    return any(text in message for text in STALE_FILE_ID_ERRORS)
+
+
+def _retry_seconds(error):
+    """يعيد مدة الانتظار المطلوبة من RetryAfter بالثواني (قد تكون int أو timedelta حسب الإصدار)."""
+    delay = error.retry_after
+    if hasattr(delay, 'total_seconds'):
+        delay = delay.total_seconds()
+    return float(delay)
+
+
+class TokenBucket:
+    """محدد معدل (Token Bucket) مشترك بين كل عمليات الإرسال المتزامنة."""
+
+    def __init__(self, rate, capacity=1):
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds):
+        """إيقاف كل الإرسال مؤقتاً (عند وصول خطأ Flood من تليجرام)."""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._tokens = 0.0
+
+    async def acquire(self):
+        """ينتظر حتى يتوفر رمز (Token) واحد للإرسال."""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    self._updated = time.monotonic()
+                    continue
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+async def _resolve(photo):
+    """يدعم دوال التوليد العادية و async."""
+    if inspect.isawaitable(photo):
+        photo = await photo
+    if hasattr(photo, 'seek'):
+        photo.seek(0)
+    return photo
+
+
+class PhotoCache:
+    """
+    ذاكرة مؤقتة للصور المرفوعة: مفتاحها وصف محتوى الصورة (المادة، العمود المميز، الدرجة).
+    أول طالب يرفع الصورة ويُحفظ file_id الناتج، وباقي الطلاب بنفس المفتاح
+    يستلمون file_id مباشرة بدون توليد الصورة أو رفعها من جديد.
+    maxsize: أقصى عدد من المعرفات المحفوظة (يُحذف الأقدم استخداماً)، أو None بدون حد.
+    """
+
+    def __init__(self, maxsize=None):
+        self.maxsize = maxsize
+        self._file_ids = OrderedDict()
+        self._locks = {}
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._file_ids)
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def summary(self):
+        return f"ذاكرة الصور: إصابات {self.hits} | رفع جديد {self.misses} | نسبة الإصابة {self.hit_rate:.0%}"
+
+    def _remember(self, key, file_id):
+        self._file_ids[key] = file_id
+        if self.maxsize is not None:
+            while len(self._file_ids) > self.maxsize:
+                self._file_ids.popitem(last=False)
+
+    async def send(self, key, send, render_photo):
+        """
+        يرسل الصورة عبر send(photo) باستخدام file_id المخزن إن وجد،
+        وإلا يولد الصورة ويرفعها ويحفظ file_id للطلاب التاليين.
+        """
+        file_id = self._file_ids.get(key)
+        if file_id is not None:
+            self._file_ids.move_to_end(key)
+        else:
+            # قفل لكل مفتاح: إذا وصل عدة طلاب بنفس الصورة معاً، يرفعها واحد فقط
+            lock = self._locks.setdefault(key, asyncio.Lock())
+            try:
+                async with lock:
+                    file_id = self._file_ids.get(key)
+                    if file_id is None:
+                        self.misses += 1
+                        metrics.inc('cache', cache='photo', result='miss')
+                        message = await send(await _resolve(render_photo()))
+                        photos = getattr(message, 'photo', None)
+                        if photos:
+                            self._remember(key, photos[-1].file_id)
+                        return message
+            finally:
+                # يُحذف القفل حتى لو فشل الإرسال، وإلا يبقى قفل لكل طالب فشل إرساله
+                self._locks.pop(key, None)
+
+        self.hits += 1
+        try:
+            message = await send(file_id)
+        except BadRequest as e:
+            if not _is_stale_file_id(e):
+                # خطأ في المحادثة (مثل "Chat not found"): file_id ما زال صالحاً لباقي الطلاب
+                self.hits -= 1
+                raise
+            # file_id لم يعد صالحاً: نحذفه ونرفع الصورة من جديد
+            self._file_ids.pop(key, None)
+            self.hits -= 1
+            return await self.send(key, send, render_photo)
+        metrics.inc('cache', cache='photo', result='hit')
+        return message
+
+    async def send_group(self, items, send_group):
+        """
+        ألبوم صور في رسالة واحدة: الصور المحفوظة تُرسل بـ file_id، والباقي يُولد (على التوازي) ويُرفع
+        وتُحفظ معرفاته من الرسائل الناتجة. items: أزواج (المفتاح، دالة التوليد)؛
+        send_group(photos) يرسل قائمة الصور (file_id أو بايتات) ويعيد قائمة الرسائل.
+        """
+        # نفس أقفال send: الألبومات المتزامنة بنفس الصور تنتظر أول رفع ثم تستخدم file_id.
+        # الأقفال تؤخذ بترتيب ثابت حتى لا ينتظر ألبومان بعضهما
+        keys = sorted({key for key, _ in items if key is not None and key not in self._file_ids}, key=repr)
+        async with AsyncExitStack() as stack:
+            for key in keys:
+                await stack.enter_async_context(self._locks.setdefault(key, asyncio.Lock()))
+            try:
+                return await self._send_group(items, send_group)
+            except BadRequest as e:
+                if not _is_stale_file_id(e) or all(self._file_ids.get(key) is None for key, _ in items):
+                    raise
+                # أحد معرفات file_id لم يعد صالحاً: نحذف معرفات الألبوم ونرفع كل صوره من جديد
+                for key, _ in items:
+                    self._file_ids.pop(key, None)
+            finally:
+                for key in keys:
+                    self._locks.pop(key, None)
+        return await self.send_group(items, send_group)
+
+    async def _send_group(self, items, send_group):
+        file_ids = [self._file_ids.get(key) if key is not None else None for key, _ in items]
+        missing = [index for index, file_id in enumerate(file_ids) if file_id is None]
+        rendered = await asyncio.gather(*(_resolve(items[index][1]()) for index in missing))
+        photos = list(file_ids)
+        for index, photo in zip(missing, rendered):
+            photos[index] = photo
+        messages = await send_group(photos)
+
+        for index in missing:
+            key = items[index][0]
+            photo_sizes = getattr(messages[index], 'photo', None) if index < len(messages) else None
+            if key is not None and photo_sizes:
+                self._remember(key, photo_sizes[-1].file_id)
+        for key, file_id in zip((key for key, _ in items), file_ids):
+            if file_id is not None:
+                self._file_ids.move_to_end(key)
+        hits = len(items) - len(missing)
+        self.hits += hits
+        self.misses += len(missing)
+        metrics.inc('cache', hits, cache='photo', result='hit')
+        metrics.inc('cache', len(missing), cache='photo', result='miss')
+        return messages
+
+
+@dataclass
+class AlbumPhoto:
+    """صورة مادة واحدة في ألبوم نتائج طالب (وضع الدفعات)."""
+    caption: str
+    render_photo: Callable
+    photo_key: Optional[tuple] = None
+
+
+def album_parts(photos):
+    """يقسم صور الألبوم إلى أجزاء متساوية تقريباً لا يتجاوز كل منها ALBUM_MAX_PHOTOS."""
+    count = -(-len(photos) // ALBUM_MAX_PHOTOS)
+    size = -(-len(photos) // count)
+    return [photos[start:start + size] for start in range(0, len(photos), size)]
+
+
+@dataclass
+class DeliveryJob:
+    """
+    رسالة نتيجة واحدة لطالب: الصورة تُولد عند الإرسال فقط (دالة عادية أو async).
+    album: نتائج عدة مواد (قائمة AlbumPhoto) تُرسل كألبوم بدلاً من caption و render_photo و photo_key.
+    parts_sent: عدد أجزاء الألبوم التي وصلت (لا تُعاد عند إعادة المحاولة).
+    """
+    chat_id: int
+    caption: str
+    render_photo: Callable
+    label: str = ''
+    photo_key: Optional[tuple] = None
+    album: Optional[list] = None
+    parts_sent: int = 0
+
+
+@dataclass
+class DeliveryReport:
+    """ملخص عملية الإرسال (يُستخدم لتقارير التقدم للمشرف)."""
+    total: int
+    sent: int = 0
+    failed: int = 0
+    retries: int = 0
+    started_at: float = field(default_factory=time.monotonic)
+    finished_at: Optional[float] = None
+
+    @property
+    def done(self):
+        return self.sent + self.failed
+
+    @property
+    def elapsed(self):
+        return (self.finished_at or time.monotonic()) - self.started_at
+
+    @property
+    def throughput(self):
+        """عدد الرسائل المرسلة في الثانية."""
+        elapsed = self.elapsed
+        return self.sent / elapsed if elapsed > 0 else 0.0
+
+    def summary(self):
+        return (
+            f"تم الإرسال: {self.sent}/{self.total} | فشل: {self.failed} | "
+            f"إعادة محاولة: {self.retries} | المعدل: {self.throughput:.1f} رسالة/ثانية | "
+            f"الزمن: {self.elapsed:.0f} ثانية"
+        )
+
+
+class DeliveryScheduler:
+    """
+    يرسل نتائج الطلاب بشكل متزامن مع احترام حدود تليجرام:
+    - حد عام للرسائل في الثانية (Token Bucket).
+    - فاصل أدنى بين رسالتين لنفس المحادثة.
+    - إعادة المحاولة عند RetryAfter (Flood) أو أخطاء الشبكة مع تأخير تصاعدي.
+    checkpoint: كائن اختياري يُبلغ قبل كل محاولة إرسال (sending) وبعد النتيجة النهائية
+    لكل طالب (finished) لحفظ التقدم واستئنافه بعد إعادة التشغيل.
+    """
+
+    def __init__(self, bot, rate=DELIVERY_RATE_PER_SECOND, burst=DELIVERY_BURST,
+                 concurrency=DELIVERY_CONCURRENCY, per_chat_interval=DELIVERY_PER_CHAT_INTERVAL,
+                 max_retries=DELIVERY_MAX_RETRIES, progress_interval=DELIVERY_PROGRESS_INTERVAL,
+                 photo_cache=None, checkpoint=None):
+        self.bot = bot
+        self.photo_cache = photo_cache
+        self.checkpoint = checkpoint
+        self.bucket = TokenBucket(rate, burst)
+        self.concurrency = concurrency
+        self.per_chat_interval = per_chat_interval
+        self.max_retries = max_retries
+        self.progress_interval = progress_interval
+        self._last_chat_send = {}
+
+    async def _wait_for_chat(self, chat_id):
+        """يحترم الحد الخاص بكل محادثة (رسالة واحدة في الثانية تقريباً)."""
+        last = self._last_chat_send.get(chat_id)
+        if last is not None:
+            delay = last + self.per_chat_interval - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        self._last_chat_send[chat_id] = time.monotonic()
+
+    async def _send(self, job):
+        """يرسل رسالة واحدة ويعيد الرسالة الناتجة من تليجرام."""
+        if job.album:
+            return await self._send_album(job)
+        return await self._send_photo(job.chat_id, job.caption, job.render_photo, job.photo_key)
+
+    async def _send_photo(self, chat_id, caption, render_photo, photo_key):
+        async def send(photo):
+            return await self.bot.send_photo(chat_id=chat_id, photo=photo, caption=caption)
+
+        if self.photo_cache is not None and photo_key is not None:
+            return await self.photo_cache.send(photo_key, send, render_photo)
+        return await send(await _resolve(render_photo()))
+
+    async def _send_album(self, job):
+        """
+        نتائج عدة مواد لطالب واحد: ألبوم (media group) لكل ALBUM_MAX_PHOTOS صور.
+        عند إعادة المحاولة يبدأ الإرسال من أول جزء لم يصل (job.parts_sent).
+        """
+        messages = []
+        for number, part in enumerate(album_parts(job.album)[job.parts_sent:]):
+            if number:
+                # الأجزاء التالية رسائل مستقلة: نفس حدود الإرسال
+                await self.bucket.acquire()
+                await self._wait_for_chat(job.chat_id)
+            if len(part) == 1:
+                photo = part[0]
+                messages.append(await self._send_photo(job.chat_id, photo.caption, photo.render_photo, photo.photo_key))
+            else:
+                messages.extend(await self._send_group(job.chat_id, part))
+            job.parts_sent += 1
+        return messages
+
+    async def _send_group(self, chat_id, photos):
+        async def send_group(media):
+            return await self.bot.send_media_group(
+                chat_id=chat_id,
+                media=[InputMediaPhoto(media=item, caption=photo.caption) for item, photo in zip(media, photos)]
+            )
+
+        items = [(photo.photo_key, photo.render_photo) for photo in photos]
+        if self.photo_cache is not None:
+            return await self.photo_cache.send_group(items, send_group)
+        return await send_group(await asyncio.gather(*(_resolve(render_photo()) for _, render_photo in items)))
+
+    async def _deliver_one(self, job, report):
+        sent = await self._attempt_delivery(job, report)
+        if self.checkpoint is not None:
+            self.checkpoint.finished(job, sent)
+
+    async def _attempt_delivery(self, job, report):
+        """يرسل نتيجة طالب واحد مع إعادة المحاولة، ويعيد True إذا وصلت."""
+        attempt = 0
+        while True:
+            await self.bucket.acquire()
+            await self._wait_for_chat(job.chat_id)
+            if self.checkpoint is not None:
+                self.checkpoint.sending(job)
+            try:
+                await self._send(job)
+                report.sent += 1
+                logger.info(f"تم إرسال النتيجة للطالب {job.label} ({job.chat_id}).")
+                return True
+            except RetryAfter as e:
+                # حد Flood عام: نوقف كل الإرسال حتى انتهاء المدة المطلوبة
+                delay = _retry_seconds(e)
+                logger.warning(f"Flood control: إيقاف الإرسال لمدة {delay} ثانية.")
+                self.bucket.pause(delay)
+            except (Forbidden, BadRequest) as e:
+                # الطالب حظر البوت أو المحادثة غير صالحة: لا فائدة من إعادة المحاولة
+                report.failed += 1
+                logger.error(f"فشل إرسال النتيجة للطالب {job.label} ({job.chat_id}): {e}")
+                return False
+            except (TimedOut, NetworkError) as e:
+                delay = min(2 ** attempt, 60) + random.uniform(0, 1)
+                logger.warning(f"خطأ شبكة أثناء الإرسال إلى {job.chat_id}: {e}. إعادة المحاولة بعد {delay:.1f} ثانية.")
+                await asyncio.sleep(delay)
+            except Exception as e:
+                report.failed += 1
+                logger.error(f"خطأ غير متوقع أثناء الإرسال إلى {job.chat_id}: {e}")
+                return False
+
+            attempt += 1
+            report.retries += 1
+            if attempt > self.max_retries:
+                report.failed += 1
+                logger.error(f"تم تجاوز عدد محاولات الإرسال للطالب {job.label} ({job.chat_id}).")
+                return False
+
+    async def _worker(self, queue, report):
+        while True:
+            try:
+                job = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            await self._deliver_one(job, report)
+
+    async def _report_progress(self, report, progress):
+        while True:
+            await asyncio.sleep(self.progress_interval)
+            try:
+                await progress(report)
+            except Exception as e:
+                logger.warning(f"تعذر تحديث رسالة التقدم: {e}")
+
+    async def deliver(self, jobs, progress=None):
+        """
+        يرسل كل الرسائل ويعيد DeliveryReport.
+        progress: دالة async اختيارية تُستدعى دورياً مع التقرير الحالي.
+        """
+        jobs = list(jobs)
+        report = DeliveryReport(total=len(jobs))
+        queue = asyncio.Queue()
+        for job in jobs:
+            queue.put_nowait(job)
+
+        progress_task = None
+        if progress is not None:
+            progress_task = asyncio.create_task(self._report_progress(report, progress))
+        try:
+            workers = [asyncio.create_task(self._worker(queue, report))
+                       for _ in range(min(self.concurrency, len(jobs)))]
+            await asyncio.gather(*workers)
+        finally:
+            if progress_task is not None:
+                progress_task.cancel()
+            report.finished_at = time.monotonic()
+
+        logger.info(f"انتهى إرسال النتائج. {report.summary()}")
+        return report
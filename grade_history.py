@@ -0,0 +1,74 @@
+import logging
+from collections import OrderedDict
+import numpy as np
+from config import COURSE_AGGREGATES_CACHE_SIZE, HIST_BINS, HIST_RANGE
+from database import get_course_aggregates
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# ملخصات المواد المحملة من قاعدة البيانات: اسم المادة -> CourseAggregates
+_aggregates = OrderedDict()
+
+
+def grade_bin(grade, edges):
+    """يعيد رقم العمود الذي تقع فيه الدرجة، أو None إذا كانت خارج النطاق (نفس شرط المسار القديم)."""
+    index = int(np.searchsorted(edges, grade, side='right')) - 1
+    if 0 <= index < len(edges) - 1:
+        return index
+    return None
+
+
+class CourseAggregates:
+    """
+    ملخص مادة محسوب مرة واحدة عند معالجة ملف العلامات (course_aggregates):
+    المتوسط والانحراف المعياري وأعمدة المخطط ومصفوفة العلامات مرتبة.
+    النسبة المئوية لأي علامة تُحسب ببحث ثنائي على المصفوفة المرتبة. الترتيب لا يُحسب هنا:
+    العلامات المتساوية لها ترتيب مختلف حسب موقعها في الملف، فيُعرض الترتيب المحفوظ في grade_records.
+    """
+    __slots__ = ('course_name', 'student_count', 'mean', 'std_dev', 'updated_at',
+                 'bin_counts', 'bin_edges', 'sorted_grades')
+
+    def __init__(self, course_name, student_count, mean, std_dev, updated_at, bin_counts, sorted_grades):
+        self.course_name = course_name
+        self.student_count = student_count
+        self.mean = mean
+        self.std_dev = std_dev
+        self.updated_at = updated_at
+        self.bin_counts = np.frombuffer(bin_counts, dtype=np.int64)
+        self.bin_edges = np.linspace(HIST_RANGE[0], HIST_RANGE[1], HIST_BINS + 1)
+        self.sorted_grades = np.frombuffer(sorted_grades, dtype=np.float64)
+
+    def percentile(self, grade):
+        """
+        النسبة المئوية بنفس تعريف process_grades (rank(pct=True) مع متوسط ترتيب العلامات المتساوية).
+        """
+        below = int(np.searchsorted(self.sorted_grades, grade, side='left'))
+        up_to = int(np.searchsorted(self.sorted_grades, grade, side='right'))
+        count = len(self.sorted_grades)
+        if not count:
+            return 0.0
+        return round((below + (up_to - below + 1) / 2) / count * 100, 2)
+
+
+def load_course_aggregates(course_name):
+    """يعيد ملخص المادة (من الذاكرة إن وجد)، أو None إذا لم تتم معالجة المادة بعد."""
+    aggregates = _aggregates.get(course_name)
+    if aggregates is not None:
+        _aggregates.move_to_end(course_name)
+        metrics.inc('cache', cache='aggregates', result='hit')
+        return aggregates
+    metrics.inc('cache', cache='aggregates', result='miss')
+    row = get_course_aggregates(course_name)
+    if row is None:
+        return None
+    aggregates = CourseAggregates(course_name, *row)
+    _aggregates[course_name] = aggregates
+    while len(_aggregates) > COURSE_AGGREGATES_CACHE_SIZE:
+        _aggregates.popitem(last=False)
+    return aggregates
+
+
+def invalidate_course(course_name):
+    """يحذف ملخص المادة من الذاكرة بعد معالجة نسخة جديدة من ملفها."""
+    _aggregates.pop(course_name, None)
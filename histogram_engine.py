@@ -0,0 +1,92 @@
+import io
+import logging
+import numpy as np
+import matplotlib
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.patches import Rectangle
+from matplotlib.image import imsave
+from config import HIST_BINS, HIST_RANGE
+from grade_history import grade_bin
+from arabic_text import fix_arabic, HIST_TITLE, HIST_XLABEL, HIST_YLABEL
+
+logger = logging.getLogger(__name__)
+
+# إعداد الخط العربي لـ Matplotlib (نحتفظ بـ DejaVu هنا لأنه يعمل بشكل جيد مع Matplotlib)
+matplotlib.rcParams['font.family'] = 'DejaVu Sans'
+matplotlib.rcParams['font.sans-serif'] = ['DejaVu Sans']
+matplotlib.rcParams['axes.unicode_minus'] = False # لدعم إشارة السالب
+
+# لون العمود المميز: الأحمر بشفافية 0.7 فوق خلفية بيضاء (كما في المسار القديم)
+HIGHLIGHT_FACE = (1.0, 0.3, 0.3)
+HIGHLIGHT_EDGE = (0.3, 0.3, 0.3)
+
+
+class CourseHistogram:
+    """
+    يرسم مخطط توزيع العلامات لمادة واحدة مرة واحدة فقط، ثم يولد صورة كل طالب
+    بإعادة رسم العمود الخاص به وخط درجته فوق الخلفية المحفوظة (Blitting).
+    ملاحظة: الكائن غير آمن للاستخدام من عدة خيوط (Threads) في نفس الوقت.
+    """
+
+    def __init__(self, grades, bins=HIST_BINS, value_range=HIST_RANGE, counts=None):
+        self.edges = np.linspace(value_range[0], value_range[1], bins + 1)
+        if counts is None:
+            counts, _ = np.histogram(np.asarray(grades, dtype=float), bins=self.edges)
+        self.counts = np.asarray(counts)
+
+        # 1. رسم المخطط الأساسي (مرة واحدة لكل مادة)
+        self._fig = Figure(figsize=(8, 5))
+        self._canvas = FigureCanvasAgg(self._fig)
+        ax = self._fig.add_subplot()
+        ax.hist(self.edges[:-1], bins=self.edges, weights=self.counts,
+                edgecolor='black', alpha=0.7, color='skyblue')
+        ax.set_title(HIST_TITLE, fontsize=14)
+        ax.set_xlabel(HIST_XLABEL, fontsize=12)
+        ax.set_ylabel(HIST_YLABEL, fontsize=12)
+        ax.grid(axis='y', alpha=0.5)
+
+        # 2. العناصر المتغيرة لكل طالب (لا تُرسم مع الخلفية)
+        self._highlight = Rectangle((0, 0), 0, 0, facecolor=HIGHLIGHT_FACE,
+                                    edgecolor=HIGHLIGHT_EDGE, animated=True)
+        ax.add_patch(self._highlight)
+        self._marker = ax.axvline(0, color='red', linestyle='--', linewidth=2,
+                                  label=fix_arabic('درجتك: 0'), animated=True)
+        self._legend = ax.legend(loc='upper left')
+        self._legend.set_animated(True)
+        self._ax = ax
+
+        # 3. حفظ الخلفية وحساب حدود القص (بديل bbox_inches='tight')
+        self._canvas.draw()
+        self._background = self._canvas.copy_from_bbox(self._fig.bbox)
+        renderer = self._canvas.get_renderer()
+        tight = self._fig.get_tightbbox(renderer).padded(0.1)
+        dpi = self._fig.dpi
+        height = int(self._fig.bbox.height)
+        x0 = max(int(np.floor(tight.x0 * dpi)), 0)
+        x1 = min(int(np.ceil(tight.x1 * dpi)), int(self._fig.bbox.width))
+        y0 = max(height - int(np.ceil(tight.y1 * dpi)), 0)
+        y1 = min(height - int(np.floor(tight.y0 * dpi)), height)
+        self._crop = (slice(y0, y1), slice(x0, x1))
+
+    def render(self, student_grade):
+        """يولد صورة PNG لطالب واحد ويعيدها في مخزن مؤقت (BytesIO)."""
+        self._canvas.restore_region(self._background)
+
+        index = grade_bin(student_grade, self.edges)
+        if index is not None and self.counts[index] > 0:
+            self._highlight.set_bounds(self.edges[index], 0,
+                                       self.edges[index + 1] - self.edges[index],
+                                       self.counts[index])
+            self._ax.draw_artist(self._highlight)
+
+        self._marker.set_xdata([student_grade, student_grade])
+        self._legend.get_texts()[0].set_text(fix_arabic(f'درجتك: {student_grade}'))
+        self._ax.draw_artist(self._marker)
+        self._ax.draw_artist(self._legend)
+
+        pixels = np.asarray(self._canvas.buffer_rgba())[self._crop]
+        buf = io.BytesIO()
+        imsave(buf, pixels, format='png')
+        buf.seek(0)
+        return buf
@@ -0,0 +1,179 @@
+import asyncio
+import hashlib
+import logging
+import os
+from config import JOBS_DIR, JOB_WORKERS, JOB_POLL_INTERVAL, BATCH_WINDOW, BATCH_IDLE_GAP, BATCH_MAX_FILES
+from database import (
+    get_processed_file, get_active_job, enqueue_job, claim_next_job, claim_batch_jobs, is_fresh_job, set_job_batch,
+    finish_job, requeue_running_jobs, set_delivery_state,
+)
+
+logger = logging.getLogger(__name__)
+
+# --- قائمة انتظار ملفات العلامات ---
+# الملفات تُحفظ في قاعدة البيانات (جدول jobs) بدلاً من معالجتها داخل معالج رسالة تليجرام:
+# إذا توقف البوت أثناء المعالجة أو الإرسال، يُستأنف الملف من مرحلته بعد إعادة التشغيل.
+
+
+def file_sha256(path, chunk_size=1 << 20):
+    """بصمة SHA-256 لمحتوى الملف (لمعرفة ملفات العلامات المكررة)."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def job_pdf_path(file_key, file_name):
+    """
+    مسار حفظ ملف PDF المنتظر (يبقى حتى انتهاء معالجته).
+    file_key يجب أن يكون فريداً لكل رسالة حتى لا يُكتب فوق ملف ما زال في القائمة.
+    """
+    os.makedirs(JOBS_DIR, exist_ok=True)
+    return os.path.abspath(os.path.join(JOBS_DIR, f"{file_key}_{os.path.basename(file_name)}"))
+
+
+def submit_file(pdf_path, course_name, chat_id):
+    """
+    يضيف ملف علامات محفوظ على القرص إلى قائمة الانتظار.
+    يعيد (الحالة، معلومات): ('processed', صف processed_files) إذا تمت معالجة نفس الملف سابقاً،
+    ('pending', job_id) إذا كان نفس الملف في القائمة، ('queued', job_id) عند الإضافة،
+    أو ('error', None). في الحالات غير 'queued' يُحذف الملف.
+    """
+    file_hash = file_sha256(pdf_path)
+    processed = get_processed_file(file_hash)
+    if processed:
+        os.remove(pdf_path)
+        return 'processed', processed
+    job_id = get_active_job(file_hash)
+    if job_id is not None:
+        os.remove(pdf_path)
+        return 'pending', job_id
+    job_id = enqueue_job(file_hash, course_name, pdf_path, chat_id)
+    if job_id is None:
+        os.remove(pdf_path)
+        return 'error', None
+    return 'queued', job_id
+
+
+class DeliveryCheckpoint:
+    """
+    يحفظ حالة إرسال نتيجة كل طالب في جدول deliveries:
+    inflight قبل الإرسال مباشرة، ثم sent أو failed. بعد إعادة التشغيل لا يُعاد إرسال
+    أي نتيجة تم إرسالها أو بدأ إرسالها (لا تكرار).
+    """
+
+    def __init__(self, job_id):
+        self.job_id = job_id
+
+    def sending(self, job):
+        set_delivery_state(self.job_id, job.chat_id, 'inflight')
+
+    def finished(self, job, sent):
+        set_delivery_state(self.job_id, job.chat_id, 'sent' if sent else 'failed')
+
+
+class JobQueue:
+    """
+    عدد محدود من المهام (JOB_WORKERS) تأخذ الملفات من جدول jobs بالترتيب وتنفذ handler(job).
+    الملفات المضافة من نفس العملية توقظ المهام فوراً (notify)، والمضافة من عملية أخرى
+    (channel_monitor) تُلتقط عند الفحص الدوري.
+    وضع الدفعات (batch_handler و batch_window): بعد أخذ ملف تنتظر المهمة حتى يمر batch_idle_gap
+    ثانية بدون وصول ملف جديد (أو batch_window ثانية من أول ملف كحد أقصى)، ثم تنفذ batch_handler(jobs)
+    لكل الملفات معاً (أو handler(job) لملف وحيد).
+    ملفات الدفعة تُحفظ برقم دفعة واحد، فتُستأنف معاً بعد إعادة التشغيل. الملفات التي بدأت
+    معالجتها قبل إعادة التشغيل (بدون دفعة) تُستأنف وحدها: رقم الدفعة هو أصغر job_id،
+    وسجلات الإرسال (deliveries) لملف مستأنف ستُحسب عندها للدفعة كلها.
+    """
+
+    def __init__(self, handler, workers=JOB_WORKERS, poll_interval=JOB_POLL_INTERVAL,
+                 batch_handler=None, batch_window=BATCH_WINDOW, batch_idle_gap=BATCH_IDLE_GAP,
+                 batch_max_files=BATCH_MAX_FILES):
+        self.handler = handler
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.batch_handler = batch_handler
+        self.batch_window = batch_window
+        self.batch_idle_gap = batch_idle_gap
+        self.batch_max_files = batch_max_files
+        self._wakeup = asyncio.Event()
+        self._tasks = []
+
+    def start(self):
+        """يستعيد الملفات التي توقفت أثناء المعالجة ثم يبدأ المهام."""
+        recovered = requeue_running_jobs()
+        if recovered:
+            logger.warning(f"استئناف {recovered} ملف علامات توقفت معالجته قبل إعادة التشغيل.")
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    def notify(self):
+        """يوقظ المهام بعد إضافة ملف جديد."""
+        self._wakeup.set()
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _worker(self):
+        while True:
+            self._wakeup.clear()
+            job = claim_next_job()
+            if job is None:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            if job['batch_id'] is not None:
+                # دفعة توقفت قبل إعادة التشغيل: تُستأنف بكل ملفاتها
+                jobs = [job] + claim_batch_jobs(job['batch_id'])
+            elif self.batch_handler is not None and self.batch_window is not None and is_fresh_job(job['job_id']):
+                jobs = await self._collect_batch(job)
+            else:
+                jobs = [job]
+            try:
+                if self.batch_handler is not None and (len(jobs) > 1 or job['batch_id'] is not None):
+                    await self.batch_handler(jobs)
+                else:
+                    await self.handler(job)
+            except asyncio.CancelledError:
+                # إيقاف البوت: يبقى الملف running ويُستأنف عند التشغيل التالي
+                raise
+            except Exception as e:
+                for failed in jobs:
+                    logger.error(f"خطأ أثناء معالجة الملف رقم {failed['job_id']}: {e}")
+                    finish_job(failed['job_id'], 'failed', str(e))
+
+    async def _collect_batch(self, job):
+        """
+        يجمع الملفات التي تصل بفاصل أقل من batch_idle_gap ثانية (حتى batch_max_files ملف،
+        ولمدة batch_window ثانية من أول ملف كحد أقصى).
+        يعيد قائمة الملفات، ويحفظ رقم الدفعة إذا كانت أكثر من ملف.
+        """
+        loop = asyncio.get_running_loop()
+        jobs = [job]
+        last_arrival = loop.time()
+        deadline = last_arrival + self.batch_window
+        while len(jobs) < self.batch_max_files:
+            remaining = min(deadline, last_arrival + self.batch_idle_gap) - loop.time()
+            if remaining <= 0:
+                break
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), min(remaining, self.poll_interval))
+            except asyncio.TimeoutError:
+                pass
+            while len(jobs) < self.batch_max_files:
+                next_job = claim_next_job(fresh=True)
+                if next_job is None:
+                    break
+                jobs.append(next_job)
+                last_arrival = loop.time()
+        if len(jobs) > 1:
+            batch_id = set_job_batch([queued['job_id'] for queued in jobs])
+            for queued in jobs:
+                queued['batch_id'] = batch_id
+            logger.info(f"دفعة رقم {batch_id}: {len(jobs)} ملفات علامات تُعالج معاً.")
+        return jobs
@@ -0,0 +1,247 @@
+import logging
+import os
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from functools import wraps
+from config import METRICS_FILE, METRICS_JOB_HISTORY, METRICS_PREFIX
+
+logger = logging.getLogger(__name__)
+
+# --- قياس مراحل المعالجة ---
+# سجل بسيط داخل كل عملية: عدادات (Counters) وأزمنة (العدد، المجموع، الأقصى) حسب الاسم والتسميات.
+# العمليات العاملة تعيد ما سجلته مع نتيجتها (drain) ويدمجه البوت (merge)،
+# ثم يُكتب كملف نصي بصيغة Prometheus (METRICS_FILE) بعد كل ملف علامات.
+
+# أسماء المراحل كما تظهر في أمر /stats
+STAGE_LABELS = {
+    'download': 'التنزيل',
+    'parse': 'التحليل',
+    'names': 'الأسماء',
+    'statistics': 'الإحصائيات',
+    'save_grades': 'حفظ العلامات',
+    'report': 'التقرير',
+    'worker': 'العملية العاملة',
+    'deliver': 'الإرسال',
+    'histogram': 'المخططات (مجموع كل الصور)',
+    'admin_report': 'إرسال التقرير',
+}
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+class Metrics:
+    """عدادات وأزمنة عملية واحدة."""
+
+    def __init__(self):
+        self.counters = defaultdict(float) # (الاسم، التسميات) -> القيمة
+        self.timers = {} # (الاسم، التسميات) -> [العدد، المجموع بالثواني، الأقصى]
+
+    def inc(self, name, value=1, **labels):
+        self.counters[_key(name, labels)] += value
+
+    def observe(self, name, seconds, **labels):
+        timer = self.timers.get(_key(name, labels))
+        if timer is None:
+            self.timers[_key(name, labels)] = [1, seconds, seconds]
+        else:
+            timer[0] += 1
+            timer[1] += seconds
+            timer[2] = max(timer[2], seconds)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def timed(self, name, **labels):
+        """مزخرف (Decorator) يقيس زمن الدالة، مع تسمية op باسمها."""
+        def decorator(func):
+            op = func.__name__
+
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    self.observe(name, time.perf_counter() - started, op=op, **labels)
+            return wrapper
+        return decorator
+
+    def timed_iter(self, iterable, name, **labels):
+        """يمرر عناصر iterable ويقيس الزمن المستغرق داخله فقط (بدون زمن معالجة كل عنصر)."""
+        iterator = iter(iterable)
+        elapsed = 0.0
+        try:
+            while True:
+                started = time.perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    elapsed += time.perf_counter() - started
+                    return
+                elapsed += time.perf_counter() - started
+                yield item
+        finally:
+            self.observe(name, elapsed, **labels)
+
+    def count(self, name, **labels):
+        """قيمة عداد (0 إذا لم يُسجل بعد)."""
+        return self.counters.get(_key(name, labels), 0)
+
+    def total(self, name, **labels):
+        """مجموع الثواني المسجلة لمؤقت (0 إذا لم يُسجل بعد)."""
+        timer = self.timers.get(_key(name, labels))
+        return timer[1] if timer else 0.0
+
+    def snapshot(self):
+        return {'counters': dict(self.counters), 'timers': {key: list(value) for key, value in self.timers.items()}}
+
+    def drain(self):
+        """يعيد ما سُجل ويصفر السجل (لإرساله من العملية العاملة إلى البوت)."""
+        snapshot = self.snapshot()
+        self.counters.clear()
+        self.timers.clear()
+        return snapshot
+
+    def merge(self, snapshot):
+        for key, value in snapshot['counters'].items():
+            self.counters[key] += value
+        for key, (count, total, longest) in snapshot['timers'].items():
+            timer = self.timers.get(key)
+            if timer is None:
+                self.timers[key] = [count, total, longest]
+            else:
+                timer[0] += count
+                timer[1] += total
+                timer[2] = max(timer[2], longest)
+
+    def render(self):
+        """النص بصيغة Prometheus (text exposition format)."""
+        lines = []
+        for name in sorted({name for name, _ in self.counters}):
+            metric = f"{METRICS_PREFIX}_{name}_total"
+            lines.append(f"# TYPE {metric} counter")
+            for (key_name, labels), value in sorted(self.counters.items()):
+                if key_name == name:
+                    lines.append(f"{metric}{_render_labels(labels)} {value:g}")
+        for name in sorted({name for name, _ in self.timers}):
+            metric = f"{METRICS_PREFIX}_{name}_seconds"
+            lines.append(f"# TYPE {metric} summary")
+            for (key_name, labels), (count, total, longest) in sorted(self.timers.items()):
+                if key_name == name:
+                    rendered = _render_labels(labels)
+                    lines.append(f"{metric}_count{rendered} {count}")
+                    lines.append(f"{metric}_sum{rendered} {total:.6f}")
+                    lines.append(f"{metric}_max{rendered} {longest:.6f}")
+        return "\n".join(lines) + "\n"
+
+
+def _render_labels(labels):
+    if not labels:
+        return ""
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in labels)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(labels, escaped)) + "}"
+
+
+class JobStats:
+    """ملخص ملف علامات واحد لأمر /stats: زمن كل مرحلة وعدد الصفوف والرسائل."""
+    __slots__ = ('job_id', 'course_name', 'state', 'started_at', 'elapsed', 'stages', 'counts')
+
+    def __init__(self, job_id, course_name):
+        self.job_id = job_id
+        self.course_name = course_name
+        self.state = 'running'
+        self.started_at = time.time()
+        self.elapsed = None
+        self.stages = defaultdict(float) # المرحلة -> الثواني
+        self.counts = defaultdict(int)
+
+    @contextmanager
+    def stage(self, name):
+        """يقيس مرحلة في عملية البوت (تُسجل في الملخص وفي metrics)."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - started
+            self.stages[name] += seconds
+            metrics.observe('stage', seconds, stage=name)
+
+    def add_worker_stages(self, snapshot):
+        """يضيف أزمنة المراحل المنفذة في العملية العاملة (من drain) إلى الملخص."""
+        for (name, labels), (_, total, _) in snapshot['timers'].items():
+            if name == 'stage':
+                self.stages[dict(labels)['stage']] += total
+
+    def summary(self):
+        elapsed = f"{self.elapsed:.1f} ث" if self.elapsed is not None else "قيد التنفيذ"
+        stages = " | ".join(f"{STAGE_LABELS.get(name, name)} {seconds:.1f}" for name, seconds in self.stages.items())
+        counts = self.counts
+        return (
+            f"• {self.course_name} (رقم {self.job_id}) {self.state} — {elapsed}\n"
+            f"  {stages}\n"
+            f"  صفوف {counts['rows']} | مسجلون {counts['students']} | أُرسل {counts['sent']} | "
+            f"فشل {counts['failed']} | إعادة محاولة {counts['retries']} | صور من الذاكرة {counts['photo_hits']}"
+        )
+
+
+# سجل العملية الحالية وآخر الملفات المعالجة (في عملية البوت)
+metrics = Metrics()
+recent_jobs = deque(maxlen=METRICS_JOB_HISTORY)
+
+
+def summary(job_count=5):
+    """نص أمر /stats: آخر job_count ملفات، ثم مجموع الإرسال ونسب الإصابة في ذاكرات التخزين المؤقت."""
+    jobs = list(recent_jobs)[-job_count:]
+    if jobs:
+        lines = [f"آخر {len(jobs)} ملفات علامات:"] + [stats.summary() for stats in reversed(jobs)]
+    else:
+        lines = ["لم تتم معالجة أي ملف علامات منذ تشغيل البوت."]
+
+    lines.append(
+        f"\nمنذ التشغيل: {metrics.count('jobs', state='done'):g} ملف ناجح، {metrics.count('jobs', state='failed'):g} فشل | "
+        f"أُرسل {metrics.count('deliveries', result='sent'):g} | فشل {metrics.count('deliveries', result='failed'):g} | "
+        f"إعادة محاولة {metrics.count('delivery_retries'):g}"
+    )
+    caches = []
+    for cache in ('students', 'photo', 'aggregates', 'layout', 'arabic'):
+        hits, misses = metrics.count('cache', cache=cache, result='hit'), metrics.count('cache', cache=cache, result='miss')
+        if hits + misses:
+            caches.append(f"{cache} {hits / (hits + misses):.0%}")
+    if caches:
+        lines.append("نسبة الإصابة في الذاكرة المؤقتة: " + " | ".join(caches))
+    return "\n".join(lines)
+
+
+def start_job_stats(job_id, course_name):
+    stats = JobStats(job_id, course_name)
+    recent_jobs.append(stats)
+    return stats
+
+
+def finish_job_stats(stats, state):
+    """ينهي ملخص الملف ويحدث العدادات وملف المقاييس."""
+    stats.state = state
+    stats.elapsed = time.time() - stats.started_at
+    metrics.inc('jobs', state=state)
+    metrics.observe('job', stats.elapsed)
+    write_metrics_file()
+
+
+def write_metrics_file(path=METRICS_FILE):
+    """يكتب المقاييس بصيغة Prometheus (ملف مؤقت ثم استبدال، حتى لا يُقرأ ملف ناقص)."""
+    if not path:
+        return
+    try:
+        with open(f"{path}.tmp", 'w', encoding='utf-8') as f:
+            f.write(metrics.render())
+        os.replace(f"{path}.tmp", path)
+    except OSError as e:
+        logger.error(f"تعذر كتابة ملف المقاييس: {e}")
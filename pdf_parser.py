@@ -1,76 +1,444 @@
 import pdfplumber
 import re
 import logging
+import math
+import multiprocessing
+import os
+import unicodedata
+from bisect import bisect
+from collections import Counter, OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from operator import itemgetter
+from typing import NamedTuple, Optional
+from pdfplumber.utils import cluster_objects
+from config import PDF_PAGES_PER_WORKER, PDF_PARSE_MAX_WORKERS, PDF_LAYOUT_PROBE_PAGES, PDF_LAYOUT_CACHE_SIZE
+from metrics import metrics
 
 logger = logging.getLogger(__name__)
 
-def parse_grades_pdf(pdf_path):
+class GradeRow(NamedTuple):
+    """صف علامات واحد مستخرج من الملف."""
+    student_id: str
+    student_name: Optional[str]
+    grade: float
+
+class TableLayout(NamedTuple):
+    """
+    تخطيط جدول العلامات كما تم اكتشافه من الصفحات الأولى: عدد الأعمدة، وحدود كل عمود
+    على المحور الأفقي (x0, x1)، وأرقام أعمدة الرقم الجامعي والعلامة والاسم.
+    bounds تكون None لتخطيط جدول من extract_tables (بدون مواقع الخلايا).
+    """
+    column_count: int
+    bounds: Optional[tuple]
+    id_col: int
+    grade_col: int
+    name_col: int
+
+# ذاكرة التخطيطات: بصمة شكل الملف -> TableLayout
+_layouts = OrderedDict()
+
+# عدد العمليات التي تحلل ملفات في نفس الوقت وتتقاسم الأنوية (انظر share_cpus)
+_cpu_sharers = 1
+
+# كلمات رأس الجدول لكل عمود (بعد _header_text)
+HEADER_KEYWORDS = {
+    'grade': ('المجموع', 'العلامة', 'الدرجة'),
+    'name': ('الاسم', 'اسم الطالب'),
+}
+# كلمات عمود العلامة النهائية عندما يحتوي الرأس عدة أعمدة علامات (العلامة العملية، ثم العلامة النهائية)
+GRADE_TOTAL_KEYWORDS = ('المجموع', 'النهائية', 'النهائي', 'الكلية', 'الكلي')
+
+def _find_student_id(row):
+    """يعيد رقم العمود والرقم الجامعي (أول رقم مكون من 5 خانات في الصف)، أو (None, None)."""
+    for index, cell in enumerate(row):
+        if cell:
+            match_id = re.search(r'(\d{5})', cell)
+            if match_id:
+                return index, match_id.group(1)
+    return None, None
+
+def _grade_value(cell):
+    """العلامة في الخلية (أول رقم فيها)، أو None."""
+    match = re.search(r'\d+(\.\d+)?', cell or '')
+    return float(match.group(0)) if match else None
+
+def _header_text(cell):
+    """
+    نص خلية رأس الجدول للمقارنة بـ HEADER_KEYWORDS: pdfplumber يعيد النص العربي بالترتيب المرئي
+    وبأشكال العرض (Presentation forms)، فيُعكس أولاً ثم يُوحد (NFKC) حتى تبقى "لا" بترتيبها الصحيح.
+    """
+    return unicodedata.normalize('NFKC', (cell or '')[::-1]).replace('\u0640', '')
+
+def _grade_header_rank(text):
+    """أولوية عنوان عمود علامة: 2 للمجموع/النهائية، 1 لعنوان مطابق تماماً ("العلامة")، 0 لغيرها."""
+    if any(word in text for word in GRADE_TOTAL_KEYWORDS):
+        return 2
+    return 1 if text in HEADER_KEYWORDS['grade'] else 0
+
+def _header_columns(rows, id_col):
+    """
+    يبحث عن رأس الجدول في الصفوف التي تسبق أول صف فيه رقم جامعي.
+    إذا طابقت عدة أعمدة كلمات العلامة يُختار الأعلى في _grade_header_rank، وعند التساوي
+    الأبعد عن عمود الرقم الجامعي (آخر عمود علامة بترتيب القراءة، أياً كان اتجاه الجدول).
+    يعيد قاموس (grade/name -> رقم العمود) لما وُجد منها.
+    """
+    headers = {}
+    for row in rows:
+        if _find_student_id(row)[0] is not None:
+            break
+        for index, cell in enumerate(row):
+            text = _header_text(cell).strip()
+            if text and index != id_col:
+                headers[index] = f"{headers[index]} {text}" if index in headers else text
+
+    found = {}
+    grades = [index for index, text in headers.items() if any(word in text for word in HEADER_KEYWORDS['grade'])]
+    if grades:
+        found['grade'] = max(grades, key=lambda index: (_grade_header_rank(headers[index]), abs(index - id_col)))
+    names = [index for index, text in sorted(headers.items())
+             if index not in found.values() and any(word in text for word in HEADER_KEYWORDS['name'])]
+    if names:
+        found['name'] = names[0]
+    return found
+
+def _content_columns(data_rows, id_col, exclude):
+    """
+    يكتشف عمودي الاسم والعلامة من محتوى صفوف الطلاب (بدون رأس الجدول):
+    - الاسم: العمود الذي فيه أكبر عدد من النصوص المختلفة التي تحتوي أحرفاً
+      (عمود الحالة مثل ناجح/راسب فيه قيمتان فقط).
+    - العلامة: من الأعمدة التي أغلب خلاياها أرقام بين 0 و 100 (وليست تسلسلاً 1، 2، 3...)
+      العمود ذو المتوسط الأعلى (المجموع أكبر من علامتي العملي والنظري).
+    يعيد قاموس (grade/name -> رقم العمود) لما وُجد منها.
+    """
+    found = {}
+    column_count = len(data_rows[0])
+    candidates = [index for index in range(column_count) if index != id_col and index not in exclude.values()]
+    if 'name' not in exclude:
+        names = {index: len({cell for cell in (row[index] for row in data_rows)
+                             if cell and any(char.isalpha() for char in cell)})
+                 for index in candidates}
+        best = max(names, key=names.get, default=None)
+        if best is not None and names[best] > len(data_rows) // 2:
+            found['name'] = best
+            candidates.remove(best)
+    if 'grade' not in exclude:
+        means = {}
+        for index in candidates:
+            values = [_grade_value(row[index]) for row in data_rows]
+            values = [value for value in values if value is not None and 0 <= value <= 100]
+            if len(values) < 0.9 * len(data_rows):
+                continue
+            if len(values) > 1 and all(b - a == 1 for a, b in zip(values, values[1:])):
+                continue
+            means[index] = sum(values) / len(values)
+        if means:
+            found['grade'] = max(means, key=means.get)
+    return found
+
+def _detect_layout(rows, bounds=None):
+    """
+    يكتشف أعمدة الرقم الجامعي والعلامة والاسم في جدول:
+    الرقم الجامعي هو العمود الذي وُجد فيه الرقم في أغلب الصفوف، والعلامة والاسم من رأس الجدول
+    (HEADER_KEYWORDS)، وإلا من محتوى صفوف الطلاب (_content_columns)، وإلا حسب الافتراض القديم
+    (الثالث من اليسار والثالث من اليمين). يعيد TableLayout أو None إذا لم يوجد رقم جامعي.
+    """
+    column_count = max((len(row) for row in rows), default=0)
+    if column_count < 5:
+        return None
+    rows = [row for row in rows if len(row) == column_count]
+    id_columns = Counter(_find_student_id(row)[0] for row in rows)
+    id_columns.pop(None, None)
+    if not id_columns:
+        return None
+    id_col = id_columns.most_common(1)[0][0]
+    columns = _header_columns(rows, id_col)
+    data_rows = [row for row in rows if _find_student_id([row[id_col]])[1]]
+    columns.update(_content_columns(data_rows, id_col, columns))
+    if len(columns) < 2:
+        logger.warning(f"لم يتم اكتشاف عمود {'العلامة' if 'grade' not in columns else 'الاسم'} في الجدول، "
+                       "سيتم استخدام الموقع الافتراضي.")
+    return TableLayout(column_count, bounds, id_col, columns.get('grade', 2), columns.get('name', column_count - 3))
+
+def _parse_table(table, grades_data, layout=None):
+    """
+    يستخرج صفوف العلامات (GradeRow) من جدول واحد ويضيفها إلى grades_data.
+    صفوف الرأس لا تحتوي على رقم جامعي فيتم تخطيها تلقائياً (لا نتخطى الصف الأول في كل صفحة،
+    لأن الصفحات التالية قد لا تكرر رأس الجدول).
+    layout: أعمدة الجدول (TableLayout)؛ الصفوف بعدد أعمدة مختلف، أو بدون layout، تُقرأ حسب
+    الافتراض القديم (أول رقم من 5 خانات، العلامة الثالثة من اليسار، والاسم الثالث من اليمين).
+    يعيد عدد الصفوف التي تحتوي على رقم جامعي ولكن بدون علامة صالحة.
+    """
+    skipped = 0
+    for row in table:
+        # التأكد من أن الصف يحتوي على عدد كافٍ من الأعمدة
+        if not row or len(row) < 5: # نفترض 5 أعمدة على الأقل
+            continue
+        row_layout = layout if layout is not None and len(row) == layout.column_count else None
+
+        # 1. استخراج الرقم الجامعي (5 أرقام)
+        if row_layout is None:
+            # نفترض أن الرقم الجامعي هو أول رقم مكون من 5 خانات في الصف
+            _, student_id = _find_student_id(row)
+        else:
+            _, student_id = _find_student_id([row[row_layout.id_col]])
+        
+        if not student_id:
+            continue
+
+        # 2. استخراج العلامة (بدون تخطيط: العمود الثالث من اليسار، أي row[2])
+        grade_str = row[2 if row_layout is None else row_layout.grade_col]
+        grade = None
+        if grade_str:
+            try:
+                # محاولة استخراج رقم صحيح أو عشري
+                grade = float(re.search(r'\d+(\.\d+)?', grade_str).group(0))
+            except:
+                skipped += 1
+                continue # تخطي إذا لم يتم العثور على علامة صالحة
+
+        # 3. استخراج الاسم (بدون تخطيط: العمود الثالث من اليمين، أي row[N-3])
+        name_index = len(row) - 3 if row_layout is None else row_layout.name_col
+        student_name = row[name_index]
+        
+        # تنظيف الاسم من المسافات الزائدة
+        if student_name:
+            student_name = student_name.strip()
+        
+        if student_id and grade is not None:
+            grades_data.append(GradeRow(student_id, student_name, grade))
+        else:
+            skipped += 1
+    return skipped
+
+def _layout_from_table(table, rows):
+    """
+    يكتشف التخطيط من جدول تم استخراجه بالطريقة العامة (find_tables): أعمدة الجدول من
+    _detect_layout وحدودها من أول صف مكتمل الخلايا (للمسار السريع).
+    """
+    layout = _detect_layout(rows)
+    if layout is None:
+        return None
+    bounds = next((tuple((cell[0], cell[2]) for cell in table_row.cells)
+                   for table_row in table.rows
+                   if len(table_row.cells) == layout.column_count and all(table_row.cells)), None)
+    if bounds is None:
+        return None
+    return layout._replace(bounds=bounds)
+
+def _same_columns(layout, other):
+    return other is not None and (layout.id_col, layout.grade_col, layout.name_col) == \
+        (other.id_col, other.grade_col, other.name_col)
+
+def _layout_fits(page, layout):
+    """
+    يتحقق من تخطيط محفوظ في الذاكرة على أول صفحة: الأعمدة المكتشفة من صفوف المسار السريع
+    (رأس الجدول أو المحتوى) يجب أن تطابقه. ملف بنفس البصمة لكن بترتيب أعمدة مختلف
+    يُكتشف هنا حتى لو أعطى المسار السريع صفوفاً.
+    """
+    return _same_columns(layout, _detect_layout(_page_rows(page, layout)))
+
+def _fingerprint(page):
+    """
+    بصمة شكل الملف: أبعاد الصفحة ومواقع الخطوط العمودية للجدول في الصفحة الأولى.
+    ملفات العلامات من نفس النموذج تعطي نفس البصمة فلا نعيد اكتشاف التخطيط.
+    """
+    columns = sorted({round(edge['x0']) for edge in page.vertical_edges})
+    return (round(page.width), round(page.height), tuple(columns))
+
+def _remember_layout(key, layout):
+    _layouts[key] = layout
+    _layouts.move_to_end(key)
+    while len(_layouts) > PDF_LAYOUT_CACHE_SIZE:
+        _layouts.popitem(last=False)
+
+def _cached_layout(key):
+    layout = _layouts.get(key)
+    if layout is not None:
+        _layouts.move_to_end(key)
+    metrics.inc('cache', cache='layout', result='miss' if layout is None else 'hit')
+    return layout
+
+def _page_rows(page, layout):
+    """
+    المسار السريع: يوزع كلمات الصفحة (extract_words) على الأعمدة حسب حدودها المعروفة
+    وعلى الصفوف حسب الخطوط الأفقية للجدول، بدلاً من extract_tables.
+    """
+    left, right = layout.bounds[0][0], layout.bounds[-1][1]
+    separators = [x1 for _, x1 in layout.bounds[:-1]]
+    words = [word for word in page.extract_words()
+             if left <= (word['x0'] + word['x1']) / 2 <= right]
+
+    # الصفوف: المسافات بين الخطوط الأفقية داخل الجدول، أو تجميع الكلمات حسب السطر
+    lines = sorted({round(edge['top'], 1) for edge in page.horizontal_edges
+                    if edge['x0'] < right and edge['x1'] > left})
+    if len(lines) >= 2:
+        bands = {}
+        for word in words:
+            middle = (word['top'] + word['bottom']) / 2
+            bands.setdefault(bisect(lines, middle), []).append(word)
+        groups = [bands[band] for band in sorted(bands)]
+    else:
+        groups = cluster_objects(words, itemgetter('top'), 3)
+
+    rows = []
+    for group in groups:
+        cells = [[] for _ in layout.bounds]
+        for word in group:
+            cells[bisect(separators, (word['x0'] + word['x1']) / 2)].append(word)
+        rows.append([" ".join(word['text'] for word in sorted(cell, key=itemgetter('top', 'x0')))
+                     for cell in cells])
+    return rows
+
+def _parse_page(page, layout=None):
+    """
+    يعيد صفوف العلامات في صفحة واحدة.
+    مع تخطيط معروف نستخدم المسار السريع، ونعود إلى extract_tables إذا لم يجد أي صف
+    (صفحة بشكل مختلف).
+    """
+    grades_data = []
+    skipped = 0
+    if layout is not None:
+        skipped = _parse_table(_page_rows(page, layout), grades_data, layout)
+    if grades_data:
+        metrics.inc('pages', path='fast')
+    else:
+        skipped = 0
+        # استخراج الجداول من الصفحة
+        for table in page.extract_tables():
+            skipped += _parse_table(table, grades_data, _detect_layout(table))
+        metrics.inc('pages', path='tables')
+    if skipped:
+        metrics.inc('rows_skipped', skipped)
+        logger.warning(f"تم تخطي {skipped} صف بدون علامة صالحة في الصفحة {page.page_number}.")
+    # تحرير الذاكرة المؤقتة للصفحة (مهم للملفات الكبيرة)
+    page.close()
+    return grades_data
+
+def _learn_page(page):
+    """يحلل صفحة بالطريقة العامة ويحاول اكتشاف التخطيط منها. يعيد (الصفوف، التخطيط أو None)."""
+    grades_data = []
+    layout = None
+    skipped = 0
+    for table in page.find_tables():
+        rows = table.extract()
+        table_layout = _layout_from_table(table, rows)
+        skipped += _parse_table(rows, grades_data, table_layout or _detect_layout(rows))
+        if layout is None:
+            layout = table_layout
+    metrics.inc('pages', path='learn')
+    if skipped:
+        metrics.inc('rows_skipped', skipped)
+        logger.warning(f"تم تخطي {skipped} صف بدون علامة صالحة في الصفحة {page.page_number}.")
+    page.close()
+    return grades_data, layout
+
+def count_pages(pdf_path):
+    """عدد صفحات الملف."""
+    with pdfplumber.open(pdf_path) as pdf:
+        return len(pdf.pages)
+
+def _available_cpus():
+    """عدد الأنوية المتاحة لهذه العملية."""
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+def share_cpus(processes):
+    """
+    تُستدعى في كل عملية عاملة (workers.py): processes عملية قد تحلل ملفات في نفس الوقت
+    (وضع الدفعات)، فكل ملف يقسم صفحاته على حصة عمليته من الأنوية فقط.
+    """
+    global _cpu_sharers
+    _cpu_sharers = max(1, processes)
+
+def _parse_cpus():
+    """حصة هذه العملية من الأنوية لتحليل نطاقات الصفحات."""
+    return max(1, _available_cpus() // _cpu_sharers)
+
+def plan_page_ranges(page_count, workers=None):
+    """
+    يقسم الصفحات إلى نطاقات متتالية (start, end) بعدد العمليات المناسب لحجم الملف:
+    عملية واحدة لكل PDF_PAGES_PER_WORKER صفحة على الأقل، وبحد أقصى workers
+    (افتراضياً PDF_PARSE_MAX_WORKERS)، ولا أكثر من حصة هذه العملية من الأنوية:
+    بنواة واحدة تكون العمليات الإضافية كلفة بلا فائدة.
+    """
+    if workers is None:
+        workers = PDF_PARSE_MAX_WORKERS
+    workers = max(1, min(workers, _parse_cpus(), math.ceil(page_count / PDF_PAGES_PER_WORKER)))
+    size = math.ceil(page_count / workers) if page_count else 0
+    return [(start, min(start + size, page_count)) for start in range(0, page_count, size or 1)]
+
+def parse_page_range(pdf_path, start, end, layout=None):
+    """
+    يحلل الصفحات [start, end) فقط. كل عملية عاملة تفتح الملف بنفسها،
+    لذلك يمكن تنفيذ عدة نطاقات على التوازي.
+    """
+    grades_data = []
+    with pdfplumber.open(pdf_path) as pdf:
+        for page in pdf.pages[start:end]:
+            grades_data.extend(_parse_page(page, layout))
+    return grades_data
+
+def _parse_page_range_job(pdf_path, start, end, layout):
+    """parse_page_range في عملية فرعية: يعيد الصفوف مع المقاييس المسجلة فيها."""
+    return parse_page_range(pdf_path, start, end, layout), metrics.drain()
+
+def iter_grade_rows(pdf_path, workers=None):
+    """
+    يحلل ملف العلامات ويعيد الصفوف (GradeRow) تدريجياً صفحة بصفحة،
+    حتى تبدأ المراحل التالية (تحديث الأسماء، المخطط) قبل انتهاء قراءة الملف.
+    يُكتشف تخطيط الجدول من الصفحات الأولى (أو يؤخذ من الذاكرة إذا سبق ورود نفس الشكل)،
+    ثم تُقرأ بقية الصفحات بالمسار السريع.
+    الملفات الكبيرة تُقسم صفحاتها على عدة عمليات وتُعاد الصفوف بنفس ترتيب الصفحات.
+    """
+    with pdfplumber.open(pdf_path) as pdf:
+        page_count = len(pdf.pages)
+        first = 0
+        layout = None
+        if page_count:
+            key = _fingerprint(pdf.pages[0])
+            layout = _cached_layout(key)
+            if layout is not None and not _layout_fits(pdf.pages[0], layout):
+                logger.warning("تخطيط جدول العلامات المحفوظ لا يطابق الملف، سيُعاد اكتشافه.")
+                metrics.inc('cache', cache='layout', result='stale')
+                _layouts.pop(key, None)
+                layout = None
+            # مرحلة الاكتشاف: الصفحات المستخدمة فيها تُحلل بالطريقة العامة ولا تُعاد قراءتها
+            while layout is None and first < min(page_count, PDF_LAYOUT_PROBE_PAGES):
+                rows, layout = _learn_page(pdf.pages[first])
+                first += 1
+                yield from rows
+            if layout is not None:
+                _remember_layout(key, layout)
+            else:
+                logger.warning("لم يتم اكتشاف تخطيط جدول العلامات، سيتم استخدام الطريقة العامة.")
+
+        ranges = [(start + first, end + first) for start, end in plan_page_ranges(page_count - first, workers)]
+        if len(ranges) <= 1:
+            for page in pdf.pages[first:]:
+                yield from _parse_page(page, layout)
+            return
+
+    logger.info(f"تحليل {ranges[-1][1] - first} صفحة على {len(ranges)} عمليات.")
+    # مجمع خاص بهذا الملف يُغلق بعد آخر نطاق: لا تبقى عمليات خاملة داخل العمليات العاملة
+    with ProcessPoolExecutor(max_workers=len(ranges), mp_context=multiprocessing.get_context('spawn')) as executor:
+        # map يعيد النتائج بنفس ترتيب النطاقات (أي ترتيب الصفحات) بمجرد جاهزية كل نطاق
+        for rows, range_metrics in executor.map(_parse_page_range_job, [pdf_path] * len(ranges), *zip(*ranges),
+                                                [layout] * len(ranges)):
+            metrics.merge(range_metrics)
+            yield from rows
+
+def parse_grades_pdf(pdf_path, workers=None):
     """
     يحلل ملف PDF للعلامات باستخدام خاصية extract_tables.
     يفترض أن الجدول يحتوي على:
     - الرقم الجامعي (5 أرقام)
     - الاسم: العمود الثالث من اليمين
     - العلامة: العمود الثالث من اليسار
+    واجهة القائمة القديمة فوق iter_grade_rows: تعيد قائمة قواميس (student_id, student_name, grade).
     """
-    grades_data = []
-    
     try:
-        with pdfplumber.open(pdf_path) as pdf:
-            for page in pdf.pages:
-                # استخراج الجداول من الصفحة
-                tables = page.extract_tables()
-                
-                for table in tables:
-                    # تخطي صفوف الرأس (Headers)
-                    data_rows = table[1:] 
-                    
-                    for row in data_rows:
-                        # التأكد من أن الصف يحتوي على عدد كافٍ من الأعمدة
-                        if not row or len(row) < 5: # نفترض 5 أعمدة على الأقل
-                            continue
-                            
-                        # 1. استخراج الرقم الجامعي (5 أرقام)
-                        # نفترض أن الرقم الجامعي هو أول رقم مكون من 5 خانات في الصف
-                        student_id = None
-                        for cell in row:
-                            if cell:
-                                match_id = re.search(r'(\d{5})', cell)
-                                if match_id:
-                                    student_id = match_id.group(1)
-                                    break
-                        
-                        if not student_id:
-                            continue
-
-                        # 2. استخراج العلامة (العمود الثالث من اليسار)
-                        # بما أن الصفوف تبدأ من اليسار، فإن العمود الثالث هو row[2]
-                        grade_str = row[2]
-                        grade = None
-                        if grade_str:
-                            try:
-                                # محاولة استخراج رقم صحيح أو عشري
-                                grade = float(re.search(r'\d+(\.\d+)?', grade_str).group(0))
-                            except:
-                                continue # تخطي إذا لم يتم العثور على علامة صالحة
-
-                        # 3. استخراج الاسم (العمود الثالث من اليمين)
-                        # إذا كان الصف يحتوي على N عمود، فإن العمود الثالث من اليمين هو row[N-3]
-                        name_index = len(row) - 3
-                        student_name = row[name_index]
-                        
-                        # تنظيف الاسم من المسافات الزائدة
-                        if student_name:
-                            student_name = student_name.strip()
-                        
-                        if student_id and grade is not None:
-                            grades_data.append({
-                                'student_id': student_id,
-                                'student_name': student_name,
-                                'grade': grade
-                            })
-                            
+        return [row._asdict() for row in iter_grade_rows(pdf_path, workers)]
     except Exception as e:
         logger.error(f"خطأ في تحليل ملف PDF: {e}")
         return []
-
-    return grades_data
@@ -0,0 +1,203 @@
+import io
+import logging
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+import numpy as np
+from fpdf import FPDF
+from arabic_text import fix_arabic, fix_arabic_many, REPORT_TITLE, NOT_AVAILABLE
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# خطوط تقرير المشرف: (النمط، ملف الخط). تذييل الصفحة يستخدم الخط العادي مباشرة
+# (النمط المائل I كان نفس ملف الخط العادي، ويُحلل ويُضمن في الملف مرة ثانية)
+REPORT_FONT_FAMILY = 'Noto'
+REPORT_FONTS = (
+    ('', 'fonts/NotoSansArabic-Regular.ttf'),
+    ('B', 'fonts/NotoSansArabic-Bold.ttf'),
+)
+
+class PDF(FPDF):
+    """فئة مخصصة لإنشاء تقارير PDF تدعم اللغة العربية."""
+    def header(self):
+        # تم تطبيق fix_arabic
+        self.set_font(REPORT_FONT_FAMILY, 'B', 15)
+        self.cell(0, 10, REPORT_TITLE, 0, 1, 'C')
+
+    def footer(self):
+        self.set_y(-15)
+        # تم تطبيق fix_arabic
+        self.set_font(REPORT_FONT_FAMILY, '', 8)
+        self.cell(0, 10, fix_arabic(f'صفحة {self.page_no()}/{{nb}}'), 0, 0, 'C')
+
+# عرض أعمدة جدول الترتيب (من اليسار لليمين)
+REPORT_COL_WIDTHS = [20, 30, 60, 20, 30]
+# رؤوس الجدول بالعربية بترتيب عكسي لتناسب العرض من اليمين لليسار (تُصحح مرة واحدة فقط)
+REPORT_HEADERS = [fix_arabic(header) for header in reversed(
+    ['النسبة المئوية', 'الدرجة', 'اسم الطالب', 'الرقم الجامعي', 'الترتيب']
+)]
+# تعريف ألوان التلوين
+RED_FILL = (255, 200, 200) # لون أحمر فاتح للخلفية
+NO_FILL = (255, 255, 255) # لون أبيض للخلفية
+
+def has_name(name):
+    """يتحقق من وجود اسم فعلي (ليس None أو NaN أو نصاً فارغاً)."""
+    if isinstance(name, float):
+        return not np.isnan(name)
+    return bool(name)
+
+def _format_report_columns(admin_report_data):
+    """
+    يجهز نصوص الجدول عموداً عموداً: تنسيق الأرقام دفعة واحدة (بدون تشكيل عربي)،
+    وتطبيق التشكيل على عمود الاسم فقط. يعيد الأعمدة بترتيب العرض (من اليسار لليمين).
+    admin_report_data: أعمدة التقرير حسب أسمائها العربية (قاموس مصفوفات أو DataFrame).
+    """
+    ranks = [str(rank) for rank in admin_report_data['الترتيب']]
+    student_ids = [str(student_id) for student_id in admin_report_data['الرقم الجامعي']]
+    # الاسم: fix_arabic ثم عكس النص لتعويض انعكاس fpdf2، ثم fix_arabic مرة أخرى
+    # (كما كانت تُعالج كل خلايا الجدول سابقاً)
+    shaped = fix_arabic_many(name if has_name(name) else None for name in admin_report_data['اسم الطالب'])
+    missing = fix_arabic(NOT_AVAILABLE)
+    names = [fix_arabic(name[::-1]) if name else missing for name in shaped]
+    grades = np.char.mod('%.2f', np.asarray(admin_report_data['الدرجة'], dtype=float)).tolist()
+    percentiles = np.char.mod('%.2f%%', np.asarray(admin_report_data['النسبة المئوية'], dtype=float)).tolist()
+    return ranks, student_ids, names, grades, percentiles
+
+def _emit_report_rows(pdf, columns):
+    """
+    يرسم صفوف الجدول: عمود الدرجة (الرابع من اليسار) بخلفية حمراء والباقي بيضاء.
+    يتم تغيير لون التعبئة مرتين فقط لكل صف بدلاً من مرة لكل خلية.
+    """
+    w_rank, w_id, w_name, w_grade, w_pct = REPORT_COL_WIDTHS
+    pdf.set_fill_color(*NO_FILL)
+    for rank, student_id, name, grade, percentile in zip(*columns):
+        pdf.cell(w_rank, 6, rank, border=1, align='C', fill=True)
+        pdf.cell(w_id, 6, student_id, border=1, align='C', fill=True)
+        pdf.cell(w_name, 6, name, border=1, align='C', fill=True)
+        pdf.set_fill_color(*RED_FILL)
+        pdf.cell(w_grade, 6, grade, border=1, align='C', fill=True)
+        pdf.set_fill_color(*NO_FILL)
+        pdf.cell(w_pct, 6, percentile, border=1, align='C', fill=True)
+        pdf.ln()
+
+@contextmanager
+def _phase(timings, name):
+    """يضيف زمن المرحلة (بالمللي ثانية) إلى timings[name]."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] += (time.perf_counter() - started) * 1000
+
+class ReportEngine:
+    """
+    ينشئ تقارير المشرف PDF. كل مستند يضيف خطوطه بـ add_font: fpdf2 يقتطع كائن الخط المحلل نفسه
+    عند الحفظ، فلا يمكن مشاركته بين مستندين (حتى deepcopy للمستند يشارك كائن الخط).
+    لذلك تقل كلفة الخطوط بعددها (ملفان بدلاً من ثلاثة) وبالدفعات: render_many(combined=True)
+    يضيف الخطوط مرة واحدة لكل المواد.
+    timings: زمن كل مرحلة بالمللي ثانية لآخر استدعاء (fonts، page، columns، rows، output).
+    """
+
+    def __init__(self, fonts=REPORT_FONTS, family=REPORT_FONT_FAMILY):
+        self.fonts = fonts
+        self.family = family
+        self.timings = {}
+
+    def preload(self):
+        """إنشاء مستند واحد عند بدء العملية العاملة: استيراد fontTools وقراءة ملفات الخطوط قبل أول تقرير."""
+        self._new_document()
+
+    def _new_document(self):
+        pdf = PDF('P', 'mm', 'A4')
+        for style, path in self.fonts:
+            pdf.add_font(self.family, style, path)
+        pdf.set_auto_page_break(auto=True, margin=15)
+        pdf.alias_nb_pages()
+        return pdf
+
+    def _add_course(self, pdf, admin_report_data, mean_grade, std_dev, course_name, timings):
+        """يضيف تقرير مادة واحدة (من صفحة جديدة) إلى المستند."""
+        with _phase(timings, 'page'):
+            pdf.add_page()
+            pdf.set_font(self.family, '', 12)
+
+            # الإحصائيات العامة
+            # تم تطبيق fix_arabic
+            pdf.cell(0, 10, fix_arabic(f'المادة: {course_name}'), 0, 1, 'R')
+            pdf.cell(0, 10, fix_arabic(f'متوسط الدرجات: {mean_grade:.2f}'), 0, 1, 'R')
+            pdf.cell(0, 10, fix_arabic(f'الانحراف المعياري: {std_dev:.2f}'), 0, 1, 'R')
+            pdf.ln(5)
+
+            # رسم رؤوس الجدول (مصححة مسبقاً في REPORT_HEADERS)
+            pdf.set_font(self.family, 'B', 10)
+            pdf.set_fill_color(200, 220, 255)
+            for width, header in zip(REPORT_COL_WIDTHS, REPORT_HEADERS):
+                pdf.cell(width, 7, header, border=1, align='C', fill=True)
+            pdf.ln()
+
+        # محتوى الجدول
+        with _phase(timings, 'columns'):
+            columns = _format_report_columns(admin_report_data)
+        with _phase(timings, 'rows'):
+            pdf.set_font(self.family, '', 10)
+            _emit_report_rows(pdf, columns)
+            # إعادة تعيين لون الخلفية
+            pdf.set_fill_color(*NO_FILL)
+
+    def _output(self, pdf, timings):
+        """حفظ المستند في مخزن مؤقت (تم تصحيح مشكلة bytearray)."""
+        with _phase(timings, 'output'):
+            pdf_output = pdf.output(dest='S')
+            if isinstance(pdf_output, str):
+                pdf_buffer = io.BytesIO(pdf_output.encode('latin1'))
+            else:
+                pdf_buffer = io.BytesIO(pdf_output)
+            pdf_buffer.seek(0)
+        return pdf_buffer
+
+    def render(self, admin_report_data, mean_grade, std_dev, course_name):
+        """تقرير مادة واحدة: يعيد مخزن BytesIO."""
+        return self.render_many([(admin_report_data, mean_grade, std_dev, course_name)])[0]
+
+    def render_many(self, reports, combined=False):
+        """
+        تقارير عدة مواد في استدعاء واحد. reports: عناصر (admin_report_data, mean_grade, std_dev, course_name).
+        combined=True: ملف PDF واحد تبدأ فيه كل مادة بصفحة جديدة (الخطوط تُضمن مرة واحدة)،
+        وإلا ملف لكل مادة. يعيد قائمة مخازن BytesIO.
+        """
+        timings = defaultdict(float)
+        buffers, course_names = [], []
+        pdf = None
+        for admin_report_data, mean_grade, std_dev, course_name in reports:
+            if pdf is None:
+                with _phase(timings, 'fonts'):
+                    pdf = self._new_document()
+            self._add_course(pdf, admin_report_data, mean_grade, std_dev, course_name, timings)
+            course_names.append(course_name)
+            if not combined:
+                buffers.append(self._output(pdf, timings))
+                pdf = None
+        if pdf is not None:
+            buffers.append(self._output(pdf, timings))
+
+        self.timings = dict(timings)
+        for phase, ms in self.timings.items():
+            metrics.observe('report_phase', ms / 1000, phase=phase)
+        if course_names:
+            phases = " | ".join(f"{phase} {ms:.0f}ms" for phase, ms in self.timings.items())
+            logger.info(f"تقرير المشرف ({'، '.join(course_names)}): {phases}")
+        return buffers
+
+# محرك التقارير المشترك في العملية
+report_engine = ReportEngine()
+
+def create_admin_report_pdf(admin_report_data, mean_grade, std_dev, course_name):
+    """
+    ينشئ تقرير PDF شامل للمشرف يحتوي على الإحصائيات وجدول الترتيب.
+    """
+    return report_engine.render(admin_report_data, mean_grade, std_dev, course_name)
+
+def create_admin_reports_pdf(reports, combined=False):
+    """تقارير عدة مواد دفعة واحدة (انظر ReportEngine.render_many)."""
+    return report_engine.render_many(reports, combined=combined)
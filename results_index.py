@@ -0,0 +1,61 @@
+import logging
+from database import get_all_grade_records, get_course_grades
+
+logger = logging.getLogger(__name__)
+
+# --- فهرس النتائج في الذاكرة ---
+# نتائج كل المواد المحفوظة في grade_records حسب الرقم الجامعي: الطالب الذي يسجل بعد معالجة
+# ملف مادته تصله نتيجته فوراً ببحث واحد في الذاكرة، بدون إعادة تحليل الملف أو الحسابات.
+# هذا الملف لا يستورد NumPy حتى يبقى التسجيل سريعاً بعد إعادة التشغيل.
+
+
+class ResultsIndex:
+    """
+    الرقم الجامعي -> {اسم المادة: (العلامة، النسبة المئوية، الترتيب، الاسم في ملف المادة)}.
+    يُحمّل من قاعدة البيانات عند أول استخدام (أو في التحميل المسبق)، ثم يُحدّث لكل مادة
+    بعد معالجة ملفها (update_course).
+    """
+
+    def __init__(self):
+        self._results = None
+        # اسم المادة -> الأرقام الجامعية فيها (لحذف النسخة السابقة عند إعادة معالجة المادة)
+        self._courses = {}
+
+    def load(self):
+        """يبني الفهرس من جدول grade_records (مرة واحدة)."""
+        if self._results is not None:
+            return
+        results, courses = {}, {}
+        for course_name, student_id, grade, percentile, rank, student_name in get_all_grade_records():
+            results.setdefault(student_id, {})[course_name] = (grade, percentile, rank, student_name)
+            courses.setdefault(course_name, []).append(student_id)
+        # تحميل في خيط التحميل المسبق: لا نستبدل فهرساً بُني في الأثناء
+        if self._results is None:
+            self._results, self._courses = results, courses
+            logger.info(f"تم تحميل فهرس النتائج: {len(results)} طالب في {len(courses)} مادة.")
+
+    def update_course(self, course_name):
+        """يستبدل نتائج مادة بعد حفظ علاماتها في قاعدة البيانات."""
+        if self._results is None:
+            # الفهرس يُحمّل كاملاً من قاعدة البيانات (بما فيها المادة الجديدة)
+            self.load()
+            return
+        for student_id in self._courses.pop(course_name, ()):
+            courses = self._results.get(student_id)
+            if courses is not None:
+                courses.pop(course_name, None)
+                if not courses:
+                    del self._results[student_id]
+        student_ids = []
+        for student_id, grade, percentile, rank, student_name in get_course_grades(course_name):
+            self._results.setdefault(student_id, {})[course_name] = (grade, percentile, rank, student_name)
+            student_ids.append(student_id)
+        self._courses[course_name] = student_ids
+
+    def lookup(self, student_id):
+        """نتائج الطالب في كل المواد المعالجة: قاموس (اسم المادة -> (العلامة، النسبة المئوية، الترتيب، الاسم))."""
+        self.load()
+        return self._results.get(student_id, {})
+
+
+results_index = ResultsIndex()
@@ -0,0 +1,139 @@
+import asyncio
+import importlib
+import logging
+import multiprocessing
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from config import WORKER_PROCESSES, BATCH_MAX_FILES
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# --- طبقة التنفيذ في عمليات منفصلة ---
+# تحليل PDF والحسابات والرسم عمليات ثقيلة على المعالج: تنفيذها داخل معالج تليجرام
+# يوقف حلقة الأحداث (Event loop) بالكامل، فلا يرد البوت على /start أو التسجيل.
+# المكتبات الثقيلة (pdfplumber، pandas، matplotlib، fpdf) تُستورد داخل العمليات العاملة فقط:
+# عملية البوت لا تستورد data_processor أو histogram_engine حتى يبدأ الرد بسرعة بعد إعادة التشغيل.
+
+_executor = None
+
+# ذاكرة المخططات داخل كل عملية عاملة: المفتاح -> CourseHistogram
+# (تتسع لكل مواد الدفعة: صور الألبومات تتناوب بين المواد)
+_HISTOGRAM_CACHE_SIZE = max(4, BATCH_MAX_FILES)
+_histograms = OrderedDict()
+
+def _warm_worker():
+    """يُنفذ مرة واحدة عند بدء كل عملية عاملة: تحميل matplotlib والخطوط مسبقاً."""
+    import pdf_parser
+    importlib.import_module('data_processor')
+    # تحليل الملفات الكبيرة على عدة عمليات يأخذ حصة هذه العملية من الأنوية فقط
+    pdf_parser.share_cpus(WORKER_PROCESSES)
+    from histogram_engine import CourseHistogram
+    from report_engine import report_engine
+    # استيرادات fpdf2 و fontTools وقراءة ملفات الخطوط قبل أول تقرير
+    report_engine.preload()
+    # رسم مخطط صغير يحمّل الخطوط في ذاكرة matplotlib
+    CourseHistogram([50.0]).render(50.0)
+
+def _ping():
+    return True
+
+def get_executor():
+    """يعيد مجمع العمليات المشترك (ويُنشئه عند أول استخدام)."""
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(
+            max_workers=WORKER_PROCESSES,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_warm_worker,
+        )
+    return _executor
+
+def start_workers():
+    """تشغيل كل العمليات العاملة مسبقاً (بدون انتظار) حتى يكون أول ملف سريعاً."""
+    executor = get_executor()
+    for _ in range(WORKER_PROCESSES):
+        executor.submit(_ping)
+    logger.info(f"تم تشغيل {WORKER_PROCESSES} عملية عاملة للمعالجة.")
+
+def shutdown_workers():
+    """إيقاف العمليات العاملة عند إيقاف البوت."""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+async def run_in_pool(func, *args, **kwargs):
+    """ينفذ func في عملية عاملة وينتظر النتيجة بدون إيقاف حلقة الأحداث."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_executor(), partial(func, *args, **kwargs))
+
+async def prewarm(delay):
+    """
+    تحميل مسبق اختياري في الخلفية بعد بدء البوت: تشغيل العمليات العاملة، ثم تحميل
+    course_results و grade_history (NumPy ومكتبات النصوص العربية) وفهرس النتائج
+    في خيط منفصل لعملية البوت.
+    """
+    await asyncio.sleep(delay)
+    start_workers()
+    for module in ('course_results', 'grade_history'):
+        await asyncio.to_thread(importlib.import_module, module)
+    from results_index import results_index
+    await asyncio.to_thread(results_index.load)
+    logger.info("تم التحميل المسبق للمكتبات في الخلفية.")
+
+def process_grades_file(pdf_path, course_name, registered_students=None, render_report=True):
+    """
+    يُنفذ داخل العملية العاملة: تحليل ملف PDF ومعالجة العلامات (process_grades_pdf).
+    الاستيراد هنا وليس في البوت حتى لا تُحمّل مكتبات التحليل والتقارير في عملية البوت.
+    يعيد (course_result, admin_pdf_buffer، أو بيانات التقرير إذا render_report=False،
+    المقاييس المسجلة في العملية العاملة).
+    """
+    from data_processor import process_grades_pdf
+    course_result, admin_report = process_grades_pdf(
+        pdf_path, course_name=course_name, registered_students=registered_students, render_report=render_report
+    )
+    return course_result, admin_report, metrics.drain()
+
+def render_admin_reports(reports):
+    """
+    يُنفذ داخل العملية العاملة: تقرير مشرف واحد لعدة مواد (ملف PDF تبدأ فيه كل مادة بصفحة جديدة).
+    reports: بيانات التقارير من process_grades_file(render_report=False). يعيد (المخزن، المقاييس).
+    """
+    from report_engine import create_admin_reports_pdf
+    with metrics.timer('stage', stage='report'):
+        admin_pdf_buffer = create_admin_reports_pdf(reports, combined=True)[0]
+    return admin_pdf_buffer, metrics.drain()
+
+async def render_histogram(course_key, bin_counts, student_grade):
+    """
+    يولد صورة طالب في عملية عاملة (render_histogram_png).
+    زمن الرسم يُقاس داخل العملية العاملة (stage=histogram)، وباقي زمن الانتظار (طابور العمليات
+    العاملة المشترك بين كل الإرسالات المتزامنة) يُسجل منفصلاً في pool_wait.
+    """
+    started = time.perf_counter()
+    png, worker_metrics = await run_in_pool(render_histogram_png, course_key, bin_counts, student_grade)
+    metrics.merge(worker_metrics)
+    render_seconds = sum(total for (name, _), (_, total, _) in worker_metrics['timers'].items() if name == 'stage')
+    metrics.observe('pool_wait', max(time.perf_counter() - started - render_seconds, 0.0), task='histogram')
+    return png
+
+def render_histogram_png(course_key, bin_counts, student_grade):
+    """
+    يُنفذ داخل العملية العاملة: يرسم صورة طالب واحد ويعيد (بايتات PNG، المقاييس).
+    المخطط الأساسي لكل مادة يُرسم مرة واحدة في كل عملية ويُحفظ حسب course_key.
+    """
+    from histogram_engine import CourseHistogram
+    with metrics.timer('stage', stage='histogram'):
+        histogram = _histograms.get(course_key)
+        if histogram is None:
+            histogram = CourseHistogram(None, counts=bin_counts)
+            _histograms[course_key] = histogram
+            if len(_histograms) > _HISTOGRAM_CACHE_SIZE:
+                _histograms.popitem(last=False)
+        else:
+            _histograms.move_to_end(course_key)
+        png = histogram.render(student_grade).getvalue()
+    return png, metrics.drain()